@@ -0,0 +1,167 @@
+"""
+Compare loading whole `Book` rows against the column-projected queries used
+by the sync, list and download routes, on a seeded SQLite database.
+
+Usage: uv run python -m benchmarks.book_queries [--users 10] [--books 5000] [--description-kb 4]
+"""
+
+import argparse
+from collections.abc import Callable
+from pathlib import Path
+import tempfile
+import timeit
+from uuid import UUID, uuid4
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session, load_only
+
+from kosync_backend.config import Settings
+from kosync_backend.database import (
+    Book,
+    ProcessingState,
+    SessionLocal,
+    get_engine,
+    initialise_db,
+)
+from kosync_backend.schemas import BOOK_MODEL_COLUMNS, BookModel
+
+
+def seed(db: Session, users: int, books: int, description_size: int) -> list[UUID]:
+    user_ids = [uuid4() for _ in range(users)]
+
+    for user_id in user_ids:
+        db.execute(
+            insert(Book),
+            [
+                {
+                    "id": uuid4(),
+                    "user_id": user_id,
+                    "title": f"Book {index}",
+                    "author": "KoSync",
+                    "description": "x" * description_size,
+                    "file_path": f"{uuid4()}.epub",
+                    "file_size": 1024 * 1024,
+                    "content_hash": "0" * 64,
+                    "processing_state": ProcessingState.READY,
+                }
+                for index in range(books)
+            ],
+        )
+
+    db.commit()
+
+    return user_ids
+
+
+def sync_full_rows(db: Session, user_id: UUID) -> list[UUID]:
+    """The query `synchronise` used before it selected only the ids."""
+    books = (
+        db.query(Book)
+        .filter(Book.user_id == user_id, Book.processing_state == ProcessingState.READY)
+        .all()
+    )
+
+    return [book.id for book in books]
+
+
+def sync_ids(db: Session, user_id: UUID) -> list[UUID]:
+    return list(
+        db.scalars(
+            select(Book.id).where(
+                Book.user_id == user_id,
+                Book.processing_state == ProcessingState.READY,
+            )
+        )
+    )
+
+
+def list_full_rows(db: Session, user_id: UUID) -> list[BookModel]:
+    books = db.query(Book).filter(Book.user_id == user_id).all()
+
+    return [BookModel.from_sqlalchemy_orm(book) for book in books]
+
+
+def list_model_columns(db: Session, user_id: UUID) -> list[BookModel]:
+    books = db.scalars(
+        select(Book)
+        .options(load_only(*BOOK_MODEL_COLUMNS))
+        .where(Book.user_id == user_id)
+    )
+
+    return [BookModel.from_sqlalchemy_orm(book) for book in books]
+
+
+def download_full_row(db: Session, user_id: UUID, book_id: UUID) -> str | None:
+    book = db.query(Book).filter(Book.id == book_id, Book.user_id == user_id).first()
+
+    return book.file_path if book else None
+
+
+def download_file_path(db: Session, user_id: UUID, book_id: UUID) -> str | None:
+    return db.scalar(
+        select(Book.file_path).where(Book.id == book_id, Book.user_id == user_id)
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--books", type=int, default=5000, help="books per user")
+    parser.add_argument("--description-kb", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        settings = Settings(
+            database_url=f"sqlite:///{Path(directory) / 'benchmark.db'}",
+            cover_dir=str(Path(directory) / "covers"),
+        )
+        engine = get_engine(settings)
+        initialise_db(engine, settings)
+
+        with SessionLocal(bind=engine) as db:
+            user_ids = seed(
+                db, arguments.users, arguments.books, arguments.description_kb * 1024
+            )
+            user_id = user_ids[0]
+            book_ids = list(
+                db.scalars(select(Book.id).where(Book.user_id == user_id).limit(1000))
+            )
+
+        print(
+            f"{arguments.users} users with {arguments.books} books each, "
+            f"{arguments.description_kb} KiB descriptions"
+        )
+
+        def run(function: Callable[[Session], object]) -> float:
+            def once() -> None:
+                # A fresh session per run, like a request, so nothing is
+                # served from the identity map
+                with SessionLocal(bind=engine) as db:
+                    function(db)
+
+            return min(timeit.repeat(once, number=1, repeat=arguments.repeat))
+
+        for name, function in [
+            ("sync, full rows", lambda db: sync_full_rows(db, user_id)),
+            ("sync, ids", lambda db: sync_ids(db, user_id)),
+            ("list, full rows", lambda db: list_full_rows(db, user_id)),
+            ("list, model columns", lambda db: list_model_columns(db, user_id)),
+            (
+                f"{len(book_ids)} downloads, full rows",
+                lambda db: [download_full_row(db, user_id, i) for i in book_ids],
+            ),
+            (
+                f"{len(book_ids)} downloads, file_path",
+                lambda db: [download_file_path(db, user_id, i) for i in book_ids],
+            ),
+        ]:
+            print(f"{name:>30}: {run(function) * 1000:8.1f} ms")
+
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
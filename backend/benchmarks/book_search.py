@@ -0,0 +1,136 @@
+"""
+Compare the FTS5 book search against matching every word with LIKE, on a
+seeded SQLite library.
+
+LIKE can't rank, so it stops at the first `--limit` matches: it is quick for
+common words but scans the whole library for rare ones. FTS5 reads only the
+matching rows, and ranks all of them.
+
+Usage: uv run python -m benchmarks.book_search [--books 100000] [--users 1]
+"""
+
+import argparse
+import itertools
+from pathlib import Path
+import random
+import tempfile
+import timeit
+from uuid import UUID, uuid4
+
+from sqlalchemy import insert
+
+from kosync_backend.config import Settings
+from kosync_backend.database import Book, SessionLocal, get_engine, initialise_db
+from kosync_backend.search import search_books, search_books_like, search_terms
+
+
+VOCABULARY_SIZE = 20_000
+
+
+class Vocabulary:
+    """Made-up words, drawn with Zipf-like frequencies as in real text."""
+
+    def __init__(self, size: int) -> None:
+        syllables = ["ka", "lo", "mi", "ne", "ra", "su", "ti", "vo", "ze", "ba", "do"]
+        self.words = list(
+            dict.fromkeys(
+                "".join(random.choices(syllables, k=random.randint(2, 5)))
+                for _ in range(size * 2)
+            )
+        )[:size]
+        self._cumulative_weights = list(
+            itertools.accumulate(1 / rank for rank in range(1, len(self.words) + 1))
+        )
+
+    def sentence(self, words: int) -> str:
+        return " ".join(
+            random.choices(self.words, cum_weights=self._cumulative_weights, k=words)
+        ).capitalize()
+
+
+def seed(engine, vocabulary: Vocabulary, users: int, books: int) -> list[UUID]:
+    user_ids = [uuid4() for _ in range(users)]
+
+    with SessionLocal(bind=engine) as db:
+        for user_id in user_ids:
+            for start in range(0, books, 10_000):
+                db.execute(
+                    insert(Book),
+                    [
+                        {
+                            "id": uuid4(),
+                            "user_id": user_id,
+                            "title": vocabulary.sentence(4),
+                            "author": vocabulary.sentence(2),
+                            "publisher": vocabulary.sentence(1),
+                            "description": f"<p>{vocabulary.sentence(60)}</p>",
+                            "file_path": "book.epub",
+                        }
+                        for _ in range(min(10_000, books - start))
+                    ],
+                )
+        db.commit()
+
+    return user_ids
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--books", type=int, default=100_000, help="books per user")
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    arguments = parser.parse_args()
+
+    random.seed(0)
+    vocabulary = Vocabulary(VOCABULARY_SIZE)
+    words = vocabulary.words
+    # Common, rarer and rare words, a prefix, two words and a miss
+    queries = [
+        words[0],
+        words[500],
+        words[-1],
+        words[2000][:4],
+        f"{words[10]} {words[100]}",
+        "qqq",
+    ]
+
+    with tempfile.TemporaryDirectory() as directory:
+        settings = Settings(
+            database_url=f"sqlite:///{Path(directory) / 'benchmark.db'}",
+            cover_dir=str(Path(directory) / "covers"),
+        )
+        engine = get_engine(settings)
+        initialise_db(engine, settings)
+        user_id = seed(engine, vocabulary, arguments.users, arguments.books)[0]
+
+        print(f"{arguments.users} users with {arguments.books} books each")
+
+        for query in queries:
+            for name, function in [
+                (
+                    "FTS5",
+                    lambda db: search_books(db, user_id, query, arguments.limit),
+                ),
+                (
+                    "LIKE",
+                    lambda db: search_books_like(
+                        db, user_id, search_terms(query), arguments.limit
+                    ),
+                ),
+            ]:
+
+                def once() -> int:
+                    with SessionLocal(bind=engine) as db:
+                        return len(function(db))
+
+                best = min(timeit.repeat(once, number=1, repeat=arguments.repeat))
+                print(f"{query!r:>26} {name}: {best * 1000:8.1f} ms, {once()} results")
+
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
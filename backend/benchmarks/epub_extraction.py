@@ -0,0 +1,121 @@
+"""
+Compare single-pass EPUB extraction against the previous approach of calling
+`ebooklib.epub.read_epub` once for the metadata and once for the cover.
+
+Usage: uv run python -m benchmarks.epub_extraction [--images 200] [--image-kb 512]
+"""
+
+import argparse
+import os
+from pathlib import Path
+import tempfile
+import timeit
+import zipfile
+
+import ebooklib
+from ebooklib import epub
+
+from kosync_backend.epub import extract_epub
+
+
+def read_epub_twice(file_path: Path) -> tuple[str, bytes | None]:
+    """The extraction path `upload_book` used before `extract_epub` existed."""
+    book = epub.read_epub(file_path)
+    title = book.get_metadata("DC", "title")[0][0]
+
+    book = epub.read_epub(file_path)
+    if (cover := book.get_item_with_id("cover")) is not None:
+        return title, cover.get_content()
+
+    for item in book.get_items():
+        if item.get_type() == ebooklib.ITEM_IMAGE:
+            return title, item.get_content()
+
+    return title, None
+
+
+def build_image_heavy_epub(path: Path, images: int, image_size: int) -> None:
+    manifest = []
+    spine = []
+
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("mimetype", "application/epub+zip")
+        archive.writestr(
+            "META-INF/container.xml",
+            '<?xml version="1.0"?>'
+            '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+            '<rootfiles><rootfile full-path="OEBPS/content.opf"'
+            ' media-type="application/oebps-package+xml"/></rootfiles></container>',
+        )
+
+        for index in range(images):
+            # Random bytes don't compress, like real JPEGs
+            archive.writestr(f"OEBPS/images/{index}.jpg", os.urandom(image_size))
+            manifest.append(
+                f'<item id="image-{index}" href="images/{index}.jpg" media-type="image/jpeg"'
+                + (' properties="cover-image"' if index == 0 else "")
+                + "/>"
+            )
+
+            chapter = (
+                '<html xmlns="http://www.w3.org/1999/xhtml"><head><title>c</title></head><body>'
+                + f'<img src="images/{index}.jpg"/>'
+                + "<p>Lorem ipsum dolor sit amet.</p>" * 500
+                + "</body></html>"
+            )
+            archive.writestr(
+                f"OEBPS/chapter-{index}.xhtml",
+                chapter,
+                compress_type=zipfile.ZIP_DEFLATED,
+            )
+            manifest.append(
+                f'<item id="chapter-{index}" href="chapter-{index}.xhtml"'
+                ' media-type="application/xhtml+xml"/>'
+            )
+            spine.append(f'<itemref idref="chapter-{index}"/>')
+
+        archive.writestr(
+            "OEBPS/content.opf",
+            '<?xml version="1.0" encoding="utf-8"?>'
+            '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="id">'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+            '<dc:identifier id="id">urn:uuid:00000000-0000-0000-0000-000000000000</dc:identifier>'
+            "<dc:title>Benchmark</dc:title><dc:creator>KoSync</dc:creator>"
+            '<dc:language>en</dc:language><meta name="cover" content="image-0"/>'
+            "</metadata>"
+            f"<manifest>{''.join(manifest)}</manifest>"
+            f"<spine>{''.join(spine)}</spine>"
+            "</package>",
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--image-kb", type=int, default=512)
+    parser.add_argument("--repeat", type=int, default=5)
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "benchmark.epub"
+        build_image_heavy_epub(path, arguments.images, arguments.image_kb * 1024)
+
+        print(
+            f"EPUB with {arguments.images} images of {arguments.image_kb} KiB "
+            f"({path.stat().st_size / 1024 / 1024:.1f} MiB)"
+        )
+
+        for name, function in [
+            ("read_epub twice", read_epub_twice),
+            ("extract_epub", extract_epub),
+        ]:
+            best = min(
+                timeit.repeat(lambda: function(path), number=1, repeat=arguments.repeat)
+            )
+            print(f"{name:>16}: {best * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
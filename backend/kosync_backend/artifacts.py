@@ -0,0 +1,195 @@
+"""
+Checksum-verified cache of the release archives bundled into generated clients.
+
+Startup only reads from the cache, so it never waits on (or fails because
+of) the network. Fill the cache beforehand, e.g. while building the image:
+
+    python -m kosync_backend.artifacts prefetch
+"""
+
+import argparse
+from collections.abc import Iterator
+import contextlib
+import fcntl
+import hashlib
+import os
+from pathlib import Path
+import shutil
+import tarfile
+from tempfile import NamedTemporaryFile, mkdtemp
+from urllib.request import urlopen
+
+from pydantic import BaseModel
+
+from kosync_backend.config import get_settings
+
+
+class Artifact(BaseModel):
+    name: str
+    url: str
+    sha256: str
+
+
+NICKELMENU = Artifact(
+    name="nickelmenu",
+    url="https://github.com/pgaskin/NickelMenu/releases/download/v0.5.4/KoboRoot.tgz",
+    sha256="450c73c9b096b5ad66f9bff7f0ba9b222ed2a888041649957509cb57123108d0",
+)
+NICKELDBUS = Artifact(
+    name="nickeldbus",
+    url="https://github.com/shermp/NickelDBus/releases/download/0.2.0/KoboRoot.tgz",
+    sha256="9fdb3d16d0f43c1ea6f2f1264b10fcde1d72a674e55f12955de812d476eb5dc5",
+)
+
+# Extracted in this order, so later archives win on conflicting paths
+NICKEL_ADDONS = (NICKELMENU, NICKELDBUS)
+
+_CHUNK_SIZE = 64 * 1024
+
+
+class ArtifactError(Exception):
+    """An artifact is missing from the cache or doesn't match its checksum."""
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+
+    with open(path, "rb") as file:
+        while chunk := file.read(_CHUNK_SIZE):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class ArtifactCache:
+    """
+    Release archives stored under their pinned SHA-256, plus the trees
+    extracted from them.
+
+    Extraction happens once per set of archives. Processes starting at the
+    same time serialise on a lock file, so all of them end up using the
+    tree the first one extracted.
+    """
+
+    directory: Path
+
+    def __init__(self, directory: Path | str) -> None:
+        self.directory = Path(directory)
+
+    def path(self, artifact: Artifact) -> Path:
+        return self.directory / f"{artifact.name}-{artifact.sha256}.tgz"
+
+    def get(self, artifact: Artifact) -> Path:
+        """Return the cached archive, verifying its checksum."""
+        path = self.path(artifact)
+
+        if not path.exists():
+            raise ArtifactError(
+                f"{artifact.name} is not in the artifact cache at {self.directory}, "
+                "run `python -m kosync_backend.artifacts prefetch`"
+            )
+
+        if (actual := _sha256(path)) != artifact.sha256:
+            raise ArtifactError(
+                f"{path} has SHA-256 {actual}, expected {artifact.sha256}"
+            )
+
+        return path
+
+    def prefetch(self, artifact: Artifact) -> Path:
+        """Download the artifact unless a verified copy is already cached."""
+        path = self.path(artifact)
+
+        with contextlib.suppress(ArtifactError):
+            return self.get(artifact)
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        with NamedTemporaryFile(
+            dir=self.directory, prefix=".download-", delete=False
+        ) as download:
+            try:
+                with urlopen(artifact.url) as response:
+                    shutil.copyfileobj(response, download, _CHUNK_SIZE)
+            except BaseException:
+                Path(download.name).unlink(missing_ok=True)
+                raise
+
+        download_path = Path(download.name)
+
+        if (actual := _sha256(download_path)) != artifact.sha256:
+            download_path.unlink()
+            raise ArtifactError(
+                f"{artifact.url} has SHA-256 {actual}, expected {artifact.sha256}"
+            )
+
+        os.replace(download_path, path)
+
+        return path
+
+    @contextlib.contextmanager
+    def _lock(self) -> Iterator[None]:
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        with open(self.directory / ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def extracted(self, artifacts: tuple[Artifact, ...]) -> Path:
+        """
+        Return a tree with the archives extracted into it, extracting them
+        if no other process has yet. Treat the tree as read-only.
+        """
+        key = hashlib.sha256(
+            "".join(artifact.sha256 for artifact in artifacts).encode()
+        ).hexdigest()
+        tree = self.directory / "extracted" / key
+
+        with self._lock():
+            if tree.exists():
+                return tree
+
+            tree.parent.mkdir(parents=True, exist_ok=True)
+            staging = Path(mkdtemp(dir=tree.parent, prefix=".extract-"))
+
+            try:
+                for artifact in artifacts:
+                    with tarfile.open(self.get(artifact), "r:gz") as archive:
+                        archive.extractall(path=staging, filter="tar")
+            except BaseException:
+                shutil.rmtree(staging, ignore_errors=True)
+                raise
+
+            os.rename(staging, tree)
+
+        return tree
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("command", choices=["prefetch", "verify"])
+    parser.add_argument(
+        "--directory",
+        default=get_settings().artifact_dir,
+        help="the artifact cache directory (defaults to ARTIFACT_DIR)",
+    )
+    arguments = parser.parse_args()
+
+    cache = ArtifactCache(arguments.directory)
+
+    for artifact in NICKEL_ADDONS:
+        if arguments.command == "prefetch":
+            path = cache.prefetch(artifact)
+        else:
+            path = cache.get(artifact)
+
+        print(f"{artifact.name}: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+from collections import OrderedDict
+from datetime import UTC, datetime
+import hashlib
+import threading
+import time
+from typing import Any, Self
+
+from fastapi import Request
+import jwt
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+from supabase_auth import User as SupabaseUser
+from supabase_auth.errors import AuthApiError
+
+from kosync_backend.auth_client import AuthClient
+from kosync_backend.config import Settings
+
+
+ASYMMETRIC_ALGORITHMS = ("RS256", "ES256")
+
+
+class InvalidToken(Exception):
+    """The token is definitely not valid, e.g. expired or wrongly signed."""
+
+
+class _Undecided(Exception):
+    """The token can't be verified locally and has to be checked by Supabase."""
+
+
+class TokenVerifierMetrics(BaseModel):
+    cache_hits: int = 0
+    cache_misses: int = 0
+    verified_locally: int = 0
+    rejected_locally: int = 0
+    remote_calls: int = 0
+    remote_failures: int = 0
+    remote_seconds_total: float = 0.0
+    remote_seconds_max: float = 0.0
+
+    def observe_remote_call(self, duration: float) -> None:
+        self.remote_calls += 1
+        self.remote_seconds_total += duration
+        self.remote_seconds_max = max(self.remote_seconds_max, duration)
+
+
+class _CachedUser(BaseModel):
+    user: SupabaseUser
+    expires_at: float
+
+
+def _user_from_claims(claims: dict[str, Any]) -> SupabaseUser:
+    audience = claims.get("aud", "")
+
+    return SupabaseUser(
+        id=claims["sub"],
+        aud=audience[0] if isinstance(audience, list) else audience,
+        email=claims.get("email") or None,
+        phone=claims.get("phone") or None,
+        role=claims.get("role"),
+        app_metadata=claims.get("app_metadata", {}),
+        user_metadata=claims.get("user_metadata", {}),
+        is_anonymous=claims.get("is_anonymous", False),
+        # The token doesn't carry the account's creation time
+        created_at=datetime.fromtimestamp(claims.get("iat", 0), UTC),
+    )
+
+
+class TokenVerifier:
+    """
+    Verifies Supabase access tokens without a round trip to Supabase.
+
+    HS256 tokens are checked against `supabase_jwt_secret`, asymmetrically
+    signed ones against the project's JWKS. Only when neither is possible
+    (no secret configured, unknown key, JWKS unreachable) is the token sent
+    to `auth.get_user`. Accepted tokens are cached by their SHA-256 until
+    they expire, in an LRU bounded to `jwt_cache_size` entries.
+    """
+
+    metrics: TokenVerifierMetrics
+    _settings: Settings
+    _jwks_client: jwt.PyJWKClient | None
+
+    def __init__(self, settings: Settings) -> None:
+        self._settings = settings
+        self._cache: OrderedDict[str, _CachedUser] = OrderedDict()
+        self._lock = threading.Lock()
+        self.metrics = TokenVerifierMetrics()
+
+        jwks_url = settings.supabase_jwks_url or (
+            f"{settings.supabase_url.rstrip('/')}/auth/v1/.well-known/jwks.json"
+            if settings.supabase_url
+            else None
+        )
+        self._jwks_client = (
+            jwt.PyJWKClient(jwks_url, cache_keys=True, timeout=5) if jwks_url else None
+        )
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def _get_cached(self, key: str) -> SupabaseUser | None:
+        with self._lock:
+            if (cached := self._cache.get(key)) is None:
+                self.metrics.cache_misses += 1
+                return None
+
+            if cached.expires_at <= time.time():
+                del self._cache[key]
+                self.metrics.cache_misses += 1
+                return None
+
+            self._cache.move_to_end(key)
+            self.metrics.cache_hits += 1
+
+            return cached.user
+
+    def _put_cached(self, key: str, user: SupabaseUser, expires_at: float) -> None:
+        with self._lock:
+            self._cache[key] = _CachedUser(user=user, expires_at=expires_at)
+            self._cache.move_to_end(key)
+
+            while len(self._cache) > self._settings.jwt_cache_size:
+                self._cache.popitem(last=False)
+
+    def _verify_locally(self, token: str) -> dict[str, Any]:
+        try:
+            algorithm = jwt.get_unverified_header(token).get("alg", "")
+        except jwt.InvalidTokenError as e:
+            raise InvalidToken(str(e)) from e
+
+        if algorithm == "HS256" and self._settings.supabase_jwt_secret:
+            key: Any = self._settings.supabase_jwt_secret
+        elif algorithm in ASYMMETRIC_ALGORITHMS and self._jwks_client is not None:
+            try:
+                key = self._jwks_client.get_signing_key_from_jwt(token).key
+            except jwt.PyJWKClientError as e:
+                raise _Undecided() from e
+        else:
+            raise _Undecided()
+
+        try:
+            return jwt.decode(
+                token,
+                key,
+                algorithms=[algorithm],
+                audience=self._settings.supabase_jwt_audience,
+                options={"require": ["exp", "sub"]},
+            )
+        except jwt.InvalidTokenError as e:
+            raise InvalidToken(str(e)) from e
+
+    async def _verify_remotely(
+        self, token: str, auth_client: AuthClient
+    ) -> SupabaseUser:
+        started_at = time.perf_counter()
+
+        try:
+            user = await auth_client.get_user(token)
+        except AuthApiError as e:
+            self.metrics.remote_failures += 1
+            raise InvalidToken(str(e)) from e
+        except Exception:
+            self.metrics.remote_failures += 1
+            raise
+        finally:
+            self.metrics.observe_remote_call(time.perf_counter() - started_at)
+
+        if user is None:
+            raise InvalidToken("Supabase did not return a user")
+
+        return user
+
+    async def verify(self, token: str, auth_client: AuthClient) -> SupabaseUser:
+        """Return the user the token belongs to, or raise `InvalidToken`."""
+        key = hashlib.sha256(token.encode()).hexdigest()
+
+        if (user := self._get_cached(key)) is not None:
+            return user
+
+        try:
+            # Fetching the JWKS blocks, so this runs off the event loop
+            claims = await run_in_threadpool(self._verify_locally, token)
+        except InvalidToken:
+            self.metrics.rejected_locally += 1
+            raise
+        except _Undecided:
+            user = await self._verify_remotely(token, auth_client)
+            # Supabase vouched for the token, so its claims can be trusted
+            claims = jwt.decode(token, options={"verify_signature": False})
+        else:
+            self.metrics.verified_locally += 1
+            user = _user_from_claims(claims)
+
+        if (expires_at := claims.get("exp")) is not None:
+            self._put_cached(key, user, float(expires_at))
+
+        return user
+
+
+def get_token_verifier(request: Request) -> TokenVerifier:
+    if hasattr(request.app.state, "token_verifier"):
+        return request.app.state.token_verifier
+
+    raise ValueError(
+        "token_verifier was not found on the app, did the lifecycle event fire?"
+    )
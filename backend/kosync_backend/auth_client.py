@@ -0,0 +1,136 @@
+from collections.abc import Awaitable, Callable
+import time
+from typing import Self
+
+from fastapi import Request
+import httpx
+from supabase import AsyncClient, AsyncClientOptions, create_async_client
+from supabase_auth import User as SupabaseUser
+from supabase_auth.errors import AuthApiError, AuthRetryableError
+
+from kosync_backend.config import Settings
+from kosync_backend.metrics import AUTH_PROVIDER_CALL_DURATION
+from kosync_backend.resilience import CircuitBreaker, CircuitOpen, retry
+
+
+class AuthProviderUnavailable(Exception):
+    """Supabase is not configured."""
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Whether the auth server failed, as opposed to answering with an error."""
+    if isinstance(error, (httpx.TransportError, AuthRetryableError)):
+        return True
+
+    return isinstance(error, AuthApiError) and error.status >= 500
+
+
+class AuthClient:
+    """
+    The Supabase client shared by all requests.
+
+    It is created once in the lifespan, so connections to the auth server
+    are kept alive and reused. Calls are bounded by `supabase_timeout_s` and
+    `supabase_max_connections`, transient failures are retried with
+    backoff, and a circuit breaker fails calls fast with `CircuitOpen` while
+    the auth server keeps failing.
+    """
+
+    circuit_breaker: CircuitBreaker
+    _settings: Settings
+    _http_client: httpx.AsyncClient
+    _client: AsyncClient | None
+
+    def __init__(
+        self,
+        settings: Settings,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ) -> None:
+        self._settings = settings
+        self._client = None
+        self._http_client = httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(settings.supabase_timeout_s),
+            limits=httpx.Limits(
+                max_connections=settings.supabase_max_connections,
+                max_keepalive_connections=settings.supabase_max_keepalive_connections,
+            ),
+        )
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=settings.supabase_circuit_failure_threshold,
+            reset_timeout_s=settings.supabase_circuit_reset_s,
+        )
+
+    async def __aenter__(self) -> Self:
+        if self._settings.supabase_url and self._settings.supabase_key:
+            self._client = await create_async_client(
+                self._settings.supabase_url,
+                self._settings.supabase_key,
+                options=AsyncClientOptions(
+                    httpx_client=self._http_client,
+                    auto_refresh_token=False,
+                    persist_session=False,
+                ),
+            )
+
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_traceback) -> None:
+        await self._http_client.aclose()
+
+    @property
+    def client(self) -> AsyncClient:
+        if self._client is None:
+            raise AuthProviderUnavailable("SUPABASE_URL and SUPABASE_KEY must be set")
+
+        return self._client
+
+    async def _call[T](self, name: str, operation: Callable[[], Awaitable[T]]) -> T:
+        started_at = time.perf_counter()
+        outcome = "success"
+
+        try:
+            return await self.circuit_breaker.call(
+                lambda: retry(
+                    operation,
+                    max_retries=self._settings.supabase_max_retries,
+                    backoff_s=self._settings.supabase_retry_backoff_s,
+                    should_retry=is_transient_error,
+                ),
+                is_failure=is_transient_error,
+            )
+        except CircuitOpen:
+            outcome = "circuit_open"
+            raise
+        except Exception as e:
+            # An error answer, e.g. for an invalid token, is not a failure
+            outcome = "failure" if is_transient_error(e) else "error"
+            raise
+        finally:
+            AUTH_PROVIDER_CALL_DURATION.labels(name, outcome).observe(
+                time.perf_counter() - started_at
+            )
+
+    async def get_user(self, token: str) -> SupabaseUser | None:
+        """Return the user the access token belongs to."""
+        client = self.client
+        response = await self._call("get_user", lambda: client.auth.get_user(token))
+
+        return response.user if response else None
+
+    async def get_user_by_id(self, user_id: str) -> SupabaseUser:
+        client = self.client
+        response = await self._call(
+            "get_user_by_id", lambda: client.auth.admin.get_user_by_id(user_id)
+        )
+
+        return response.user
+
+
+def get_auth_client(request: Request) -> AuthClient:
+    if hasattr(request.app.state, "auth_client"):
+        return request.app.state.auth_client
+
+    raise ValueError(
+        "auth_client was not found on the app, did the lifecycle event fire?"
+    )
@@ -0,0 +1,152 @@
+"""
+Deduplicated storage for uploaded EPUBs.
+
+Files are stored once per SHA-256 of their contents, as `{hash}.epub` in
+the `Storage` backend, and a `BookBlob` row counts the books referencing
+each one. References are taken and released in the transaction inserting,
+deleting or failing the book. Once the last one is released, the file is
+removed by the `StorageCollector`.
+
+Books uploaded before deduplication keep their own `{book_id}.epub` file and
+have no blob.
+"""
+
+from sqlalchemy import case, delete, func, select, update
+from sqlalchemy.orm import Session
+
+from kosync_backend.database import Book, BookBlob, ProcessingState
+from kosync_backend.delivery import EPUB_MEDIA_TYPE
+from kosync_backend.storage import Storage
+from kosync_backend.uploads import StagedUpload
+
+
+def blob_file_path(content_hash: str) -> str:
+    return f"{content_hash}.epub"
+
+
+def _is_blob_file(content_hash: str | None, file_path: str) -> bool:
+    return content_hash is not None and file_path == blob_file_path(content_hash)
+
+
+class BlobStore:
+    storage: Storage
+
+    def __init__(self, storage: Storage) -> None:
+        self.storage = storage
+
+    def put(self, upload: StagedUpload) -> str:
+        """
+        Move a staged upload to its blob file. If the file is already stored,
+        it is replaced with the same bytes.
+        """
+        file_path = blob_file_path(upload.sha256)
+        self.storage.put(file_path, upload.path, EPUB_MEDIA_TYPE)
+
+        return file_path
+
+
+def cached_extraction(db: Session, content_hash: str) -> dict | None:
+    return db.scalar(
+        select(BookBlob.extraction).where(BookBlob.content_hash == content_hash)
+    )
+
+
+def record_extraction(db: Session, content_hash: str, extraction: dict) -> None:
+    db.execute(
+        update(BookBlob)
+        .where(BookBlob.content_hash == content_hash)
+        .values(extraction=extraction)
+    )
+
+
+def acquire_blob(
+    db: Session, content_hash: str, size: int, extraction: dict | None = None
+) -> str:
+    """Reference the blob with these contents from a new book, creating it if needed."""
+    values: dict = {"ref_count": BookBlob.ref_count + 1}
+    if extraction is not None:
+        values["extraction"] = extraction
+
+    result = db.execute(
+        update(BookBlob).where(BookBlob.content_hash == content_hash).values(**values)
+    )
+
+    if result.rowcount == 0:
+        db.add(
+            BookBlob(
+                content_hash=content_hash,
+                size=size,
+                ref_count=1,
+                extraction=extraction,
+            )
+        )
+        # Later books of the same batch have to see it
+        db.flush()
+
+    return blob_file_path(content_hash)
+
+
+def release_files(db: Session, files: list[tuple[str | None, str]]) -> list[str]:
+    """
+    Release the files of books that were just deleted or failed, given as
+    `(content_hash, file_path)`. Returns the paths nothing references anymore,
+    which should be removed once the transaction is committed.
+
+    The references are counted again rather than decremented, so releasing
+    the same book twice can't remove a file other books still use.
+    """
+    # Books without a blob own their file
+    released = [
+        file_path
+        for content_hash, file_path in files
+        if not _is_blob_file(content_hash, file_path)
+    ]
+    blob_file_paths = {
+        file_path: content_hash
+        for content_hash, file_path in files
+        if _is_blob_file(content_hash, file_path)
+    }
+
+    if not blob_file_paths:
+        return released
+
+    db.flush()
+    references = dict(
+        db.execute(
+            select(Book.content_hash, func.count())
+            .where(
+                Book.content_hash.in_(blob_file_paths.values()),
+                Book.file_path.in_(blob_file_paths.keys()),
+                Book.processing_state != ProcessingState.FAILED,
+            )
+            .group_by(Book.content_hash)
+        )
+        .tuples()
+        .all()
+    )
+
+    if references:
+        db.execute(
+            update(BookBlob)
+            .where(BookBlob.content_hash.in_(references.keys()))
+            .values(ref_count=case(references, value=BookBlob.content_hash))
+        )
+
+    unreferenced = {
+        file_path: content_hash
+        for file_path, content_hash in blob_file_paths.items()
+        if content_hash not in references
+    }
+    if unreferenced:
+        db.execute(
+            delete(BookBlob).where(BookBlob.content_hash.in_(unreferenced.values()))
+        )
+
+    return released + list(unreferenced)
+
+
+def release_blob(db: Session, book: Book) -> str | None:
+    """`release_files` for a single book."""
+    released = release_files(db, [(book.content_hash, book.file_path)])
+
+    return released[0] if released else None
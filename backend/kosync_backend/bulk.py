@@ -0,0 +1,138 @@
+"""
+Deleting and updating many of a user's books at once.
+
+Each operation is a single set-based `DELETE`/`UPDATE ... WHERE user_id = ?
+AND id IN (...)` (or the filter), committed in one transaction with its
+change log entries and blob releases. Every selected id gets a result.
+"""
+
+from typing import Self
+from uuid import UUID
+
+from pydantic import BaseModel, Field, model_validator
+from sqlalchemy import Delete, Update, delete, update
+from sqlalchemy.orm import Session
+
+from kosync_backend.blobs import release_files
+from kosync_backend.changes import record_book_changes
+from kosync_backend.database import Book, BookChangeKind, ProcessingState
+from kosync_backend.pagination import BookFilters
+
+
+MAX_BULK_BOOK_IDS = 500
+
+
+class BookSelection(BaseModel):
+    """The books with the given ids, or every book matching `filter`."""
+
+    ids: list[UUID] | None = Field(
+        default=None, min_length=1, max_length=MAX_BULK_BOOK_IDS
+    )
+    filter: BookFilters | None = None
+
+    @model_validator(mode="after")
+    def _select_by_ids_or_filter(self) -> Self:
+        if (self.ids is None) == (self.filter is None):
+            raise ValueError("Select books by either ids or filter")
+
+        # An empty filter would select the whole library
+        if self.filter is not None and not any(self.filter.model_dump().values()):
+            raise ValueError("The filter has to set at least one field")
+
+        return self
+
+    def apply[S: (Update, Delete)](self, statement: S) -> S:
+        if self.filter is not None:
+            # ty can't match S's constraints with those of `BookFilters.apply`
+            return self.filter.apply(statement)  # type: ignore
+
+        return statement.where(Book.id.in_(self.ids or []))
+
+
+class BulkBookChanges(BaseModel):
+    """Fields left out are kept."""
+
+    title: str | None = Field(default=None, min_length=1)
+    author: str | None = None
+    description: str | None = None
+
+    @model_validator(mode="after")
+    def _changes_something(self) -> Self:
+        if not self.model_dump(exclude_none=True):
+            raise ValueError("Set at least one field to change")
+
+        return self
+
+
+class BulkUpdateRequest(BookSelection):
+    changes: BulkBookChanges
+
+
+class BulkBookResult(BaseModel):
+    id: UUID
+    success: bool
+    error: str | None = None
+
+
+def _results(
+    selection: BookSelection, affected_ids: list[UUID]
+) -> list[BulkBookResult]:
+    if selection.ids is None:
+        return [BulkBookResult(id=book_id, success=True) for book_id in affected_ids]
+
+    affected = set(affected_ids)
+
+    return [
+        BulkBookResult(id=book_id, success=True)
+        if book_id in affected
+        else BulkBookResult(id=book_id, success=False, error="Book not found")
+        for book_id in dict.fromkeys(selection.ids)
+    ]
+
+
+def delete_books(
+    db: Session, user_id: UUID, selection: BookSelection
+) -> tuple[list[BulkBookResult], list[str]]:
+    """
+    Delete the selected books, returning the results and the paths of the
+    files nothing references anymore, to be removed now it is committed.
+    """
+    deleted = db.execute(
+        selection.apply(delete(Book).where(Book.user_id == user_id))
+        .returning(Book.id, Book.processing_state, Book.content_hash, Book.file_path)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    record_book_changes(
+        db,
+        user_id,
+        [row.id for row in deleted if row.processing_state == ProcessingState.READY],
+        BookChangeKind.REMOVED,
+    )
+    released_file_paths = release_files(
+        db, [(row.content_hash, row.file_path) for row in deleted]
+    )
+    db.commit()
+
+    return _results(selection, [row.id for row in deleted]), released_file_paths
+
+
+def update_books(
+    db: Session, user_id: UUID, request: BulkUpdateRequest
+) -> list[BulkBookResult]:
+    updated = db.execute(
+        request.apply(update(Book).where(Book.user_id == user_id))
+        .values(**request.changes.model_dump(exclude_none=True))
+        .returning(Book.id, Book.processing_state)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    record_book_changes(
+        db,
+        user_id,
+        [row.id for row in updated if row.processing_state == ProcessingState.READY],
+        BookChangeKind.UPDATED,
+    )
+    db.commit()
+
+    return _results(request, [row.id for row in updated])
@@ -0,0 +1,118 @@
+import base64
+import binascii
+from datetime import datetime
+from uuid import UUID
+
+from pydantic import BaseModel
+from sqlalchemy import Row, func, insert, select
+from sqlalchemy.orm import Session
+
+from kosync_backend.database import BookChange, BookChangeKind
+
+
+_CURSOR_PREFIX = "v1:"
+
+
+class InvalidCursor(Exception):
+    """The sync cursor was not issued by this server."""
+
+
+def encode_cursor(seq: int) -> str:
+    return base64.urlsafe_b64encode(f"{_CURSOR_PREFIX}{seq}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        decoded = base64.urlsafe_b64decode(cursor.encode()).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        raise InvalidCursor(cursor)
+
+    if (
+        not decoded.startswith(_CURSOR_PREFIX)
+        or not (seq := decoded.removeprefix(_CURSOR_PREFIX)).isdigit()
+    ):
+        raise InvalidCursor(cursor)
+
+    return int(seq)
+
+
+def record_book_change(
+    db: Session, user_id: UUID, book_id: UUID, kind: BookChangeKind
+) -> None:
+    """Add a change to the log. It is committed with the session's transaction."""
+    db.add(BookChange(user_id=user_id, book_id=book_id, kind=kind))
+
+
+def record_book_changes(
+    db: Session, user_id: UUID, book_ids: list[UUID], kind: BookChangeKind
+) -> None:
+    """`record_book_change` for many books, in a single insert."""
+    if book_ids:
+        db.execute(
+            insert(BookChange),
+            [
+                {"user_id": user_id, "book_id": book_id, "kind": kind}
+                for book_id in book_ids
+            ],
+        )
+
+
+def latest_seq(db: Session) -> int:
+    return db.scalar(select(func.max(BookChange.seq))) or 0
+
+
+class BookTombstone(BaseModel):
+    id: UUID
+    removed_at: datetime
+
+
+class BookChanges(BaseModel):
+    seq: int
+    added: list[UUID] = []
+    updated: list[UUID] = []
+    removed: list[BookTombstone] = []
+    has_more: bool = False
+
+
+def changes_since(db: Session, user_id: UUID, seq: int, limit: int) -> BookChanges:
+    """
+    Return what changed for the user after `seq`, reading at most `limit`
+    log entries. Several changes to one book are folded into one: a book
+    added and removed again doesn't show up at all, and an added book that
+    was edited afterwards is only reported as added.
+    """
+    changes = db.execute(
+        select(
+            BookChange.seq, BookChange.book_id, BookChange.kind, BookChange.created_at
+        )
+        .where(BookChange.user_id == user_id, BookChange.seq > seq)
+        .order_by(BookChange.seq)
+        .limit(limit + 1)
+    ).all()
+
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+
+    # Insertion order keeps the result in log order
+    first_changes: dict[UUID, Row] = {}
+    last_changes: dict[UUID, Row] = {}
+    for change in changes:
+        first_changes.setdefault(change.book_id, change)
+        last_changes[change.book_id] = change
+
+    result = BookChanges(seq=changes[-1].seq if changes else seq, has_more=has_more)
+
+    for book_id, last_change in last_changes.items():
+        was_added = first_changes[book_id].kind == BookChangeKind.ADDED
+
+        if last_change.kind == BookChangeKind.REMOVED:
+            if not was_added:
+                result.removed.append(
+                    BookTombstone(id=book_id, removed_at=last_change.created_at)
+                )
+        elif was_added:
+            result.added.append(book_id)
+        else:
+            result.updated.append(book_id)
+
+    return result
@@ -1,14 +1,22 @@
+from collections.abc import Iterator
+import gzip
+import io
 import json
 import shutil
 import tarfile
 from tempfile import TemporaryDirectory
+import time
 from typing import Self
-from urllib.request import urlretrieve
 from pathlib import Path
 
 from fastapi import Request
 
+from kosync_backend.artifacts import NICKEL_ADDONS, ArtifactCache
 from kosync_backend.config import Settings
+from kosync_backend.metrics import CLIENT_BUNDLE_GENERATION_DURATION
+
+
+BUNDLE_CHUNK_SIZE = 64 * 1024
 
 
 class ClientGenerator:
@@ -18,37 +26,24 @@ class ClientGenerator:
     def __init__(self, settings: Settings) -> None:
         self._settings = settings
         self.root_directory = Path(TemporaryDirectory(delete=False).name)
+        self._bundle_directory = Path(TemporaryDirectory(delete=False).name)
+        self._static_bundle_path = self._bundle_directory / "KoboRoot.static.tgz"
 
     def __enter__(self) -> Self:
         self._prepare_nickel_addons()
         self._prepare_client()
+        with CLIENT_BUNDLE_GENERATION_DURATION.labels("static").time():
+            self._build_static_bundle()
         return self
 
     def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
         shutil.rmtree(self.root_directory)
-
-    def _download_nickeldbus(self) -> Path:
-        path, _ = urlretrieve(
-            "https://github.com/shermp/NickelDBus/releases/download/0.2.0/KoboRoot.tgz"
-        )
-
-        return Path(path)
-
-    def _download_nickelmenu(self) -> Path:
-        path, _ = urlretrieve(
-            "https://github.com/pgaskin/NickelMenu/releases/download/v0.5.4/KoboRoot.tgz"
-        )
-
-        return Path(path)
+        shutil.rmtree(self._bundle_directory)
 
     def _prepare_nickel_addons(self) -> None:
-        tar = tarfile.open(self._download_nickelmenu(), "r:gz")
-        tar.extractall(path=self.root_directory, filter="tar")
-        tar.close()
+        addons = ArtifactCache(self._settings.artifact_dir).extracted(NICKEL_ADDONS)
 
-        tar = tarfile.open(self._download_nickeldbus(), "r:gz")
-        tar.extractall(path=self.root_directory, filter="tar")
-        tar.close()
+        shutil.copytree(addons, self.root_directory, dirs_exist_ok=True)
 
     def _nickelmenu_config(self) -> str:
         return (
@@ -71,36 +66,67 @@ class ClientGenerator:
             Path(self.root_directory) / "mnt" / "onboard" / ".adds" / "nm" / "doc"
         ).write_text(self._nickelmenu_config())
 
-    def generate(self, token: str) -> Path:
-        config_path = (
-            Path(self.root_directory) / "mnt" / "onboard" / ".kosyncConfig.json"
-        )
-
-        config_path.parent.mkdir(exist_ok=True)
-
-        config_path.write_text(
-            json.dumps(
-                {
-                    "Token": token,
-                    "BooksDirectory": "/mnt/onboard/kosync/",
-                    "Endpoint": self._settings.base_url,
-                }
-            )
-        )
-
-        path = Path(self.root_directory) / "generated" / token / "KoboRoot.tgz"
-        path.parent.mkdir(exist_ok=True, parents=True)
+    def _build_static_bundle(self) -> None:
+        """
+        Compress everything but the per-device config into a single gzip
+        member, once. It has no end-of-archive marker, so a member holding
+        the config and the marker can be appended to it per download.
+        """
+        tar_path = self._bundle_directory / "static.tar"
 
-        with tarfile.open(path, mode="w:gz") as tar_file:
+        with tarfile.open(tar_path, mode="w") as tar_file:
             for subdir in ["usr", "mnt", "etc"]:
-                tar_file.add(
-                    name=Path(self.root_directory) / subdir,
-                    arcname=subdir,
-                )
-
-        config_path.unlink()
-
-        return path
+                tar_file.add(name=self.root_directory / subdir, arcname=subdir)
+
+            members_end = tar_file.offset
+
+        with (
+            open(tar_path, "rb") as source,
+            gzip.GzipFile(self._static_bundle_path, mode="wb", mtime=0) as target,
+        ):
+            remaining = members_end
+            while remaining > 0:
+                chunk = source.read(min(BUNDLE_CHUNK_SIZE, remaining))
+                target.write(chunk)
+                remaining -= len(chunk)
+
+        tar_path.unlink()
+
+    def _config_member(self, token: str) -> bytes:
+        config = json.dumps(
+            {
+                "Token": token,
+                "BooksDirectory": "/mnt/onboard/kosync/",
+                "Endpoint": self._settings.base_url,
+            }
+        ).encode()
+
+        info = tarfile.TarInfo("mnt/onboard/.kosyncConfig.json")
+        info.size = len(config)
+        info.mode = 0o644
+        info.mtime = int(time.time())
+
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode="w") as tar_file:
+            tar_file.addfile(info, io.BytesIO(config))
+
+        return gzip.compress(buffer.getvalue(), mtime=0)
+
+    def generate(self, token: str) -> Iterator[bytes]:
+        """
+        Stream a `KoboRoot.tgz` configured with `token`: the pre-built bundle
+        followed by a gzip member holding the config. Gzip members
+        concatenate, so this is one valid archive, and nothing is written to
+        disk per download.
+        """
+        with CLIENT_BUNDLE_GENERATION_DURATION.labels("config").time():
+            config_member = self._config_member(token)
+
+        with open(self._static_bundle_path, "rb") as bundle:
+            while chunk := bundle.read(BUNDLE_CHUNK_SIZE):
+                yield chunk
+
+        yield config_member
 
 
 def get_client_generator(request: Request) -> ClientGenerator:
@@ -1,23 +1,107 @@
 import functools
+from typing import Literal
+
 from pydantic_settings import BaseSettings
 
 
 class Settings(BaseSettings):
     database_url: str = "sqlite:///./kosync.db"
+    database_pool_size: int = 5
+    database_max_overflow: int = 10
+    database_pool_pre_ping: bool = True
+
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_busy_timeout_ms: int = 5000
 
     upload_dir: str = "./uploads"
+    cover_dir: str = "./covers"
+
+    # Where book files are stored. With "s3", upload_dir only holds uploads
+    # while they are received and processed. Credentials fall back to the
+    # usual AWS environment variables and configuration files
+    storage_backend: Literal["filesystem", "s3"] = "filesystem"
+    s3_bucket: str = ""
+    s3_prefix: str = ""
+    s3_endpoint_url: str | None = None
+    s3_region: str | None = None
+    s3_access_key_id: str | None = None
+    s3_secret_access_key: str | None = None
+
+    # How book files are sent once the request is authorised: streamed by
+    # this process, offloaded to the reverse proxy through an internal
+    # location mapped to upload_dir, or downloaded by the client from a
+    # presigned storage URL. To have files sent with sendfile, put NGINX
+    # (x-accel-redirect) or Apache/Lighttpd (x-sendfile) in front
+    book_delivery: Literal[
+        "stream", "x-accel-redirect", "x-sendfile", "presigned-url"
+    ] = "stream"
+    book_internal_location: str = "/internal/uploads/"
+    presigned_url_expiry_s: int = 300
+
+    # Sweeps for book files no book references, e.g. because their removal
+    # was interrupted, and abandoned uploads. 0 disables the sweep. Files
+    # younger than storage_gc_min_age_s are never removed, as uploads store
+    # their file before committing the book. With S3, only a non-empty
+    # s3_prefix is swept
+    storage_gc_interval_s: float = 3600.0
+    storage_gc_batch_size: int = 1000
+    storage_gc_min_age_s: float = 3600.0
 
     base_url: str = "http://localhost:8000"
 
     allowed_origins: list[str] = ["http://localhost:5173"]
 
+    # Serves Prometheus metrics at /metrics. With metrics_token, scrapers
+    # have to send it as a bearer token; without, only the scraper should be
+    # able to reach the endpoint
+    metrics_enabled: bool = False
+    metrics_token: str = ""
+
     client_path: str = "./kosync_client"
+    artifact_dir: str = "./artifacts"
+
+    # Threads can't be stopped, so in thread mode a job that exceeds
+    # worker_job_timeout_s, e.g. on a malicious EPUB, fails its request but
+    # keeps its worker busy until it returns. Use "process" to have stuck
+    # workers killed
+    worker_pool_kind: Literal["thread", "process"] = "thread"
+    worker_pool_size: int = 4
+    worker_queue_depth: int = 32
+    worker_job_timeout_s: float = 30.0
+
+    ingestion_concurrency: int = 2
 
     max_books_per_user: int = 5
     max_file_size_mb: int = 5
+    max_batch_upload_files: int = 50
+
+    sync_max_changes: int = 1000
 
     supabase_url: str = ""
     supabase_key: str = ""
+    supabase_jwt_secret: str = ""
+    supabase_jwks_url: str = ""
+    supabase_jwt_audience: str = "authenticated"
+    supabase_timeout_s: float = 5.0
+    supabase_max_connections: int = 20
+    supabase_max_keepalive_connections: int = 10
+    supabase_max_retries: int = 2
+    supabase_retry_backoff_s: float = 0.2
+    supabase_circuit_failure_threshold: int = 5
+    supabase_circuit_reset_s: float = 30.0
+
+    jwt_cache_size: int = 1024
+
+    device_token_cache_size: int = 1024
+    device_token_cache_ttl_s: float = 300.0
+    # Every client download issues a credential, so those never used expire
+    device_token_unused_expiry_s: float = 7 * 24 * 3600.0
+    # Clients generated before device tokens send the user id instead, which
+    # is looked up with Supabase and then cached like a device token. Disable
+    # once those clients have been replaced
+    legacy_user_id_tokens: bool = True
 
 
 @functools.cache
@@ -0,0 +1,116 @@
+import hashlib
+import io
+import os
+from pathlib import Path
+import re
+from tempfile import NamedTemporaryFile
+from typing import Annotated
+
+from fastapi import Depends
+from PIL import Image, UnidentifiedImageError
+
+from kosync_backend.config import Settings, get_settings
+
+
+THUMBNAIL_WIDTHS = (160, 320, 640)
+
+_COVER_HASH_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+_MEDIA_TYPE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with NamedTemporaryFile(dir=path.parent, prefix=".tmp-", delete=False) as tmp:
+        tmp.write(data)
+
+    os.replace(tmp.name, path)
+
+
+def guess_media_type(data: bytes) -> str:
+    for signature, media_type in _MEDIA_TYPE_SIGNATURES:
+        if data.startswith(signature):
+            return media_type
+
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+
+    if data.lstrip()[:5] in (b"<?xml", b"<svg "):
+        return "image/svg+xml"
+
+    return "application/octet-stream"
+
+
+class CoverStore:
+    """
+    Content-addressed storage for cover images.
+
+    Covers are stored once per SHA-256 of their bytes, so books sharing a
+    cover share a file. Resized variants are rendered lazily and cached
+    next to the original.
+    """
+
+    root_directory: Path
+
+    def __init__(self, root_directory: Path | str) -> None:
+        self.root_directory = Path(root_directory)
+
+    def _original_path(self, cover_hash: str) -> Path:
+        if not _COVER_HASH_PATTERN.match(cover_hash):
+            raise ValueError(f"Invalid cover hash: {cover_hash!r}")
+
+        return self.root_directory / cover_hash[:2] / cover_hash
+
+    def _variant_path(self, cover_hash: str, width: int) -> Path:
+        return self._original_path(cover_hash).with_name(f"{cover_hash}-{width}.jpg")
+
+    def put(self, data: bytes) -> str:
+        cover_hash = hashlib.sha256(data).hexdigest()
+        path = self._original_path(cover_hash)
+
+        if not path.exists():
+            _atomic_write(path, data)
+
+        return cover_hash
+
+    def exists(self, cover_hash: str) -> bool:
+        return self._original_path(cover_hash).exists()
+
+    def get(self, cover_hash: str, width: int | None = None) -> tuple[bytes, str]:
+        """
+        Return the cover bytes and media type, resized to `width` if given.
+        Images Pillow can't decode (e.g. SVG covers) are returned unresized.
+        """
+        original = self._original_path(cover_hash).read_bytes()
+
+        if width is None:
+            return original, guess_media_type(original)
+
+        if width not in THUMBNAIL_WIDTHS:
+            raise ValueError(f"Unsupported thumbnail width: {width}")
+
+        variant_path = self._variant_path(cover_hash, width)
+        if variant_path.exists():
+            return variant_path.read_bytes(), "image/jpeg"
+
+        try:
+            with Image.open(io.BytesIO(original)) as image:
+                image.thumbnail((width, width * 4))
+                output = io.BytesIO()
+                image.convert("RGB").save(output, format="JPEG", quality=85)
+        except (UnidentifiedImageError, OSError):
+            return original, guess_media_type(original)
+
+        _atomic_write(variant_path, variant := output.getvalue())
+
+        return variant, "image/jpeg"
+
+
+def get_cover_store(settings: Annotated[Settings, Depends(get_settings)]) -> CoverStore:
+    return CoverStore(settings.cover_dir)
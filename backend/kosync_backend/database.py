@@ -1,21 +1,29 @@
 from collections.abc import Generator
 from datetime import datetime
 from datetime import timezone
-from typing import Annotated
+from enum import StrEnum
+import threading
+from typing import Annotated, Self
+import uuid
 
-from fastapi import Depends
+from fastapi import Depends, Request
+from pydantic import BaseModel
 import sqlalchemy
 from sqlalchemy import (
     UUID,
     DateTime,
     Engine,
+    Index,
     Integer,
     JSON,
-    LargeBinary,
     String,
     Text,
     create_engine,
+    event,
+    inspect,
+    make_url,
 )
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.orm import (
     DeclarativeBase,
     Mapped,
@@ -25,7 +33,10 @@ from sqlalchemy.orm import (
 )
 from sqlalchemy.sql import func
 
-from kosync_backend.config import Settings, get_settings
+from kosync_backend.config import Settings
+from kosync_backend.metrics import instrument_engine
+from kosync_backend.migrations import apply_migrations
+from kosync_backend.search_index import create_search_index
 
 
 class Base(DeclarativeBase):
@@ -35,18 +46,140 @@ class Base(DeclarativeBase):
 SessionLocal = sessionmaker(autoflush=False)
 
 
-def initialise_db(settings: Settings) -> None:
-    Base.metadata.create_all(bind=get_engine(settings))
+def initialise_db(engine: Engine, settings: Settings) -> None:
+    with engine.begin() as connection:
+        is_new_database = not inspect(connection).has_table(Book.__tablename__)
+
+        Base.metadata.create_all(bind=connection)
+        apply_migrations(connection, settings, stamp_only=is_new_database)
+
+
+def _is_sqlite_memory_database(database_url: str) -> bool:
+    url = make_url(database_url)
+
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
 
 
 def get_engine(settings: Settings) -> Engine:
-    return create_engine(
-        settings.database_url, connect_args={"check_same_thread": False}
+    """Build a new pooled engine. Prefer `EngineRegistry` outside of tooling and tests."""
+    url = make_url(settings.database_url)
+    engine_options: dict = {"pool_pre_ping": settings.database_pool_pre_ping}
+
+    if not _is_sqlite_memory_database(settings.database_url):
+        engine_options["pool_size"] = settings.database_pool_size
+        engine_options["max_overflow"] = settings.database_max_overflow
+
+    if url.get_backend_name() != "sqlite":
+        engine = create_engine(url, **engine_options)
+        instrument_engine(engine)
+
+        return engine
+
+    engine = create_engine(
+        url, connect_args={"check_same_thread": False}, **engine_options
     )
+    instrument_engine(engine)
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, _connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {int(settings.sqlite_busy_timeout_ms)}")
+        cursor.execute(f"PRAGMA journal_mode = {settings.sqlite_journal_mode}")
+        cursor.execute(f"PRAGMA synchronous = {settings.sqlite_synchronous}")
+        cursor.execute(f"PRAGMA mmap_size = {int(settings.sqlite_mmap_size)}")
+        cursor.close()
+
+    return engine
+
+
+class PoolStatistics(BaseModel):
+    database_url: str
+    pool: str
+    size: int | None = None
+    checked_in: int | None = None
+    checked_out: int | None = None
+    overflow: int | None = None
+
+
+class EngineRegistry:
+    """
+    Process-wide registry of pooled engines, keyed by database URL.
+
+    Created once during the app lifespan so that every request shares the
+    same connection pool instead of building (and discarding) its own.
+    """
+
+    _settings: Settings
+    _engines: dict[str, Engine]
+
+    def __init__(self, settings: Settings) -> None:
+        self._settings = settings
+        self._engines = {}
+        self._lock = threading.Lock()
 
+    def __enter__(self) -> Self:
+        return self
 
-def get_db(settings: Annotated[Settings, Depends(get_settings)]) -> Generator[Session]:
-    db = SessionLocal(bind=get_engine(settings))
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        self.dispose()
+
+    def get_engine(self) -> Engine:
+        database_url = self._settings.database_url
+
+        with self._lock:
+            if (engine := self._engines.get(database_url)) is None:
+                engine = self._engines[database_url] = get_engine(self._settings)
+
+        return engine
+
+    def pool_statistics(self) -> list[PoolStatistics]:
+        with self._lock:
+            engines = list(self._engines.items())
+
+        statistics = []
+        for database_url, engine in engines:
+            pool = engine.pool
+            statistics.append(
+                PoolStatistics(
+                    database_url=make_url(database_url).render_as_string(
+                        hide_password=True
+                    ),
+                    pool=type(pool).__name__,
+                    **(
+                        {
+                            "size": pool.size(),
+                            "checked_in": pool.checkedin(),
+                            "checked_out": pool.checkedout(),
+                            "overflow": pool.overflow(),
+                        }
+                        if isinstance(pool, QueuePool)
+                        else {}
+                    ),
+                )
+            )
+
+        return statistics
+
+    def dispose(self) -> None:
+        with self._lock:
+            for engine in self._engines.values():
+                engine.dispose()
+            self._engines.clear()
+
+
+def get_engine_registry(request: Request) -> EngineRegistry:
+    if hasattr(request.app.state, "engine_registry"):
+        return request.app.state.engine_registry
+
+    raise ValueError(
+        "engine_registry was not found on the app, did the lifecycle event fire?"
+    )
+
+
+def get_db(
+    engine_registry: Annotated[EngineRegistry, Depends(get_engine_registry)],
+) -> Generator[Session]:
+    db = SessionLocal(bind=engine_registry.get_engine())
     try:
         yield db
     finally:
@@ -55,15 +188,22 @@ def get_db(settings: Annotated[Settings, Depends(get_settings)]) -> Generator[Se
 
 class DateTimeUtc(sqlalchemy.types.TypeDecorator):
     impl = sqlalchemy.types.DateTime
+    cache_ok = True
     LOCAL_TIMEZONE = datetime.now(timezone.utc).astimezone().tzinfo
 
-    def process_bind_param(self, value: datetime, dialect):
+    def process_bind_param(self, value: datetime | None, dialect):
+        if value is None:
+            return None
+
         if value.tzinfo is None:
             value = value.astimezone(self.LOCAL_TIMEZONE)
 
         return value.astimezone(timezone.utc)
 
     def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+
         if value.tzinfo is None:
             return value.replace(tzinfo=timezone.utc)
 
@@ -73,42 +213,139 @@ class DateTimeUtc(sqlalchemy.types.TypeDecorator):
 class UserUploadLimit(Base):
     __tablename__ = "user_upload_limits"
 
-    user_id: Mapped[UUID] = mapped_column(
+    user_id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True), primary_key=True, index=True
     )
     allowed_uploads: Mapped[int | None] = mapped_column(Integer, nullable=True)
     max_file_size_mb: Mapped[int | None] = mapped_column(Integer, nullable=True)
 
 
+class ProcessingState(StrEnum):
+    PENDING = "pending"
+    PROCESSING = "processing"
+    READY = "ready"
+    FAILED = "failed"
+
+
 class Book(Base):
     __tablename__ = "books"
-
-    id: Mapped[UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, index=True)
-    user_id: Mapped[UUID] = mapped_column(
-        UUID(as_uuid=True), index=True, nullable=False
+    # Every query is scoped to a user, so user_id leads the indexes, apart
+    # from counting the books that share a blob
+    __table_args__ = (
+        Index("ix_books_user_id_upload_date", "user_id", "upload_date"),
+        Index("ix_books_user_id_id", "user_id", "id"),
+        Index("ix_books_content_hash", "content_hash"),
     )
+
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
     title: Mapped[str] = mapped_column(String, nullable=False)
     author: Mapped[str | None] = mapped_column(String, nullable=True)
     publisher: Mapped[str | None] = mapped_column(String, nullable=True)
     isbn: Mapped[str | None] = mapped_column(String, nullable=True)
     language: Mapped[str | None] = mapped_column(String, nullable=True)
     description: Mapped[str | None] = mapped_column(Text, nullable=True)
-    cover_image: Mapped[bytes | None] = mapped_column(LargeBinary, nullable=True)
+    cover_hash: Mapped[str | None] = mapped_column(String(64), nullable=True)
     file_path: Mapped[str] = mapped_column(String, nullable=False)
     file_size: Mapped[int | None] = mapped_column(Integer, nullable=True)
-    upload_date: Mapped[DateTimeUtc] = mapped_column(
+    content_hash: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    processing_state: Mapped[str] = mapped_column(
+        String(16),
+        nullable=False,
+        default=ProcessingState.READY,
+        server_default=ProcessingState.READY,
+    )
+    processing_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Set in Python so that SQLite stores it with microseconds, like the
+    # values it is compared with when paginating
+    upload_date: Mapped[datetime] = mapped_column(
+        DateTimeUtc(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        server_default=func.now(),
+    )
+
+
+class BookBlob(Base):
+    """
+    An uploaded EPUB, stored once however many books have the same contents.
+    `ref_count` is the number of books referencing it, and `extraction` caches
+    the `ProcessedEpub` of the first upload so duplicates skip processing.
+    """
+
+    __tablename__ = "book_blobs"
+
+    content_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    size: Mapped[int] = mapped_column(Integer, nullable=False)
+    ref_count: Mapped[int] = mapped_column(Integer, nullable=False)
+    extraction: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
         DateTimeUtc(timezone=True), server_default=func.now()
     )
 
 
+@event.listens_for(Book.__table__, "after_create")
+def _create_books_search_index(target, connection, **kwargs) -> None:
+    if connection.dialect.name == "sqlite":
+        create_search_index(connection)
+
+
 class Synchronisation(Base):
     __tablename__ = "synchronisations"
+    __table_args__ = (
+        Index("ix_synchronisations_user_id_created_at", "user_id", "created_at"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    user_id: Mapped[UUID] = mapped_column(
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    book_ids: Mapped[list] = mapped_column(JSON, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTimeUtc(timezone=True), server_default=func.now()
+    )
+
+
+class BookChangeKind(StrEnum):
+    ADDED = "added"
+    UPDATED = "updated"
+    REMOVED = "removed"
+
+
+class BookChange(Base):
+    """
+    Append-only log of changes to ready books, which devices replay from
+    their sync cursor. `seq` only ever grows, also across deletions.
+    """
+
+    __tablename__ = "book_changes"
+    __table_args__ = (
+        Index("ix_book_changes_user_id_seq", "user_id", "seq"),
+        {"sqlite_autoincrement": True},
+    )
+
+    seq: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    book_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    kind: Mapped[str] = mapped_column(String(16), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTimeUtc(timezone=True), server_default=func.now()
+    )
+
+
+class DeviceCredential(Base):
+    __tablename__ = "device_credentials"
+
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
+    user_id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True), index=True, nullable=False
     )
-    book_ids: Mapped[list] = mapped_column(JSON, nullable=False)
-    created_at: Mapped[DateTimeUtc] = mapped_column(
+    token_hash: Mapped[str] = mapped_column(
+        String(64), unique=True, index=True, nullable=False
+    )
+    created_at: Mapped[datetime] = mapped_column(
         DateTimeUtc(timezone=True), server_default=func.now()
     )
+    last_used_at: Mapped[datetime | None] = mapped_column(
+        DateTimeUtc(timezone=True), nullable=True
+    )
+    revoked_at: Mapped[datetime | None] = mapped_column(
+        DateTimeUtc(timezone=True), nullable=True
+    )
@@ -0,0 +1,272 @@
+"""
+Delivery of stored EPUB files to browsers and devices.
+
+Responses carry a strong ETag derived from the book's content hash, so
+clients can revalidate with `If-None-Match` (or `If-Modified-Since`) and
+resume interrupted downloads with `Range` and `If-Range`. Range requests,
+including multiple ranges, are served by `BookFileResponse`.
+
+Depending on `book_delivery`, the file itself is
+
+- "stream": sent by this process. ASGI servers supporting the path send
+  extension, such as Granian, are handed the file's path instead and send
+  it themselves; uvicorn reads it in chunks. ASGI gives the app no access to
+  the socket, so it can't `os.sendfile` the file itself,
+- "x-accel-redirect" / "x-sendfile": sent by the reverse proxy, which has to
+  map `book_internal_location` to `upload_dir`. For NGINX:
+
+      location /internal/uploads/ {
+          internal;
+          alias /app/uploads/;
+      }
+
+- "presigned-url": downloaded by the client from the storage service, which
+  it is redirected to.
+
+The last three need a storage backend supporting them, otherwise the file is
+streamed. Files that aren't on the local filesystem are streamed from the
+storage backend, answering a single range at most.
+"""
+
+from email.utils import formatdate, parsedate_to_datetime
+import hashlib
+from secrets import token_hex
+from typing import Literal
+from urllib.parse import quote
+from uuid import UUID
+
+import anyio
+from fastapi import Request, Response, status
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from starlette.types import Send
+
+from kosync_backend.config import Settings
+from kosync_backend.database import Book
+from kosync_backend.storage import Storage, StoredObject
+
+
+EPUB_MEDIA_TYPE = "application/epub+zip"
+
+
+class BookFileResponse(FileResponse):
+    """
+    `FileResponse`, but answering multiple ranges with a well-formed
+    `multipart/byteranges` body: Starlette puts the multipart media type in
+    Content-Range and separates the parts with bare LFs.
+
+    This overrides a private method of `FileResponse`, so the Starlette
+    version is pinned in `pyproject.toml`.
+    """
+
+    async def _handle_multiple_ranges(
+        self,
+        send: Send,
+        ranges: list[tuple[int, int]],
+        file_size: int,
+        send_header_only: bool,
+    ) -> None:
+        boundary = token_hex(13)
+        part_headers = [
+            (
+                ("\r\n" if index else "")
+                + f"--{boundary}\r\n"
+                + f"Content-Type: {self.headers['content-type']}\r\n"
+                + f"Content-Range: bytes {start}-{end - 1}/{file_size}\r\n\r\n"
+            ).encode("latin-1")
+            for index, (start, end) in enumerate(ranges)
+        ]
+        closing = f"\r\n--{boundary}--\r\n".encode("latin-1")
+
+        self.headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+        self.headers["content-length"] = str(
+            sum(len(header) for header in part_headers)
+            + sum(end - start for start, end in ranges)
+            + len(closing)
+        )
+        await send(
+            {"type": "http.response.start", "status": 206, "headers": self.raw_headers}
+        )
+
+        if send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            for header, (start, end) in zip(part_headers, ranges):
+                await send(
+                    {"type": "http.response.body", "body": header, "more_body": True}
+                )
+                await file.seek(start)
+                while start < end:
+                    chunk = await file.read(min(self.chunk_size, end - start))
+                    start += len(chunk)
+                    await send(
+                        {"type": "http.response.body", "body": chunk, "more_body": True}
+                    )
+
+        await send({"type": "http.response.body", "body": closing, "more_body": False})
+
+
+def _etag(content_hash: str | None, stored: StoredObject) -> str:
+    if content_hash is not None:
+        return f'"{content_hash}"'
+
+    # Books uploaded before content hashes were stored get the ETag
+    # FileResponse would give them, based on the file's size and mtime
+    etag_base = f"{stored.modified_at}-{stored.size}"
+
+    return f'"{hashlib.md5(etag_base.encode(), usedforsecurity=False).hexdigest()}"'
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+
+    # If-None-Match uses the weak comparison
+    return etag.removeprefix("W/") in (
+        tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+    )
+
+
+def is_not_modified(request: Request, etag: str, modified_at: float) -> bool:
+    """
+    Whether the client's copy is current. If-Modified-Since is only looked
+    at without If-None-Match, as RFC 9110 requires.
+    """
+    if (if_none_match := request.headers.get("if-none-match")) is not None:
+        return _etag_matches(if_none_match, etag)
+
+    if (if_modified_since := request.headers.get("if-modified-since")) is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+
+        # Last-Modified only has a resolution of seconds
+        return int(modified_at) <= since
+
+    return False
+
+
+def _requested_range(
+    request: Request, etag: str, size: int
+) -> tuple[int, int] | None | Literal[False]:
+    """
+    The single byte range asked for, as `(start, end)` with `end` excluded.
+    None means the whole file, and False that the range can't be satisfied.
+    """
+    if (http_range := request.headers.get("range")) is None:
+        return None
+
+    # A stale If-Range asks for the whole, changed file
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range != etag:
+        return None
+
+    unit, _, ranges = http_range.partition("=")
+    if unit.strip() != "bytes" or "," in ranges:
+        # Serving the whole file instead is allowed
+        return None
+
+    first, _, last = ranges.strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last) + 1, size) if last else size
+        else:
+            start, end = max(size - int(last), 0), size
+    except ValueError:
+        return None
+
+    if start >= end:
+        return False
+
+    return start, end
+
+
+def _stored_file_response(
+    storage: Storage, stored: StoredObject, headers: dict[str, str], request: Request
+) -> Response:
+    headers["Accept-Ranges"] = "bytes"
+    byte_range = _requested_range(request, headers["ETag"], stored.size)
+
+    if byte_range is False:
+        headers["Content-Range"] = f"bytes */{stored.size}"
+        return Response(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, headers=headers
+        )
+
+    if byte_range is None:
+        headers["Content-Length"] = str(stored.size)
+        return StreamingResponse(
+            storage.get(stored.key), headers=headers, media_type=EPUB_MEDIA_TYPE
+        )
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end - 1}/{stored.size}"
+    headers["Content-Length"] = str(end - start)
+
+    return StreamingResponse(
+        storage.get_range(stored.key, start, end),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        headers=headers,
+        media_type=EPUB_MEDIA_TYPE,
+    )
+
+
+def book_file_response(
+    db: Session,
+    settings: Settings,
+    storage: Storage,
+    user_id: UUID,
+    book_id: UUID,
+    request: Request,
+) -> Response:
+    """
+    Serve the user's book, or answer 404 if they have no such book. Blocks,
+    so call it from a thread.
+    """
+    row = db.execute(
+        select(Book.file_path, Book.content_hash).where(
+            Book.id == book_id, Book.user_id == user_id
+        )
+    ).first()
+
+    if row is None:
+        return Response(status_code=status.HTTP_404_NOT_FOUND)
+
+    if (stored := storage.stat(row.file_path)) is None:
+        return Response(status_code=status.HTTP_404_NOT_FOUND)
+
+    headers = {
+        "Cache-Control": "private, no-cache",
+        "ETag": _etag(row.content_hash, stored),
+        "Last-Modified": formatdate(stored.modified_at, usegmt=True),
+    }
+
+    if is_not_modified(request, headers["ETag"], stored.modified_at):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if settings.book_delivery == "presigned-url" and (
+        url := storage.presigned_url(row.file_path, settings.presigned_url_expiry_s)
+    ):
+        return RedirectResponse(
+            url, status_code=status.HTTP_307_TEMPORARY_REDIRECT, headers=headers
+        )
+
+    if (path := storage.local_path(row.file_path)) is None:
+        return _stored_file_response(storage, stored, headers, request)
+
+    # The proxy answers Range and If-Range itself
+    if settings.book_delivery == "x-accel-redirect":
+        location = settings.book_internal_location.rstrip("/")
+        headers["X-Accel-Redirect"] = f"{location}/{quote(row.file_path)}"
+        return Response(headers=headers, media_type=EPUB_MEDIA_TYPE)
+
+    if settings.book_delivery == "x-sendfile":
+        headers["X-Sendfile"] = str(path.resolve())
+        return Response(headers=headers, media_type=EPUB_MEDIA_TYPE)
+
+    return BookFileResponse(path, headers=headers, media_type=EPUB_MEDIA_TYPE)
@@ -0,0 +1,210 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import hashlib
+import secrets
+import threading
+import time
+from typing import Self
+from uuid import UUID, uuid4
+
+from fastapi import Request
+from pydantic import BaseModel
+from sqlalchemy import ColumnElement, delete, or_, select, update
+from sqlalchemy.orm import Session
+
+from kosync_backend.config import Settings
+from kosync_backend.database import DeviceCredential, EngineRegistry, SessionLocal
+
+
+# Sets device tokens apart from the user ids older clients use as their token
+DEVICE_TOKEN_PREFIX = "kosync_"
+
+
+class Device(BaseModel):
+    """An authenticated device. `id` is None for clients using a legacy token."""
+
+    id: UUID | None = None
+    user_id: UUID
+
+
+class _CachedDevice(BaseModel):
+    device: Device
+    cached_at: float
+
+
+def hash_device_token(token: str) -> str:
+    # The tokens are random, so an unsalted hash is enough to make a leaked
+    # table useless
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class DeviceAuthenticator:
+    """
+    Issues, authenticates and revokes the credentials that generated clients
+    use to talk to the sync endpoints.
+
+    Only the SHA-256 of a token is stored. Authenticated tokens are cached
+    in-process for `device_token_cache_ttl_s`, so most requests are served
+    without touching the database. Revoking through this instance takes
+    effect immediately; other processes notice once their cache entry expires.
+
+    Credentials never used within `device_token_unused_expiry_s` expire, and
+    are deleted when the user is issued another one.
+    """
+
+    _settings: Settings
+    _engine_registry: EngineRegistry
+
+    def __init__(self, settings: Settings, engine_registry: EngineRegistry) -> None:
+        self._settings = settings
+        self._engine_registry = engine_registry
+        self._cache: OrderedDict[str, _CachedDevice] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def _session(self) -> Session:
+        return SessionLocal(bind=self._engine_registry.get_engine())
+
+    def _get_cached(self, token_hash: str) -> Device | None:
+        with self._lock:
+            if (cached := self._cache.get(token_hash)) is None:
+                return None
+
+            if time.monotonic() - cached.cached_at > (
+                self._settings.device_token_cache_ttl_s
+            ):
+                del self._cache[token_hash]
+                return None
+
+            self._cache.move_to_end(token_hash)
+
+            return cached.device
+
+    def _put_cached(self, token_hash: str, device: Device) -> None:
+        with self._lock:
+            self._cache[token_hash] = _CachedDevice(
+                device=device, cached_at=time.monotonic()
+            )
+            self._cache.move_to_end(token_hash)
+
+            while len(self._cache) > self._settings.device_token_cache_size:
+                self._cache.popitem(last=False)
+
+    def _unexpired(self) -> ColumnElement[bool]:
+        unused_since = datetime.now(timezone.utc) - timedelta(
+            seconds=self._settings.device_token_unused_expiry_s
+        )
+
+        return or_(
+            DeviceCredential.last_used_at.is_not(None),
+            DeviceCredential.created_at >= unused_since,
+        )
+
+    def issue(self, user_id: UUID) -> tuple[DeviceCredential, str]:
+        """Create a credential for a new device and return it with its token."""
+        token = DEVICE_TOKEN_PREFIX + secrets.token_urlsafe(32)
+        credential = DeviceCredential(
+            id=uuid4(),
+            user_id=user_id,
+            token_hash=hash_device_token(token),
+            created_at=datetime.now(timezone.utc),
+        )
+
+        with self._session() as db:
+            db.execute(
+                delete(DeviceCredential).where(
+                    DeviceCredential.user_id == user_id, ~self._unexpired()
+                )
+            )
+            db.add(credential)
+            db.commit()
+            db.refresh(credential)
+            db.expunge(credential)
+
+        return credential, token
+
+    def authenticate(self, token: str) -> Device | None:
+        """Return the device the token was issued to, or None if it is unknown or revoked."""
+        token_hash = hash_device_token(token)
+
+        if (device := self._get_cached(token_hash)) is not None:
+            return device
+
+        with self._session() as db:
+            credential = db.scalars(
+                select(DeviceCredential).where(
+                    DeviceCredential.token_hash == token_hash,
+                    DeviceCredential.revoked_at.is_(None),
+                    self._unexpired(),
+                )
+            ).first()
+
+            if credential is None:
+                return None
+
+            # Only written on cache misses, so this is at most once per TTL
+            credential.last_used_at = datetime.now(timezone.utc)
+            device = Device(id=credential.id, user_id=credential.user_id)
+            db.commit()
+
+        self._put_cached(token_hash, device)
+
+        return device
+
+    def remember_legacy_token(self, token: str, user_id: UUID) -> Device:
+        """
+        Cache a legacy user id token once the user was looked up, so it is
+        authenticated like a device token until the cache entry expires.
+        """
+        device = Device(user_id=user_id)
+        self._put_cached(hash_device_token(token), device)
+
+        return device
+
+    def list(self, user_id: UUID) -> list[DeviceCredential]:
+        with self._session() as db:
+            credentials = list(
+                db.scalars(
+                    select(DeviceCredential)
+                    .where(DeviceCredential.user_id == user_id, self._unexpired())
+                    .order_by(DeviceCredential.created_at)
+                )
+            )
+            db.expunge_all()
+
+        return credentials
+
+    def revoke(self, user_id: UUID, device_id: UUID) -> bool:
+        """Revoke a device's credential. Returns False if the user has no such device."""
+        with self._session() as db:
+            result = db.execute(
+                update(DeviceCredential)
+                .where(
+                    DeviceCredential.id == device_id,
+                    DeviceCredential.user_id == user_id,
+                )
+                .values(revoked_at=datetime.now(timezone.utc))
+            )
+            db.commit()
+
+        with self._lock:
+            for token_hash, cached in list(self._cache.items()):
+                if cached.device.id == device_id:
+                    del self._cache[token_hash]
+
+        return result.rowcount > 0
+
+
+def get_device_authenticator(request: Request) -> DeviceAuthenticator:
+    if hasattr(request.app.state, "device_authenticator"):
+        return request.app.state.device_authenticator
+
+    raise ValueError(
+        "device_authenticator was not found on the app, did the lifecycle event fire?"
+    )
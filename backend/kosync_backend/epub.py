@@ -1,12 +1,31 @@
-import os
 import base64
+import logging
+import posixpath
 from pathlib import Path
 from typing import Optional
-import ebooklib
-from ebooklib import epub
+from urllib.parse import unquote
+from xml.etree import ElementTree
+import zipfile
+
 from pydantic import BaseModel
 
 
+logger = logging.getLogger(__name__)
+
+CONTAINER_PATH = "META-INF/container.xml"
+
+# Upper bounds on what is decompressed from an upload, so a zip bomb posing
+# as the package document or the cover can't exhaust memory.
+MAX_PACKAGE_DOCUMENT_SIZE = 4 * 1024 * 1024
+MAX_COVER_SIZE = 16 * 1024 * 1024
+
+_NAMESPACES = {
+    "container": "urn:oasis:names:tc:opendocument:xmlns:container",
+    "opf": "http://www.idpf.org/2007/opf",
+    "dc": "http://purl.org/dc/elements/1.1/",
+}
+
+
 class BookMetadata(BaseModel):
     title: str
     author: Optional[str] = None
@@ -16,65 +35,134 @@ class BookMetadata(BaseModel):
     description: Optional[str] = None
 
 
-def extract_epub_metadata(file_path: Path) -> BookMetadata:
-    """Extract metadata from EPUB file"""
-    try:
-        book = epub.read_epub(file_path)
-
-        # Extract basic metadata
-        title = book.get_metadata("DC", "title")
-        author = book.get_metadata("DC", "creator")
-        publisher = book.get_metadata("DC", "publisher")
-        language = book.get_metadata("DC", "language")
-        description = book.get_metadata("DC", "description")
-        identifier = book.get_metadata("DC", "identifier")
-
-        # Extract values from tuples (ebooklib returns tuples)
-        title = title[0][0] if title else "Unknown Title"
-        author = author[0][0] if author else "Unknown Author"
-        publisher = publisher[0][0] if publisher else None
-        language = language[0][0] if language else None
-        description = description[0][0] if description else None
-        isbn = identifier[0][0] if identifier else None
-
-        return BookMetadata(
-            title=title,
-            author=author,
-            publisher=publisher,
-            isbn=isbn,
-            language=language,
-            description=description,
-        )
-    except Exception as e:
-        print(f"Error extracting metadata: {e}")
-        # Return basic metadata with filename as title
-        filename = os.path.basename(file_path)
-        return BookMetadata(
-            title=filename.replace(".epub", ""), author="Unknown Author"
-        )
+class ExtractedEpub(BaseModel):
+    metadata: BookMetadata
+    cover: Optional[bytes] = None
 
 
-def extract_epub_cover(file_path: Path) -> Optional[bytes]:
-    """Extract cover image from EPUB file"""
-    try:
-        book = epub.read_epub(file_path)
+def _read_entry(archive: zipfile.ZipFile, name: str, max_size: int) -> bytes:
+    info = archive.getinfo(name)
+
+    if info.file_size > max_size:
+        raise ValueError(f"{name} is larger than {max_size} bytes")
+
+    with archive.open(info) as entry:
+        # The declared size can't be trusted, so never read past the limit
+        content = entry.read(max_size + 1)
+
+    if len(content) > max_size:
+        raise ValueError(f"{name} is larger than {max_size} bytes")
+
+    return content
 
-        if (cover := book.get_item_with_id("cover")) is not None:
-            return cover.get_content()
 
-        if (cover := book.get_item_with_id("cover-image")) is not None:
-            return cover.get_content()
+def _find_package_document(archive: zipfile.ZipFile) -> str:
+    container = ElementTree.fromstring(
+        _read_entry(archive, CONTAINER_PATH, MAX_PACKAGE_DOCUMENT_SIZE)
+    )
+    rootfile = container.find(".//container:rootfile", _NAMESPACES)
 
-        for item in book.get_items():
-            if item.get_type() == ebooklib.ITEM_IMAGE:
-                return item.get_content()
+    if rootfile is None or not rootfile.get("full-path"):
+        raise ValueError("No package document listed in the container")
 
+    return rootfile.get("full-path", "")
+
+
+def _first_dc_value(metadata: ElementTree.Element | None, name: str) -> str | None:
+    if metadata is None:
         return None
-    except Exception as e:
-        print(f"Error extracting cover: {e}")
+
+    element = metadata.find(f"dc:{name}", _NAMESPACES)
+
+    return element.text if element is not None else None
+
+
+def _find_cover_href(package: ElementTree.Element) -> str | None:
+    manifest = [
+        item
+        for item in package.findall("opf:manifest/opf:item", _NAMESPACES)
+        if item.get("href")
+    ]
+    images = [
+        item for item in manifest if item.get("media-type", "").startswith("image/")
+    ]
+
+    # EPUB 3 marks the cover in the manifest
+    for item in images:
+        if "cover-image" in item.get("properties", "").split():
+            return item.get("href")
+
+    # EPUB 2 points to it from the metadata
+    cover_ids = [
+        meta.get("content")
+        for meta in package.findall("opf:metadata/opf:meta", _NAMESPACES)
+        if meta.get("name") == "cover"
+    ]
+
+    for cover_id in [*cover_ids, "cover", "cover-image"]:
+        for item in images:
+            if item.get("id") == cover_id:
+                return item.get("href")
+
+    return images[0].get("href") if images else None
+
+
+def _read_cover(
+    archive: zipfile.ZipFile, package: ElementTree.Element, package_path: str
+) -> bytes | None:
+    if (href := _find_cover_href(package)) is None:
+        return None
+
+    cover_path = posixpath.normpath(
+        posixpath.join(posixpath.dirname(package_path), unquote(href))
+    )
+
+    try:
+        return _read_entry(archive, cover_path, MAX_COVER_SIZE)
+    except (KeyError, ValueError) as e:
+        logger.warning("Could not extract the cover: %s", e)
         return None
 
 
+def extract_epub(file_path: Path, fallback_title: str | None = None) -> ExtractedEpub:
+    """
+    Extract metadata and cover from an EPUB file in a single pass.
+
+    Only the container, the package document and the cover image are read
+    from the zip central directory; chapters and other resources are never
+    decompressed.
+
+    If the metadata can't be read, the title is `fallback_title`, e.g. the
+    name the file was uploaded under, or else the file's name.
+    """
+    try:
+        with zipfile.ZipFile(file_path) as archive:
+            package_path = _find_package_document(archive)
+            package = ElementTree.fromstring(
+                _read_entry(archive, package_path, MAX_PACKAGE_DOCUMENT_SIZE)
+            )
+            metadata = package.find("opf:metadata", _NAMESPACES)
+
+            return ExtractedEpub(
+                metadata=BookMetadata(
+                    title=_first_dc_value(metadata, "title") or "Unknown Title",
+                    author=_first_dc_value(metadata, "creator") or "Unknown Author",
+                    publisher=_first_dc_value(metadata, "publisher"),
+                    isbn=_first_dc_value(metadata, "identifier"),
+                    language=_first_dc_value(metadata, "language"),
+                    description=_first_dc_value(metadata, "description"),
+                ),
+                cover=_read_cover(archive, package, package_path),
+            )
+    except Exception as e:
+        logger.warning("Could not extract metadata from %s: %s", file_path, e)
+        return ExtractedEpub(
+            metadata=BookMetadata(
+                title=fallback_title or Path(file_path).stem, author="Unknown Author"
+            )
+        )
+
+
 def image_to_base64(image_data: bytes) -> str:
     """Convert image bytes to base64 string"""
     return base64.b64encode(image_data).decode("utf-8")
@@ -0,0 +1,262 @@
+import asyncio
+from collections.abc import AsyncGenerator
+import contextlib
+import logging
+from pathlib import Path
+from typing import Self
+from uuid import UUID
+
+from fastapi import Request
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from kosync_backend.blobs import (
+    cached_extraction,
+    record_extraction,
+    release_blob,
+)
+from kosync_backend.changes import record_book_change
+from kosync_backend.config import Settings
+from kosync_backend.covers import CoverStore
+from kosync_backend.database import (
+    Book,
+    BookChangeKind,
+    EngineRegistry,
+    ProcessingState,
+    SessionLocal,
+)
+from kosync_backend.epub import BookMetadata, extract_epub
+from kosync_backend.storage import Storage
+from kosync_backend.storage_gc import StorageCollector
+from kosync_backend.workers import WorkerPool, WorkerPoolBusy, WorkerTimeout
+
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessedEpub(BaseModel):
+    metadata: BookMetadata
+    cover_hash: str | None = None
+
+
+def process_epub(
+    file_path: Path, cover_dir: str, fallback_title: str | None = None
+) -> ProcessedEpub:
+    """
+    Extract an uploaded EPUB's metadata and store its cover.
+
+    Runs on the `WorkerPool`, so it only takes and returns picklable values.
+    """
+    extracted = extract_epub(file_path, fallback_title)
+
+    return ProcessedEpub(
+        metadata=extracted.metadata,
+        cover_hash=CoverStore(cover_dir).put(extracted.cover)
+        if extracted.cover
+        else None,
+    )
+
+
+def cached_processed_epub(db: Session, content_hash: str) -> ProcessedEpub | None:
+    """The result of processing an identical, already stored EPUB, if any."""
+    if (extraction := cached_extraction(db, content_hash)) is None:
+        return None
+
+    return ProcessedEpub.model_validate(extraction)
+
+
+class IngestionQueue:
+    """
+    Processes uploaded EPUBs in the background.
+
+    Books are inserted as `ProcessingState.PENDING` once their file is stored;
+    consumers then run `process_epub` on the `WorkerPool`, unless an identical
+    file was processed before, and fill in the metadata. Books left
+    unfinished by a previous run are picked up again on startup.
+    """
+
+    _settings: Settings
+    _engine_registry: EngineRegistry
+    _worker_pool: WorkerPool
+    _storage: Storage
+    _storage_collector: StorageCollector
+    _queue: asyncio.Queue[UUID]
+    _tasks: list[asyncio.Task]
+
+    def __init__(
+        self,
+        settings: Settings,
+        engine_registry: EngineRegistry,
+        worker_pool: WorkerPool,
+        storage: Storage,
+        storage_collector: StorageCollector,
+    ) -> None:
+        self._settings = settings
+        self._engine_registry = engine_registry
+        self._worker_pool = worker_pool
+        self._storage = storage
+        self._storage_collector = storage_collector
+        self._queue = asyncio.Queue()
+        self._tasks = []
+
+    async def __aenter__(self) -> Self:
+        for book_id in await run_in_threadpool(self._unfinished_book_ids):
+            self.enqueue(book_id)
+
+        self._tasks = [
+            asyncio.create_task(self._consume())
+            for _ in range(self._settings.ingestion_concurrency)
+        ]
+
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_traceback) -> None:
+        for task in self._tasks:
+            task.cancel()
+
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def enqueue(self, book_id: UUID) -> None:
+        self._queue.put_nowait(book_id)
+
+    async def join(self) -> None:
+        """Wait until every enqueued book has been processed."""
+        await self._queue.join()
+
+    def _session(self) -> Session:
+        return SessionLocal(bind=self._engine_registry.get_engine())
+
+    def _unfinished_book_ids(self) -> list[UUID]:
+        with self._session() as db:
+            return list(
+                db.scalars(
+                    select(Book.id)
+                    .where(
+                        Book.processing_state.in_(
+                            [ProcessingState.PENDING, ProcessingState.PROCESSING]
+                        )
+                    )
+                    .order_by(Book.upload_date)
+                )
+            )
+
+    def _start(self, book_id: UUID) -> tuple[str, str, ProcessedEpub | None] | None:
+        with self._session() as db:
+            book = db.get(Book, book_id)
+
+            if book is None or book.processing_state not in (
+                ProcessingState.PENDING,
+                ProcessingState.PROCESSING,
+            ):
+                return None
+
+            book.processing_state = ProcessingState.PROCESSING
+            db.commit()
+
+            # Until processed, the title is the name the file was uploaded under
+            return (
+                book.file_path,
+                book.title,
+                cached_processed_epub(db, book.content_hash)
+                if book.content_hash is not None
+                else None,
+            )
+
+    def _finish(self, book_id: UUID, processed: ProcessedEpub) -> None:
+        with self._session() as db:
+            # The book may have been deleted in the meantime
+            if (book := db.get(Book, book_id)) is None:
+                return
+
+            book.title = processed.metadata.title
+            book.author = processed.metadata.author
+            book.publisher = processed.metadata.publisher
+            book.isbn = processed.metadata.isbn
+            book.language = processed.metadata.language
+            book.description = processed.metadata.description
+            book.cover_hash = processed.cover_hash
+            book.processing_state = ProcessingState.READY
+            book.processing_error = None
+            record_book_change(db, book.user_id, book.id, BookChangeKind.ADDED)
+            if book.content_hash is not None:
+                record_extraction(
+                    db, book.content_hash, processed.model_dump(mode="json")
+                )
+            db.commit()
+
+    def _fail(self, book_id: UUID, error: str) -> None:
+        with self._session() as db:
+            if (book := db.get(Book, book_id)) is None:
+                return
+
+            book.processing_state = ProcessingState.FAILED
+            book.processing_error = error
+            # Failed books don't keep their file
+            released_file_path = release_blob(db, book)
+            db.commit()
+
+        if released_file_path is not None:
+            self._storage_collector.remove(released_file_path)
+
+    async def _ingest(self, book_id: UUID) -> None:
+        if (started := await run_in_threadpool(self._start, book_id)) is None:
+            return
+
+        file_path, title, processed = started
+        if processed is None:
+            try:
+                async with self._local_copy(file_path) as local_path:
+                    processed = await self._process(local_path, title)
+            except WorkerTimeout:
+                await run_in_threadpool(self._fail, book_id, "Processing took too long")
+                return
+            except Exception as e:
+                await run_in_threadpool(
+                    self._fail, book_id, f"Failed to process EPUB file: {e}"
+                )
+                return
+
+        await run_in_threadpool(self._finish, book_id, processed)
+
+    @contextlib.asynccontextmanager
+    async def _local_copy(self, file_path: str) -> AsyncGenerator[Path]:
+        local_copy = self._storage.local_copy(
+            file_path, Path(self._settings.upload_dir)
+        )
+        path = await run_in_threadpool(local_copy.__enter__)
+        try:
+            yield path
+        finally:
+            await run_in_threadpool(local_copy.__exit__, None, None, None)
+
+    async def _process(self, path: Path, fallback_title: str) -> ProcessedEpub:
+        while True:
+            try:
+                return await self._worker_pool.run(
+                    process_epub, path, self._settings.cover_dir, fallback_title
+                )
+            except WorkerPoolBusy:
+                # Leave room for interactive uploads and try again shortly
+                await asyncio.sleep(1)
+
+    async def _consume(self) -> None:
+        while True:
+            book_id = await self._queue.get()
+
+            try:
+                await self._ingest(book_id)
+            except Exception:
+                logger.exception("Ingesting book %s failed", book_id)
+            finally:
+                self._queue.task_done()
+
+
+def get_ingestion_queue(request: Request) -> IngestionQueue:
+    if hasattr(request.app.state, "ingestion_queue"):
+        return request.app.state.ingestion_queue
+
+    raise ValueError(
+        "ingestion_queue was not found on the app, did the lifecycle event fire?"
+    )
@@ -5,18 +5,52 @@ from fastapi import APIRouter
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from kosync_backend.auth import TokenVerifier
+from kosync_backend.auth_client import AuthClient
 from kosync_backend.client_generator import ClientGenerator
-from kosync_backend.routes import books, sync, download
-from kosync_backend.database import initialise_db
+from kosync_backend.routes import books, devices, metrics, sync, download
+from kosync_backend.database import EngineRegistry, initialise_db
+from kosync_backend.devices import DeviceAuthenticator
+from kosync_backend.ingestion import IngestionQueue
 from kosync_backend.config import get_settings
+from kosync_backend.metrics import MetricsMiddleware
+from kosync_backend.storage import open_storage
+from kosync_backend.storage_gc import StorageCollector
+from kosync_backend.workers import WorkerPool
 
 
 @contextlib.asynccontextmanager
 async def lifespan(app: FastAPI) -> AsyncGenerator[None]:
-    initialise_db(get_settings())
-    with ClientGenerator(get_settings()) as client_generator:
+    settings = get_settings()
+
+    with (
+        EngineRegistry(settings) as engine_registry,
+        ClientGenerator(settings) as client_generator,
+        WorkerPool(settings) as worker_pool,
+        TokenVerifier(settings) as token_verifier,
+        DeviceAuthenticator(settings, engine_registry) as device_authenticator,
+        open_storage(settings) as storage,
+    ):
+        initialise_db(engine_registry.get_engine(), settings)
+
+        app.state.engine_registry = engine_registry
         app.state.client_generator = client_generator
-        yield
+        app.state.worker_pool = worker_pool
+        app.state.token_verifier = token_verifier
+        app.state.device_authenticator = device_authenticator
+        app.state.storage = storage
+
+        async with (
+            AuthClient(settings) as auth_client,
+            StorageCollector(settings, engine_registry, storage) as storage_collector,
+            IngestionQueue(
+                settings, engine_registry, worker_pool, storage, storage_collector
+            ) as ingestion_queue,
+        ):
+            app.state.auth_client = auth_client
+            app.state.storage_collector = storage_collector
+            app.state.ingestion_queue = ingestion_queue
+            yield
 
 
 def get_app() -> FastAPI:
@@ -33,12 +67,18 @@ def get_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Total-Count", "X-Next-Cursor"],
     )
 
+    if get_settings().metrics_enabled:
+        app.add_middleware(MetricsMiddleware)  # type: ignore
+        app.include_router(router=metrics.router)
+
     main_api_router = APIRouter(prefix="/api/v1")
     main_api_router.include_router(books.router)
     main_api_router.include_router(sync.router)
     main_api_router.include_router(download.router)
+    main_api_router.include_router(devices.router)
 
     app.include_router(router=main_api_router)
 
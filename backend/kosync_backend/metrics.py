@@ -0,0 +1,235 @@
+"""
+Prometheus metrics, served at `/metrics`.
+
+Durations are recorded where the work happens: requests by
+`MetricsMiddleware`, database queries by hooks on each engine, Supabase
+calls by the `AuthClient` and jobs such as EPUB processing by the
+`WorkerPool`. The counters the components already keep (connection pools,
+the worker pool, token verification, the auth circuit breaker) are read
+from the app's state by `AppStateCollector` on each scrape.
+
+Metrics are kept per process, so with several server workers each one only
+reports its own share.
+"""
+
+from collections.abc import Iterator
+import time
+
+from prometheus_client import Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, Metric
+from prometheus_client.registry import Collector
+from sqlalchemy import Engine, event
+from starlette.datastructures import State
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+REQUEST_DURATION = Histogram(
+    "kosync_http_request_duration_seconds",
+    "Time until the response was sent, by route template.",
+    ["method", "route", "status"],
+)
+
+DB_QUERY_DURATION = Histogram(
+    "kosync_db_query_duration_seconds",
+    "Time spent executing database statements, by statement type.",
+    ["statement"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+AUTH_PROVIDER_CALL_DURATION = Histogram(
+    "kosync_auth_provider_call_duration_seconds",
+    "Duration of Supabase auth calls, including retries, by outcome.",
+    ["operation", "outcome"],
+)
+
+WORKER_JOB_DURATION = Histogram(
+    "kosync_worker_job_duration_seconds",
+    "Execution time of worker pool jobs, e.g. process_epub.",
+    ["job"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+WORKER_QUEUE_WAIT = Histogram(
+    "kosync_worker_queue_wait_seconds",
+    "Time worker pool jobs waited for a free worker.",
+    ["job"],
+)
+
+UPLOAD_SIZE = Histogram(
+    "kosync_upload_size_bytes",
+    "Size of the uploaded files that were received completely.",
+    buckets=tuple(64 * 1024 * 2**exponent for exponent in range(11)),
+)
+
+CLIENT_BUNDLE_GENERATION_DURATION = Histogram(
+    "kosync_client_bundle_generation_seconds",
+    "Time to build the static client bundle, once, and each device's config.",
+    ["stage"],
+)
+
+SYNC_CHANGES = Histogram(
+    "kosync_sync_changes",
+    "Books returned to devices per sync, by kind of change.",
+    ["kind"],
+    buckets=(0, 1, 5, 10, 50, 100, 500, 1000, 5000),
+)
+
+_STATEMENT_TYPES = frozenset({"SELECT", "INSERT", "UPDATE", "DELETE"})
+
+
+def _statement_type(statement: str) -> str:
+    keyword = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+
+    return keyword if keyword in _STATEMENT_TYPES else "OTHER"
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Record the duration of every statement executed by the engine."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(
+        connection, _cursor, _statement, _parameters, _context, _executemany
+    ) -> None:
+        connection.info["kosync_query_started_at"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(
+        connection, _cursor, statement, _parameters, _context, _executemany
+    ) -> None:
+        if (started_at := connection.info.pop("kosync_query_started_at", None)) is None:
+            return
+
+        DB_QUERY_DURATION.labels(_statement_type(statement)).observe(
+            time.perf_counter() - started_at
+        )
+
+
+class MetricsMiddleware:
+    """
+    Records each request's duration under its route template, such as
+    `/api/v1/books/{book_id}`, to keep the number of series bounded.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Set by the router once a route matched
+            route = scope.get("route")
+            REQUEST_DURATION.labels(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status_code),
+            ).observe(time.perf_counter() - started_at)
+
+
+def _counter(name: str, documentation: str, value: float) -> CounterMetricFamily:
+    return CounterMetricFamily(name, documentation, value=value)
+
+
+def _gauge(name: str, documentation: str, value: float) -> GaugeMetricFamily:
+    return GaugeMetricFamily(name, documentation, value=value)
+
+
+class AppStateCollector(Collector):
+    """Exports the statistics of the components in an app's state."""
+
+    _state: State
+
+    def __init__(self, state: State) -> None:
+        self._state = state
+
+    def collect(self) -> Iterator[Metric]:
+        if hasattr(self._state, "engine_registry"):
+            yield from self._pool_metrics()
+
+        if hasattr(self._state, "worker_pool"):
+            worker_pool = self._state.worker_pool
+            metrics = worker_pool.metrics
+            yield _gauge(
+                "kosync_worker_pool_pending_jobs",
+                "Jobs running or waiting on the worker pool.",
+                worker_pool.pending,
+            )
+            for outcome in ["completed", "failed", "rejected", "timed_out"]:
+                yield _counter(
+                    f"kosync_worker_pool_jobs_{outcome}",
+                    f"Worker pool jobs {outcome.replace('_', ' ')}.",
+                    getattr(metrics, outcome),
+                )
+
+        if hasattr(self._state, "token_verifier"):
+            metrics = self._state.token_verifier.metrics
+            yield _counter(
+                "kosync_token_cache_hits",
+                "Tokens found in the cache.",
+                metrics.cache_hits,
+            )
+            yield _counter(
+                "kosync_token_cache_misses",
+                "Tokens not found in the cache.",
+                metrics.cache_misses,
+            )
+            yield _counter(
+                "kosync_tokens_verified_locally",
+                "Tokens accepted without calling Supabase.",
+                metrics.verified_locally,
+            )
+            yield _counter(
+                "kosync_tokens_rejected_locally",
+                "Tokens rejected without calling Supabase.",
+                metrics.rejected_locally,
+            )
+            yield _counter(
+                "kosync_tokens_verified_remotely",
+                "Tokens sent to Supabase for verification.",
+                metrics.remote_calls,
+            )
+            yield _counter(
+                "kosync_token_remote_verification_failures",
+                "Tokens Supabase rejected or failed to verify.",
+                metrics.remote_failures,
+            )
+
+        if hasattr(self._state, "auth_client"):
+            metrics = self._state.auth_client.circuit_breaker.metrics
+            yield _counter(
+                "kosync_auth_provider_circuit_rejections",
+                "Supabase calls failed fast because the circuit was open.",
+                metrics.rejected,
+            )
+            yield _counter(
+                "kosync_auth_provider_circuit_openings",
+                "Times the Supabase circuit breaker opened.",
+                metrics.opened,
+            )
+
+    def _pool_metrics(self) -> Iterator[Metric]:
+        connections = GaugeMetricFamily(
+            "kosync_db_pool_connections",
+            "Pooled database connections, by state.",
+            labels=["database_url", "state"],
+        )
+        for statistics in self._state.engine_registry.pool_statistics():
+            for state in ["checked_in", "checked_out", "overflow"]:
+                if (value := getattr(statistics, state)) is not None:
+                    connections.add_metric([statistics.database_url, state], value)
+
+        yield connections
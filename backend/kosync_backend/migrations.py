@@ -0,0 +1,167 @@
+"""
+Versioned schema migrations.
+
+`Base.metadata.create_all` only creates missing tables, so changes to
+existing tables are applied here. Every migration runs once, in order, and
+is recorded in the `schema_migrations` table. Fresh databases are created
+with the latest schema and only stamped.
+"""
+
+from collections.abc import Callable
+
+from sqlalchemy import (
+    Column,
+    Connection,
+    DateTime,
+    Integer,
+    MetaData,
+    Table,
+    inspect,
+    select,
+    text,
+)
+from sqlalchemy.sql import func
+
+from kosync_backend.config import Settings
+from kosync_backend.covers import CoverStore
+from kosync_backend.search_index import create_search_index, rebuild_search_index
+
+
+Migration = Callable[[Connection, Settings], None]
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+
+def _column_names(connection: Connection, table_name: str) -> set[str]:
+    return {column["name"] for column in inspect(connection).get_columns(table_name)}
+
+
+def _move_cover_images_to_cover_store(
+    connection: Connection, settings: Settings
+) -> None:
+    columns = _column_names(connection, "books")
+
+    if "cover_hash" not in columns:
+        connection.execute(text("ALTER TABLE books ADD COLUMN cover_hash VARCHAR(64)"))
+
+    if "cover_image" not in columns:
+        return
+
+    cover_store = CoverStore(settings.cover_dir)
+    book_ids = connection.execute(
+        text("SELECT id FROM books WHERE cover_image IS NOT NULL")
+    ).scalars()
+
+    for book_id in list(book_ids):
+        cover_image = connection.execute(
+            text("SELECT cover_image FROM books WHERE id = :id"), {"id": book_id}
+        ).scalar_one()
+        connection.execute(
+            text("UPDATE books SET cover_hash = :cover_hash WHERE id = :id"),
+            {"cover_hash": cover_store.put(cover_image), "id": book_id},
+        )
+
+    connection.execute(text("ALTER TABLE books DROP COLUMN cover_image"))
+
+
+def _add_book_content_hash(connection: Connection, settings: Settings) -> None:
+    if "content_hash" not in _column_names(connection, "books"):
+        connection.execute(
+            text("ALTER TABLE books ADD COLUMN content_hash VARCHAR(64)")
+        )
+
+
+def _add_book_processing_state(connection: Connection, settings: Settings) -> None:
+    columns = _column_names(connection, "books")
+
+    if "processing_state" not in columns:
+        connection.execute(
+            text(
+                "ALTER TABLE books ADD COLUMN processing_state VARCHAR(16)"
+                " NOT NULL DEFAULT 'ready'"
+            )
+        )
+
+    if "processing_error" not in columns:
+        connection.execute(text("ALTER TABLE books ADD COLUMN processing_error TEXT"))
+
+
+def _add_per_user_composite_indexes(connection: Connection, settings: Settings) -> None:
+    # The primary key is already indexed, and user_id leads the new indexes
+    for index in ["ix_books_id", "ix_books_user_id", "ix_synchronisations_user_id"]:
+        connection.execute(text(f"DROP INDEX IF EXISTS {index}"))
+
+    for index, table, columns in [
+        ("ix_books_user_id_upload_date", "books", "user_id, upload_date"),
+        ("ix_books_user_id_id", "books", "user_id, id"),
+        (
+            "ix_synchronisations_user_id_created_at",
+            "synchronisations",
+            "user_id, created_at",
+        ),
+    ]:
+        connection.execute(
+            text(f"CREATE INDEX IF NOT EXISTS {index} ON {table} ({columns})")
+        )
+
+
+def _normalise_sqlite_upload_dates(connection: Connection, settings: Settings) -> None:
+    # CURRENT_TIMESTAMP has no fractional seconds, while bound datetimes do, so
+    # equal upload dates compared unequal as strings
+    if connection.dialect.name == "sqlite":
+        connection.execute(
+            text(
+                "UPDATE books SET upload_date = upload_date || '.000000'"
+                " WHERE length(upload_date) = 19"
+            )
+        )
+
+
+def _add_books_search_index(connection: Connection, settings: Settings) -> None:
+    if connection.dialect.name == "sqlite":
+        create_search_index(connection)
+        rebuild_search_index(connection)
+
+
+def _add_book_content_hash_index(connection: Connection, settings: Settings) -> None:
+    connection.execute(
+        text("CREATE INDEX IF NOT EXISTS ix_books_content_hash ON books (content_hash)")
+    )
+
+
+MIGRATIONS: list[Migration] = [
+    _move_cover_images_to_cover_store,
+    _add_book_content_hash,
+    _add_book_processing_state,
+    _add_per_user_composite_indexes,
+    _normalise_sqlite_upload_dates,
+    _add_books_search_index,
+    _add_book_content_hash_index,
+]
+
+
+def apply_migrations(
+    connection: Connection, settings: Settings, stamp_only: bool = False
+) -> list[int]:
+    """Apply all pending migrations and return the versions that were applied."""
+    schema_migrations.create(connection, checkfirst=True)
+
+    applied = set(connection.execute(select(schema_migrations.c.version)).scalars())
+    pending = [
+        (version, migration)
+        for version, migration in enumerate(MIGRATIONS, start=1)
+        if version not in applied
+    ]
+
+    for version, migration in pending:
+        if not stamp_only:
+            migration(connection, settings)
+
+        connection.execute(schema_migrations.insert().values(version=version))
+
+    return [version for version, _ in pending]
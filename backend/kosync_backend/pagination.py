@@ -0,0 +1,147 @@
+"""
+Keyset pagination of a user's library.
+
+Pages are ordered by the sort column with the book id as tie-breaker, and
+each page starts right after the `(value, id)` of the previous page's last
+book. Unlike an offset, this costs the same on every page and doesn't skip
+or repeat books when others are added or deleted in between.
+"""
+
+import base64
+from datetime import datetime
+from enum import StrEnum
+import json
+from typing import Any
+from uuid import UUID
+
+from pydantic import BaseModel
+from sqlalchemy import ColumnElement, Delete, Select, Update, func, select, tuple_
+from sqlalchemy.orm import InstrumentedAttribute, Session, load_only
+
+from kosync_backend.changes import InvalidCursor
+from kosync_backend.database import Book, ProcessingState
+from kosync_backend.schemas import BOOK_MODEL_COLUMNS, BookModel
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class BookSort(StrEnum):
+    NEWEST = "-upload_date"
+    OLDEST = "upload_date"
+    TITLE = "title"
+    TITLE_DESCENDING = "-title"
+
+    @property
+    def column(self) -> InstrumentedAttribute:
+        return getattr(Book, self.removeprefix("-"))
+
+    @property
+    def descending(self) -> bool:
+        return self.startswith("-")
+
+
+class BookFilters(BaseModel):
+    author: str | None = None
+    language: str | None = None
+    title_prefix: str | None = None
+
+    def apply[S: (Select, Update, Delete)](self, statement: S) -> S:
+        conditions: list[ColumnElement[bool]] = []
+        if self.author is not None:
+            conditions.append(func.lower(Book.author) == self.author.lower())
+
+        if self.language is not None:
+            conditions.append(Book.language == self.language)
+
+        if self.title_prefix:
+            conditions.append(Book.title.startswith(self.title_prefix, autoescape=True))
+
+        # Each of the statements has `where`, but ty checks it against their
+        # common bounds rather than against each constraint
+        return statement.where(*conditions)  # type: ignore
+
+
+class BookPage(BaseModel):
+    books: list[BookModel]
+    total: int
+    next_cursor: str | None = None
+
+
+def encode_book_cursor(sort: BookSort, book: Book) -> str:
+    value = getattr(book, sort.column.key)
+    payload = json.dumps(
+        [
+            str(sort),
+            value.isoformat() if isinstance(value, datetime) else value,
+            book.id.hex,
+        ]
+    )
+
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_book_cursor(sort: BookSort, cursor: str) -> tuple[Any, UUID]:
+    """Return the `(value, id)` to continue after, or raise `InvalidCursor`."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, value, book_id = json.loads(base64.urlsafe_b64decode(padded))
+
+        if cursor_sort != sort:
+            raise ValueError("The cursor belongs to another sort order")
+
+        if sort.column is Book.upload_date:
+            value = datetime.fromisoformat(value)
+        elif not isinstance(value, str):
+            raise ValueError("Invalid sort value")
+
+        return value, UUID(book_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+def book_page(
+    db: Session,
+    user_id: UUID,
+    sort: BookSort = BookSort.NEWEST,
+    filters: BookFilters = BookFilters(),
+    cursor: str | None = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> BookPage:
+    """
+    Return up to `limit` of the user's books, starting after `cursor`. Books
+    that failed to process are left out; they are only reported as jobs.
+    """
+    matching = filters.apply(
+        select(Book).where(
+            Book.user_id == user_id, Book.processing_state != ProcessingState.FAILED
+        )
+    )
+
+    total = db.scalar(
+        matching.with_only_columns(func.count(), maintain_column_froms=True)
+    )
+
+    key = tuple_(sort.column, Book.id)
+    statement = matching.options(load_only(*BOOK_MODEL_COLUMNS)).order_by(
+        *(
+            [sort.column.desc(), Book.id.desc()]
+            if sort.descending
+            else [sort.column, Book.id]
+        )
+    )
+
+    if cursor is not None:
+        after = decode_book_cursor(sort, cursor)
+        statement = statement.where(key < after if sort.descending else key > after)
+
+    books = list(db.scalars(statement.limit(limit + 1)))
+
+    return BookPage(
+        books=[BookModel.from_sqlalchemy_orm(book) for book in books[:limit]],
+        total=total or 0,
+        next_cursor=encode_book_cursor(sort, books[limit - 1])
+        if len(books) > limit
+        else None,
+    )
@@ -0,0 +1,129 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from enum import StrEnum
+import time
+
+from pydantic import BaseModel
+
+
+class CircuitOpen(Exception):
+    """The circuit breaker is open; the call was not attempted."""
+
+    def __init__(self, retry_after_s: float) -> None:
+        super().__init__(f"Service unavailable, retry in {retry_after_s:.0f}s")
+        self.retry_after_s = retry_after_s
+
+
+class CircuitState(StrEnum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreakerMetrics(BaseModel):
+    calls: int = 0
+    failures: int = 0
+    rejected: int = 0
+    opened: int = 0
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing dependency for a while instead of letting requests
+    pile up behind its timeouts.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    fail with `CircuitOpen` for `reset_timeout_s`. Then a single trial call is
+    let through: if it succeeds the circuit closes, otherwise it opens again.
+    """
+
+    metrics: CircuitBreakerMetrics
+
+    def __init__(self, failure_threshold: int, reset_timeout_s: float) -> None:
+        self._failure_threshold = failure_threshold
+        self._reset_timeout_s = reset_timeout_s
+        self._state = CircuitState.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self.metrics = CircuitBreakerMetrics()
+
+    @property
+    def state(self) -> CircuitState:
+        return self._state
+
+    def _before_call(self) -> None:
+        if self._state == CircuitState.CLOSED:
+            return
+
+        retry_after = self._opened_at + self._reset_timeout_s - time.monotonic()
+        if self._state == CircuitState.HALF_OPEN or retry_after > 0:
+            self.metrics.rejected += 1
+            raise CircuitOpen(max(retry_after, 0.0))
+
+        self._state = CircuitState.HALF_OPEN
+
+    def _on_success(self) -> None:
+        self._state = CircuitState.CLOSED
+        self._consecutive_failures = 0
+
+    def _on_failure(self) -> None:
+        self.metrics.failures += 1
+        self._consecutive_failures += 1
+
+        if (
+            self._state == CircuitState.HALF_OPEN
+            or self._consecutive_failures >= self._failure_threshold
+        ):
+            self._state = CircuitState.OPEN
+            self._opened_at = time.monotonic()
+            self.metrics.opened += 1
+
+    async def call[T](
+        self,
+        operation: Callable[[], Awaitable[T]],
+        is_failure: Callable[[Exception], bool] = lambda _: True,
+    ) -> T:
+        """
+        Run `operation` unless the circuit is open. Exceptions for which
+        `is_failure` is False (e.g. a rejected token) still count as a
+        response from the dependency.
+        """
+        self._before_call()
+        self.metrics.calls += 1
+
+        try:
+            result = await operation()
+        except Exception as e:
+            if is_failure(e):
+                self._on_failure()
+            else:
+                self._on_success()
+            raise
+        except BaseException:
+            # Cancelled, so the trial call has to be made by someone else
+            if self._state == CircuitState.HALF_OPEN:
+                self._state = CircuitState.OPEN
+            raise
+
+        self._on_success()
+
+        return result
+
+
+async def retry[T](
+    operation: Callable[[], Awaitable[T]],
+    max_retries: int,
+    backoff_s: float,
+    should_retry: Callable[[Exception], bool],
+) -> T:
+    """Run `operation`, retrying with exponential backoff while `should_retry`."""
+    for attempt in range(max_retries + 1):
+        try:
+            return await operation()
+        except Exception as e:
+            if attempt == max_retries or not should_retry(e):
+                raise
+
+        await asyncio.sleep(backoff_s * 2**attempt)
+
+    raise AssertionError("unreachable")
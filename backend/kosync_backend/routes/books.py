@@ -1,141 +1,558 @@
+import asyncio
 from typing import Annotated
-import os
 from pathlib import Path
 from uuid import UUID, uuid4
 
 from fastapi import (
     APIRouter,
+    BackgroundTasks,
     Depends,
+    Header,
     HTTPException,
+    Query,
     Request,
-    UploadFile,
     status,
 )
+from pydantic import BaseModel
 from sqlalchemy.orm import Session
-from starlette.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
 from starlette.responses import Response
 from starlette.status import HTTP_204_NO_CONTENT
 from supabase_auth import User as SupabaseUser
 
+from kosync_backend.blobs import BlobStore, acquire_blob, blob_file_path, release_blob
+from kosync_backend.bulk import (
+    BookSelection,
+    BulkBookResult,
+    BulkUpdateRequest,
+    delete_books,
+    update_books,
+)
+from kosync_backend.changes import InvalidCursor, record_book_change
 from kosync_backend.config import Settings
 from kosync_backend.config import get_settings
-from kosync_backend.database import Book, UserUploadLimit, get_db
-from kosync_backend.epub import (
-    extract_epub_cover,
-    extract_epub_metadata,
+from kosync_backend.covers import THUMBNAIL_WIDTHS, CoverStore, get_cover_store
+from kosync_backend.delivery import book_file_response
+from kosync_backend.database import (
+    Book,
+    BookChangeKind,
+    ProcessingState,
+    UserUploadLimit,
+    get_db,
+)
+from kosync_backend.ingestion import (
+    IngestionQueue,
+    ProcessedEpub,
+    cached_processed_epub,
+    get_ingestion_queue,
+    process_epub,
+)
+from kosync_backend.pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    BookFilters,
+    BookSort,
+    book_page,
+)
+from kosync_backend.schemas import (
+    BatchUploadResult,
+    BookModel,
+    BookSearchResult,
+    IngestionJob,
+)
+from kosync_backend.search import search_books
+from kosync_backend.storage import Storage, get_storage
+from kosync_backend.storage_gc import StorageCollector, get_storage_collector
+from kosync_backend.uploads import (
+    EPUB_BATCH_UPLOAD_REQUEST_BODY,
+    EPUB_UPLOAD_REQUEST_BODY,
+    StagedUpload,
+    UploadError,
+    UploadTooLarge,
+    stage_uploads,
 )
-from kosync_backend.schemas import BookModel
 from kosync_backend.schemas import BookUpdateRequest
 from kosync_backend.user_middleware import get_current_user_from_jwt
+from kosync_backend.workers import (
+    WorkerPool,
+    WorkerPoolBusy,
+    WorkerTimeout,
+    get_worker_pool,
+)
 
 router = APIRouter(prefix="/books")
 
 
-@router.post("")
+class UploadLimits(BaseModel):
+    existing_books: int
+    max_uploads: int
+    max_file_size_mb: int
+
+
+def get_upload_limits(db: Session, user_id: UUID, settings: Settings) -> UploadLimits:
+    # Failed books don't keep their file, so they don't count
+    existing_books_count = (
+        db.query(Book)
+        .filter(
+            Book.user_id == user_id, Book.processing_state != ProcessingState.FAILED
+        )
+        .count()
+    )
+    upload_limit_record = (
+        db.query(UserUploadLimit).filter(UserUploadLimit.user_id == user_id).first()
+    )
+
+    return UploadLimits(
+        existing_books=existing_books_count,
+        max_uploads=upload_limit_record.allowed_uploads
+        if upload_limit_record is not None
+        and upload_limit_record.allowed_uploads is not None
+        else settings.max_books_per_user,
+        max_file_size_mb=upload_limit_record.max_file_size_mb
+        if upload_limit_record is not None
+        and upload_limit_record.max_file_size_mb is not None
+        else settings.max_file_size_mb,
+    )
+
+
+def _acquire_blob(db: Session, book: Book, processed: ProcessedEpub | None) -> None:
+    # Books are created from a staged upload, which always has a hash and size
+    acquire_blob(
+        db,
+        book.content_hash,  # type: ignore
+        book.file_size,  # type: ignore
+        processed.model_dump(mode="json") if processed is not None else None,
+    )
+
+
+def _save_book(
+    db: Session, book: Book, processed: ProcessedEpub | None = None
+) -> BookModel:
+    # Committing expires the instance, so serialise it before leaving the thread
+    db.add(book)
+    _acquire_blob(db, book, processed)
+    if book.processing_state != ProcessingState.PENDING:
+        record_book_change(db, book.user_id, book.id, BookChangeKind.ADDED)
+    db.commit()
+
+    return BookModel.from_sqlalchemy_orm(book)
+
+
+def _save_books(
+    db: Session, books: list[Book], processed: list[ProcessedEpub]
+) -> list[BookModel]:
+    db.add_all(books)
+    for book, processed_epub in zip(books, processed):
+        _acquire_blob(db, book, processed_epub)
+        record_book_change(db, book.user_id, book.id, BookChangeKind.ADDED)
+    db.commit()
+
+    return [BookModel.from_sqlalchemy_orm(book) for book in books]
+
+
+def _book_from_upload(
+    book_id: UUID,
+    user_id: UUID,
+    upload: StagedUpload,
+    processed: ProcessedEpub,
+) -> Book:
+    return Book(
+        id=book_id,
+        user_id=user_id,
+        title=processed.metadata.title,
+        author=processed.metadata.author,
+        publisher=processed.metadata.publisher,
+        isbn=processed.metadata.isbn,
+        language=processed.metadata.language,
+        description=processed.metadata.description,
+        cover_hash=processed.cover_hash,
+        file_path=blob_file_path(upload.sha256),
+        file_size=upload.size,
+        content_hash=upload.sha256,
+    )
+
+
+@router.post(
+    "",
+    openapi_extra=EPUB_UPLOAD_REQUEST_BODY,
+    responses={status.HTTP_202_ACCEPTED: {"model": IngestionJob}},
+)
 async def upload_book(
     request: Request,
-    file: UploadFile,
+    response: Response,
     db: Annotated[Session, Depends(get_db)],
+    worker_pool: Annotated[WorkerPool, Depends(get_worker_pool)],
+    ingestion_queue: Annotated[IngestionQueue, Depends(get_ingestion_queue)],
+    storage: Annotated[Storage, Depends(get_storage)],
     user: Annotated[SupabaseUser, Depends(get_current_user_from_jwt)],
-) -> BookModel:
-    if not file.filename or not file.filename.lower().endswith(".epub"):
+    background: Annotated[bool, Query()] = False,
+) -> BookModel | IngestionJob:
+    """
+    Upload an EPUB. With `background=true` the request returns `202 Accepted`
+    as soon as the file is stored, and the metadata is extracted afterwards;
+    poll `/books/jobs/{id}` for the result.
+
+    A file that is already stored, by any user, is not stored again, and its
+    metadata and cover are reused instead of being extracted again.
+    """
+    settings = get_settings()
+
+    # Check if user has reached the limit
+    limits = await run_in_threadpool(get_upload_limits, db, UUID(user.id), settings)
+    if limits.existing_books >= limits.max_uploads:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Only EPUB files are allowed",
+            detail=f"Maximum number of books ({limits.max_uploads}) reached",
         )
 
-    settings = get_settings()
-
-    # Check if user has reached the limit
-    existing_books_count = db.query(Book).filter(Book.user_id == UUID(user.id)).count()
-    upload_limit_record = (
-        db.query(UserUploadLimit)
-        .filter(UserUploadLimit.user_id == UUID(user.id))
-        .first()
-    )
-    max_uploads = (
-        upload_limit_record.allowed_uploads
-        if upload_limit_record is not None
-        and upload_limit_record.allowed_uploads is not None
-        else settings.max_books_per_user
-    )
-    if existing_books_count >= max_uploads:
+    # Stream the file to disk, rejecting it as soon as it is too large
+    upload_dir = Path(settings.upload_dir)
+    try:
+        [upload] = await stage_uploads(
+            request, upload_dir, max_file_size=limits.max_file_size_mb * 1024 * 1024
+        )
+    except UploadTooLarge:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Maximum number of books ({max_uploads}) reached",
+            detail=f"File size exceeds maximum limit of {limits.max_file_size_mb}MB",
         )
+    except UploadError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
-    # Check file size
-    content = await file.read()
-    file_size = len(content)
+    book_id = uuid4()
+    blob_store = BlobStore(storage)
 
-    max_file_size_mb = (
-        upload_limit_record.max_file_size_mb
-        if upload_limit_record is not None
-        and upload_limit_record.max_file_size_mb is not None
-        else settings.max_file_size_mb
-    )
-    if file_size > max_file_size_mb * 1024 * 1024:
+    if background:
+        db_book = Book(
+            id=book_id,
+            user_id=UUID(user.id),
+            title=Path(upload.filename).stem,
+            file_path=blob_file_path(upload.sha256),
+            file_size=upload.size,
+            content_hash=upload.sha256,
+            processing_state=ProcessingState.PENDING,
+        )
+        try:
+            await run_in_threadpool(blob_store.put, upload)
+            await run_in_threadpool(_save_book, db, db_book)
+        except Exception as e:
+            upload.discard()
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to store the EPUB file: {str(e)}",
+            )
+        ingestion_queue.enqueue(book_id)
+
+        response.status_code = status.HTTP_202_ACCEPTED
+        return IngestionJob(id=book_id, state=ProcessingState.PENDING)
+
+    try:
+        processed = await run_in_threadpool(cached_processed_epub, db, upload.sha256)
+        if processed is None:
+            processed = await worker_pool.run(
+                process_epub,
+                upload.path,
+                settings.cover_dir,
+                Path(upload.filename).stem,
+            )
+        db_book = _book_from_upload(book_id, UUID(user.id), upload, processed)
+
+        # Stored before the book is committed, so no book is listed without its
+        # file. Should the commit fail, the sweep removes the unreferenced file
+        await run_in_threadpool(blob_store.put, upload)
+        book = await run_in_threadpool(_save_book, db, db_book, processed)
+    except Exception as e:
+        # Clean up the staged file if processing or storing it fails
+        upload.discard()
+
+        if isinstance(e, WorkerPoolBusy):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many uploads are being processed, try again later",
+                headers={"Retry-After": "5"},
+            )
+        if isinstance(e, WorkerTimeout):
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Processing the EPUB file took too long",
+            )
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"File size exceeds maximum limit of {max_file_size_mb}MB",
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to process EPUB file: {str(e)}",
         )
 
-    # Save file to disk
-    upload_dir = settings.upload_dir
-    os.makedirs(upload_dir, exist_ok=True)
+    return book
 
-    book_id = uuid4()
-    file_path = Path(upload_dir) / (file_path_from_storage_root := f"{book_id}.epub")
-    file_path.write_bytes(content)
 
+@router.post("/batch", openapi_extra=EPUB_BATCH_UPLOAD_REQUEST_BODY)
+async def upload_books(
+    request: Request,
+    db: Annotated[Session, Depends(get_db)],
+    worker_pool: Annotated[WorkerPool, Depends(get_worker_pool)],
+    storage: Annotated[Storage, Depends(get_storage)],
+    user: Annotated[SupabaseUser, Depends(get_current_user_from_jwt)],
+) -> list[BatchUploadResult]:
+    """
+    Upload several EPUBs in the `files` field at once. The quota is checked
+    once for the whole batch, the files are processed concurrently and all
+    books are inserted in a single transaction. Every file gets a result, in
+    the order of the upload, so some may fail while the others are created.
+    """
+    settings = get_settings()
+    user_id = UUID(user.id)
+
+    limits = await run_in_threadpool(get_upload_limits, db, user_id, settings)
+    remaining_uploads = limits.max_uploads - limits.existing_books
+    if remaining_uploads <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Maximum number of books ({limits.max_uploads}) reached",
+        )
+
+    max_file_size_error = (
+        f"File size exceeds maximum limit of {limits.max_file_size_mb}MB"
+    )
+    # By position in the request, as files fail at different stages
+    results: dict[int, BatchUploadResult] = {}
+
+    def on_rejected(position: int, filename: str, error: UploadError) -> None:
+        results[position] = BatchUploadResult(
+            filename=filename,
+            success=False,
+            error=max_file_size_error
+            if isinstance(error, UploadTooLarge)
+            else str(error),
+        )
+
+    upload_dir = Path(settings.upload_dir)
     try:
-        book_metadata = extract_epub_metadata(file_path)
+        uploads = await stage_uploads(
+            request,
+            upload_dir,
+            max_file_size=limits.max_file_size_mb * 1024 * 1024,
+            field_name="files",
+            max_files=settings.max_batch_upload_files,
+            on_rejected=on_rejected,
+        )
+    except UploadTooLarge:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=max_file_size_error
+        )
+    except UploadError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    # The staged files take the positions the rejected ones left
+    positions = [
+        position
+        for position in range(len(uploads) + len(results))
+        if position not in results
+    ]
+
+    for position, upload in zip(
+        positions[remaining_uploads:], uploads[remaining_uploads:]
+    ):
+        upload.discard()
+        results[position] = BatchUploadResult(
+            filename=upload.filename,
+            success=False,
+            error=f"Maximum number of books ({limits.max_uploads}) reached",
+        )
+    uploads = uploads[:remaining_uploads]
+
+    cached = await run_in_threadpool(
+        lambda: [cached_processed_epub(db, upload.sha256) for upload in uploads]
+    )
 
-        cover_data = extract_epub_cover(file_path)
+    async def process(
+        upload: StagedUpload, cached_processed: ProcessedEpub | None
+    ) -> ProcessedEpub:
+        if cached_processed is not None:
+            return cached_processed
 
-        db_book = Book(
-            id=book_id,
-            user_id=UUID(user.id),
-            title=book_metadata.title,
-            author=book_metadata.author,
-            publisher=book_metadata.publisher,
-            isbn=book_metadata.isbn,
-            language=book_metadata.language,
-            description=book_metadata.description,
-            cover_image=cover_data,
-            file_path=file_path_from_storage_root,
-            file_size=file_size,
+        return await worker_pool.run(
+            process_epub, upload.path, settings.cover_dir, Path(upload.filename).stem
         )
 
-        db.add(db_book)
-        db.commit()
+    processing_results = await asyncio.gather(
+        *(map(process, uploads, cached)),
+        return_exceptions=True,
+    )
+
+    # The files are stored before the books are committed, as for single uploads
+    blob_store = BlobStore(storage)
+    books: list[tuple[int, StagedUpload, Book, ProcessedEpub]] = []
+    for position, upload, processed in zip(positions, uploads, processing_results):
+        if isinstance(processed, BaseException):
+            upload.discard()
+            results[position] = BatchUploadResult(
+                filename=upload.filename,
+                success=False,
+                error="Too many uploads are being processed, try again later"
+                if isinstance(processed, WorkerPoolBusy)
+                else "Processing the EPUB file took too long"
+                if isinstance(processed, WorkerTimeout)
+                else f"Failed to process EPUB file: {processed}",
+            )
+            continue
+
+        try:
+            await run_in_threadpool(blob_store.put, upload)
+        except Exception as e:
+            upload.discard()
+            results[position] = BatchUploadResult(
+                filename=upload.filename,
+                success=False,
+                error=f"Failed to store the EPUB file: {e}",
+            )
+            continue
+
+        book = _book_from_upload(uuid4(), user_id, upload, processed)
+        books.append((position, upload, book, processed))
 
-        return BookModel.from_sqlalchemy_orm(db_book)
+    try:
+        saved_books = await run_in_threadpool(
+            _save_books,
+            db,
+            [book for _, _, book, _ in books],
+            [processed for _, _, _, processed in books],
+        )
     except Exception as e:
-        # Clean up file if database operation fails
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        # The stored files are unreferenced, and left to the sweep
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to process EPUB file: {str(e)}",
+            detail=f"Failed to save the uploaded books: {str(e)}",
         )
 
+    for (position, upload, _, _), book in zip(books, saved_books):
+        results[position] = BatchUploadResult(
+            filename=upload.filename, success=True, book=book
+        )
+
+    return [results[position] for position in sorted(results)]
+
+
+@router.get("/jobs")
+def get_ingestion_jobs(
+    ids: Annotated[list[UUID], Query(alias="id", max_length=100)],
+    db: Annotated[Session, Depends(get_db)],
+    user: Annotated[SupabaseUser, Depends(get_current_user_from_jwt)],
+) -> list[IngestionJob]:
+    books = db.query(Book).filter(Book.id.in_(ids), Book.user_id == UUID(user.id)).all()
+
+    return [IngestionJob.from_sqlalchemy_orm(book) for book in books]
+
+
+@router.get("/jobs/{job_id}")
+def get_ingestion_job(
+    job_id: UUID,
+    db: Annotated[Session, Depends(get_db)],
+    user: Annotated[SupabaseUser, Depends(get_current_user_from_jwt)],
+) -> IngestionJob:
+    book = (
+        db.query(Book).filter(Book.id == job_id, Book.user_id == UUID(user.id)).first()
+    )
+
+    if book is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Job not found"
+        )
+
+    return IngestionJob.from_sqlalchemy_orm(book)
+
 
 @router.get("")
 def get_user_books(
+    response: Response,
     db: Annotated[Session, Depends(get_db)],
     user: Annotated[SupabaseUser, Depends(get_current_user_from_jwt)],
+    sort: BookSort = BookSort.NEWEST,
+    cursor: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    author: str | None = None,
+    language: str | None = None,
+    title_prefix: str | None = None,
 ) -> list[BookModel]:
-    books = db.query(Book).filter(Book.user_id == UUID(user.id)).all()
+    """
+    A page of the user's books. The total number of matching books is in
+    `X-Total-Count`; while there are more, pass `X-Next-Cursor` as `cursor`
+    with the same sort and filters to get the next page.
+    """
+    try:
+        page = book_page(
+            db,
+            UUID(user.id),
+            sort,
+            BookFilters(author=author, language=language, title_prefix=title_prefix),
+            cursor,
+            limit,
+        )
+    except InvalidCursor:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid page cursor"
+        )
 
-    return [BookModel.from_sqlalchemy_orm(book) for book in books]
+    response.headers["X-Total-Count"] = str(page.total)
+    if page.next_cursor is not None:
+        response.headers["X-Next-Cursor"] = page.next_cursor
+
+    return page.books
+
+
+@router.get("/search")
+def search_user_books(
+    db: Annotated[Session, Depends(get_db)],
+    user: Annotated[SupabaseUser, Depends(get_current_user_from_jwt)],
+    q: Annotated[str, Query(min_length=1, max_length=200)],
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+) -> list[BookSearchResult]:
+    """
+    Books whose title, author, publisher or description contain words
+    starting with every word of `q`, best matches first. `snippet` is HTML
+    whose only elements are the `<mark>`s around the matched words.
+    """
+    return search_books(db, UUID(user.id), q, limit)
+
+
+@router.post("/bulk-delete")
+def bulk_delete_books(
+    selection: BookSelection,
+    background_tasks: BackgroundTasks,
+    db: Annotated[Session, Depends(get_db)],
+    storage_collector: Annotated[StorageCollector, Depends(get_storage_collector)],
+    user: Annotated[SupabaseUser, Depends(get_current_user_from_jwt)],
+) -> list[BulkBookResult]:
+    """
+    Delete the books with the given `ids`, or every book matching `filter`,
+    in a single transaction. Ids that aren't the user's books fail with
+    "Book not found".
+    """
+    results, released_file_paths = delete_books(db, UUID(user.id), selection)
+
+    if released_file_paths:
+        background_tasks.add_task(storage_collector.remove, *released_file_paths)
+
+    return results
+
+
+@router.post("/bulk-update")
+def bulk_update_books(
+    request: BulkUpdateRequest,
+    db: Annotated[Session, Depends(get_db)],
+    user: Annotated[SupabaseUser, Depends(get_current_user_from_jwt)],
+) -> list[BulkBookResult]:
+    """
+    Apply `changes` to the books with the given `ids`, or every book matching
+    `filter`, in a single transaction. Fields left out of `changes` are kept.
+    """
+    return update_books(db, UUID(user.id), request)
 
 
 @router.delete("/{book_id}")
 def delete_book(
     book_id: UUID,
+    background_tasks: BackgroundTasks,
     db: Annotated[Session, Depends(get_db)],
+    storage_collector: Annotated[StorageCollector, Depends(get_storage_collector)],
     user: Annotated[SupabaseUser, Depends(get_current_user_from_jwt)],
 ) -> Response:
     book = (
@@ -147,14 +564,17 @@ def delete_book(
             status_code=status.HTTP_404_NOT_FOUND, detail="Book not found"
         )
 
-    # Delete file from disk
-    if os.path.exists(book.file_path):
-        os.remove(book.file_path)
-
-    # Delete from database
+    if book.processing_state == ProcessingState.READY:
+        record_book_change(db, book.user_id, book.id, BookChangeKind.REMOVED)
     db.delete(book)
+    # Other books may share the file
+    released_file_path = release_blob(db, book)
     db.commit()
 
+    # Only once the book is gone, and after responding
+    if released_file_path is not None:
+        background_tasks.add_task(storage_collector.remove, released_file_path)
+
     return Response(status_code=HTTP_204_NO_CONTENT)
 
 
@@ -200,6 +620,8 @@ def update_book(
     book.author = request.author
     book.description = request.description
 
+    if book.processing_state == ProcessingState.READY:
+        record_book_change(db, book.user_id, book.id, BookChangeKind.UPDATED)
     db.commit()
 
     return BookModel.from_sqlalchemy_orm(book)
@@ -208,17 +630,63 @@ def update_book(
 @router.get("/{book_id}/download")
 async def download(
     book_id: UUID,
+    request: Request,
     db: Annotated[Session, Depends(get_db)],
     settings: Annotated[Settings, Depends(get_settings)],
+    storage: Annotated[Storage, Depends(get_storage)],
     user: Annotated[SupabaseUser, Depends(get_current_user_from_jwt)],
 ) -> Response:
-    book = (
-        db.query(Book).filter(Book.id == book_id, Book.user_id == UUID(user.id)).first()
+    return await run_in_threadpool(
+        book_file_response, db, settings, storage, UUID(user.id), book_id, request
     )
 
-    if book is None:
-        return Response(status_code=status.HTTP_404_NOT_FOUND)
 
-    path = Path(settings.upload_dir) / book.file_path
+@router.get("/{book_id}/cover")
+def get_cover(
+    book_id: UUID,
+    db: Annotated[Session, Depends(get_db)],
+    cover_store: Annotated[CoverStore, Depends(get_cover_store)],
+    user: Annotated[SupabaseUser, Depends(get_current_user_from_jwt)],
+    width: Annotated[int | None, Query()] = None,
+    version: Annotated[str | None, Query(alias="v")] = None,
+    if_none_match: Annotated[str | None, Header()] = None,
+) -> Response:
+    """
+    Serve the cover of a book, optionally resized to one of `THUMBNAIL_WIDTHS`.
+
+    Clients that pass the book's `cover_hash` as `v` get an immutable
+    response; otherwise the response must be revalidated using its ETag.
+    """
+    if width is not None and width not in THUMBNAIL_WIDTHS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Width must be one of {', '.join(map(str, THUMBNAIL_WIDTHS))}",
+        )
+
+    cover_hash = (
+        db.query(Book.cover_hash)
+        .filter(Book.id == book_id, Book.user_id == UUID(user.id))
+        .scalar()
+    )
+
+    if cover_hash is None or not cover_store.exists(cover_hash):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Cover not found"
+        )
+
+    etag = f'"{cover_hash}"' if width is None else f'"{cover_hash}-{width}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, max-age=31536000, immutable"
+        if version == cover_hash
+        else "private, no-cache",
+    }
+
+    if if_none_match is not None and etag in (
+        tag.strip() for tag in if_none_match.split(",")
+    ):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    content, media_type = cover_store.get(cover_hash, width)
 
-    return FileResponse(path)
+    return Response(content=content, media_type=media_type, headers=headers)
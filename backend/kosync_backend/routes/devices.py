@@ -0,0 +1,43 @@
+from typing import Annotated
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from starlette.status import HTTP_204_NO_CONTENT
+from supabase_auth import User as SupabaseUser
+
+from kosync_backend.devices import DeviceAuthenticator, get_device_authenticator
+from kosync_backend.schemas import DeviceModel
+from kosync_backend.user_middleware import get_current_user_from_jwt
+
+router = APIRouter(prefix="/devices")
+
+
+@router.get("")
+def get_user_devices(
+    device_authenticator: Annotated[
+        DeviceAuthenticator, Depends(get_device_authenticator)
+    ],
+    user: Annotated[SupabaseUser, Depends(get_current_user_from_jwt)],
+) -> list[DeviceModel]:
+    """List the devices a client was generated for, including revoked ones."""
+    return [
+        DeviceModel.from_sqlalchemy_orm(credential)
+        for credential in device_authenticator.list(UUID(user.id))
+    ]
+
+
+@router.delete("/{device_id}")
+def revoke_device(
+    device_id: UUID,
+    device_authenticator: Annotated[
+        DeviceAuthenticator, Depends(get_device_authenticator)
+    ],
+    user: Annotated[SupabaseUser, Depends(get_current_user_from_jwt)],
+) -> Response:
+    """Revoke a device's token. The device has to download a new client to sync again."""
+    if not device_authenticator.revoke(UUID(user.id), device_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Device not found"
+        )
+
+    return Response(status_code=HTTP_204_NO_CONTENT)
@@ -1,9 +1,12 @@
 from typing import Annotated
+from uuid import UUID
+
 from fastapi import APIRouter, Depends
-from fastapi.responses import FileResponse
+from fastapi.responses import StreamingResponse
 from supabase_auth import User as SupabaseUser
 
 from kosync_backend.client_generator import ClientGenerator, get_client_generator
+from kosync_backend.devices import DeviceAuthenticator, get_device_authenticator
 from kosync_backend.user_middleware import get_current_user_from_jwt
 
 router = APIRouter(prefix="/download")
@@ -12,8 +15,17 @@ router = APIRouter(prefix="/download")
 @router.get("")
 def download(
     client_generator: Annotated[ClientGenerator, Depends(get_client_generator)],
+    device_authenticator: Annotated[
+        DeviceAuthenticator, Depends(get_device_authenticator)
+    ],
     user: Annotated[SupabaseUser, Depends(get_current_user_from_jwt)],
-) -> FileResponse:
-    return FileResponse(
-        path=client_generator.generate(user.id), filename="KoboRoot.tgz"
+) -> StreamingResponse:
+    # Every generated client gets its own credential, so it can be revoked
+    # alone. Those of clients that are never installed expire
+    _, token = device_authenticator.issue(UUID(user.id))
+
+    return StreamingResponse(
+        client_generator.generate(token),
+        media_type="application/gzip",
+        headers={"Content-Disposition": 'attachment; filename="KoboRoot.tgz"'},
     )
@@ -0,0 +1,40 @@
+import secrets
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    generate_latest,
+)
+
+from kosync_backend.config import Settings, get_settings
+from kosync_backend.metrics import AppStateCollector
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+def metrics(
+    request: Request,
+    settings: Annotated[Settings, Depends(get_settings)],
+    authorization: Annotated[str | None, Header()] = None,
+) -> Response:
+    """The process-wide metrics followed by this app's component statistics."""
+    if settings.metrics_token and not secrets.compare_digest(
+        (authorization or "").encode(), f"Bearer {settings.metrics_token}".encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid metrics token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    app_registry = CollectorRegistry(auto_describe=False)
+    app_registry.register(AppStateCollector(request.app.state))
+
+    return Response(
+        content=generate_latest(REGISTRY) + generate_latest(app_registry),
+        media_type=CONTENT_TYPE_LATEST,
+    )
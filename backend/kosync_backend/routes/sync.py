@@ -1,17 +1,35 @@
 from typing import Annotated
-from pathlib import Path
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, Response, status
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from pydantic import BaseModel, RootModel, UUID4
-from sqlalchemy.orm import Session
-
-from kosync_backend.database import Book, Synchronisation, get_db
+from sqlalchemy import select
+from sqlalchemy.orm import Session, load_only
+from starlette.concurrency import run_in_threadpool
+
+from kosync_backend.changes import (
+    BookChanges,
+    BookTombstone,
+    InvalidCursor,
+    changes_since,
+    decode_cursor,
+    encode_cursor,
+    latest_seq,
+)
+from kosync_backend.database import (
+    Book,
+    ProcessingState,
+    Synchronisation,
+    get_db,
+)
 from kosync_backend.config import Settings
 from kosync_backend.config import get_settings
-from kosync_backend.user_middleware import get_current_user_from_id
-from supabase_auth import User as SupabaseUser
+from kosync_backend.delivery import book_file_response
+from kosync_backend.devices import Device
+from kosync_backend.metrics import SYNC_CHANGES
+from kosync_backend.schemas import BOOK_MODEL_COLUMNS, BookModel
+from kosync_backend.storage import Storage, get_storage
+from kosync_backend.user_middleware import get_current_device
 
 router = APIRouter(prefix="/sync")
 
@@ -27,55 +45,142 @@ class BookToSynchronise(BaseModel):
 SynchroniseResponse = RootModel[list[BookToSynchronise]]
 
 
+class SynchroniseChangesRequest(BaseModel):
+    cursor: str | None = None
+
+
+class SynchroniseChangesResponse(BaseModel):
+    cursor: str
+    added: list[BookToSynchronise] = []
+    updated: list[BookModel] = []
+    removed: list[BookTombstone] = []
+    has_more: bool = False
+
+
+def _download_url(settings: Settings, book_id: UUID) -> str:
+    return f"{settings.base_url.rstrip('/')}/api/v1/sync/books/{book_id}/download"
+
+
 @router.post("/", response_model=SynchroniseResponse)
 async def synchronise(
     db: Annotated[Session, Depends(get_db)],
     settings: Annotated[Settings, Depends(get_settings)],
-    user: Annotated[SupabaseUser, Depends(get_current_user_from_id)],
+    device: Annotated[Device, Depends(get_current_device)],
     request: SynchroniseRequest = SynchroniseRequest([]),
 ) -> SynchroniseResponse:
     """Given the list of ebooks on the client, determine which new books should be downloaded."""
-    available_books = db.query(Book).filter(Book.user_id == UUID(user.id)).all()
-
-    missing_books = set(str(b.id) for b in available_books) - set(
-        str(b) for b in request.root
-    )
+    available_book_ids = db.scalars(
+        select(Book.id).where(
+            Book.user_id == device.user_id,
+            Book.processing_state == ProcessingState.READY,
+        )
+    ).all()
 
-    missing_books = [b for b in available_books if str(b.id) in missing_books]
+    books_on_device = set(request.root)
+    missing_book_ids = [
+        book_id for book_id in available_book_ids if book_id not in books_on_device
+    ]
 
     db.add(
         Synchronisation(
-            user_id=UUID(user.id),
-            book_ids=[str(book.id) for book in missing_books],
+            user_id=device.user_id,
+            book_ids=[str(book_id) for book_id in missing_book_ids],
         )
     )
     db.commit()
+    SYNC_CHANGES.labels("added").observe(len(missing_book_ids))
 
     return SynchroniseResponse(
         [
-            BookToSynchronise(
-                id=book.id,
-                url=f"{settings.base_url.rstrip('/')}/api/v1/sync/books/{book.id}/download",
-            )
-            for book in missing_books
+            BookToSynchronise(id=book_id, url=_download_url(settings, book_id))
+            for book_id in missing_book_ids
         ]
     )
 
 
+@router.post("/changes")
+def synchronise_changes(
+    db: Annotated[Session, Depends(get_db)],
+    settings: Annotated[Settings, Depends(get_settings)],
+    device: Annotated[Device, Depends(get_current_device)],
+    request: SynchroniseChangesRequest = SynchroniseChangesRequest(),
+) -> SynchroniseChangesResponse:
+    """
+    Cursor-based sync. Without a cursor, the whole library is returned as
+    added; afterwards, pass the returned cursor to get only what changed
+    since: books to download, the current metadata of edited books and
+    tombstones for deleted ones. While `has_more` is set, sync again
+    straight away.
+    """
+    if request.cursor is None:
+        # Read the position first, so changes made meanwhile are replayed later
+        changes = BookChanges(seq=latest_seq(db))
+        changes.added = list(
+            db.scalars(
+                select(Book.id).where(
+                    Book.user_id == device.user_id,
+                    Book.processing_state == ProcessingState.READY,
+                )
+            )
+        )
+    else:
+        try:
+            seq = decode_cursor(request.cursor)
+        except InvalidCursor:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid sync cursor"
+            )
+
+        changes = changes_since(db, device.user_id, seq, settings.sync_max_changes)
+
+    # A book edited and then deleted in a later page has no metadata left
+    updated_books = {
+        book.id: BookModel.from_sqlalchemy_orm(book)
+        for book in db.scalars(
+            select(Book)
+            .options(load_only(*BOOK_MODEL_COLUMNS))
+            .where(Book.user_id == device.user_id, Book.id.in_(changes.updated))
+        )
+    }
+
+    if changes.added:
+        db.add(
+            Synchronisation(
+                user_id=device.user_id,
+                book_ids=[str(book_id) for book_id in changes.added],
+            )
+        )
+        db.commit()
+
+    SYNC_CHANGES.labels("added").observe(len(changes.added))
+    SYNC_CHANGES.labels("updated").observe(len(updated_books))
+    SYNC_CHANGES.labels("removed").observe(len(changes.removed))
+
+    return SynchroniseChangesResponse(
+        cursor=encode_cursor(changes.seq),
+        added=[
+            BookToSynchronise(id=book_id, url=_download_url(settings, book_id))
+            for book_id in changes.added
+        ],
+        updated=[
+            updated_books[book_id]
+            for book_id in changes.updated
+            if book_id in updated_books
+        ],
+        removed=changes.removed,
+        has_more=changes.has_more,
+    )
+
+
 @router.get("/books/{book_id}/download")
 async def download(
     book_id: UUID4,
+    request: Request,
     db: Annotated[Session, Depends(get_db)],
     settings: Annotated[Settings, Depends(get_settings)],
-    user: Annotated[SupabaseUser, Depends(get_current_user_from_id)],
+    storage: Annotated[Storage, Depends(get_storage)],
+    device: Annotated[Device, Depends(get_current_device)],
 ) -> Response:
-    book = (
-        db.query(Book).filter(Book.id == book_id, Book.user_id == UUID(user.id)).first()
+    return await run_in_threadpool(
+        book_file_response, db, settings, storage, device.user_id, book_id, request
     )
-
-    if book is None:
-        return Response(status_code=status.HTTP_404_NOT_FOUND)
-
-    path = Path(settings.upload_dir) / book.file_path
-
-    return FileResponse(path)
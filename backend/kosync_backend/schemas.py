@@ -1,9 +1,10 @@
-import base64
 from pydantic import UUID4, BaseModel, ConfigDict
 from typing import Optional
 from datetime import datetime
 
 from kosync_backend.database import Book as ORMBook
+from kosync_backend.database import DeviceCredential as ORMDeviceCredential
+from kosync_backend.database import ProcessingState
 
 
 class UserBase(BaseModel):
@@ -40,7 +41,8 @@ class BookModel(BaseModel):
     language: Optional[str] = None
     description: Optional[str] = None
     upload_date: datetime
-    cover_image_base64: Optional[str] = None
+    cover_hash: Optional[str] = None
+    processing_state: ProcessingState = ProcessingState.READY
 
     model_config = ConfigDict(from_attributes=True)
 
@@ -55,13 +57,78 @@ class BookModel(BaseModel):
             language=orm_book.language,
             upload_date=orm_book.upload_date,
             description=orm_book.description,
-            cover_image_base64=base64.b64encode(orm_book.cover_image).decode()
-            if orm_book.cover_image
-            else None,
+            cover_hash=orm_book.cover_hash,
+            processing_state=ProcessingState(orm_book.processing_state),
         )
 
 
+# The columns `BookModel.from_sqlalchemy_orm` reads, for use with `load_only`
+BOOK_MODEL_COLUMNS = (
+    ORMBook.id,
+    ORMBook.title,
+    ORMBook.author,
+    ORMBook.publisher,
+    ORMBook.isbn,
+    ORMBook.language,
+    ORMBook.description,
+    ORMBook.upload_date,
+    ORMBook.cover_hash,
+    ORMBook.processing_state,
+)
+
+
 class BookUpdateRequest(BaseModel):
     title: str
     author: str
     description: str
+
+
+class IngestionJob(BaseModel):
+    id: UUID4
+    state: ProcessingState
+    error: Optional[str] = None
+    book: Optional[BookModel] = None
+
+    @classmethod
+    def from_sqlalchemy_orm(cls, orm_book: ORMBook) -> "IngestionJob":  # type: ignore
+        return cls(
+            id=orm_book.id,  # type: ignore
+            state=ProcessingState(orm_book.processing_state),
+            error=orm_book.processing_error,
+            book=BookModel.from_sqlalchemy_orm(orm_book)
+            if orm_book.processing_state == ProcessingState.READY
+            else None,
+        )
+
+
+class BatchUploadResult(BaseModel):
+    filename: str
+    success: bool
+    book: Optional[BookModel] = None
+    error: Optional[str] = None
+
+
+class BookSearchResult(BaseModel):
+    book: BookModel
+    # Higher is better. Only set, like the snippet, when searching with FTS5
+    rank: Optional[float] = None
+    snippet: Optional[str] = None
+
+
+class DeviceModel(BaseModel):
+    id: UUID4
+    created_at: datetime
+    last_used_at: Optional[datetime] = None
+    revoked_at: Optional[datetime] = None
+
+    @classmethod
+    def from_sqlalchemy_orm(
+        cls,
+        orm_device_credential: ORMDeviceCredential,  # type: ignore
+    ) -> "DeviceModel":
+        return cls(
+            id=orm_device_credential.id,  # type: ignore
+            created_at=orm_device_credential.created_at,
+            last_used_at=orm_device_credential.last_used_at,
+            revoked_at=orm_device_credential.revoked_at,
+        )
@@ -0,0 +1,125 @@
+"""
+Full-text search over a user's library.
+
+On SQLite this queries the FTS5 index from `search_index`, ranked with bm25
+and with a highlighted snippet of the best matching column. Other databases
+fall back to matching every word with LIKE, without ranking or snippets.
+
+Snippets are HTML in which only the `<mark>` elements are markup. The
+columns are plain text, except descriptions, which often carry the EPUB's
+HTML, so tags are stripped and everything else is escaped.
+"""
+
+import html
+import re
+from uuid import UUID
+
+from sqlalchemy import and_, func, literal_column, or_, select
+from sqlalchemy.orm import Session, load_only
+
+from kosync_backend.database import Book, ProcessingState
+from kosync_backend.schemas import BOOK_MODEL_COLUMNS, BookModel, BookSearchResult
+from kosync_backend.search_index import COLUMN_WEIGHTS, books_fts
+
+
+SNIPPET_START = "<mark>"
+SNIPPET_END = "</mark>"
+
+# Marks the matches in FTS5's snippet, as they can't occur in the text
+_MATCH_START = "\x02"
+_MATCH_END = "\x03"
+
+# Whole tags, and those cut off at either end of the snippet
+_TAG = re.compile(r"<[^<>]*>|^[^<>]*>|<[^<>]*$")
+
+_SEARCHED_COLUMNS = (Book.title, Book.author, Book.publisher, Book.description)
+
+# The characters the unicode61 tokenizer splits words on
+_WORD = re.compile(r"[^\W_]+")
+
+
+def search_terms(query: str) -> list[str]:
+    return _WORD.findall(query)
+
+
+def fts_query(terms: list[str]) -> str:
+    """
+    Every term as a prefix, so results narrow down while typing. Quoting
+    keeps FTS5 operators in user input from being interpreted.
+    """
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def snippet_html(text: str) -> str:
+    text = " ".join(html.unescape(_TAG.sub(" ", text)).split())
+    text = html.escape(text, quote=False)
+
+    return text.replace(_MATCH_START, SNIPPET_START).replace(_MATCH_END, SNIPPET_END)
+
+
+def search_books(
+    db: Session, user_id: UUID, query: str, limit: int
+) -> list[BookSearchResult]:
+    if not (terms := search_terms(query)):
+        return []
+
+    if db.get_bind().dialect.name != "sqlite":
+        return search_books_like(db, user_id, terms, limit)
+
+    rank = func.bm25(literal_column(books_fts.name), *COLUMN_WEIGHTS)
+    snippet = func.snippet(
+        literal_column(books_fts.name), -1, _MATCH_START, _MATCH_END, "…", 16
+    )
+    rows = db.execute(
+        select(Book, rank, snippet)
+        .options(load_only(*BOOK_MODEL_COLUMNS))
+        .join(books_fts, books_fts.c.rowid == literal_column("books.rowid"))
+        .where(
+            books_fts.c.books_fts.op("MATCH")(fts_query(terms)),
+            Book.user_id == user_id,
+            Book.processing_state != ProcessingState.FAILED,
+        )
+        .order_by(rank)
+        .limit(limit)
+    )
+
+    return [
+        # bm25 is lower for better matches
+        BookSearchResult(
+            book=BookModel.from_sqlalchemy_orm(book),
+            rank=-score,
+            snippet=snippet_html(text) if text is not None else None,
+        )
+        for book, score, text in rows
+    ]
+
+
+def search_books_like(
+    db: Session, user_id: UUID, terms: list[str], limit: int
+) -> list[BookSearchResult]:
+    """Books containing every term in one of the searched columns, newest first."""
+    books = db.scalars(
+        select(Book)
+        .options(load_only(*BOOK_MODEL_COLUMNS))
+        .where(
+            Book.user_id == user_id,
+            Book.processing_state != ProcessingState.FAILED,
+            and_(
+                *(
+                    or_(
+                        *(
+                            column.icontains(term, autoescape=True)
+                            for column in _SEARCHED_COLUMNS
+                        )
+                    )
+                    for term in terms
+                )
+            ),
+        )
+        .order_by(Book.upload_date.desc())
+        .limit(limit)
+    )
+
+    return [
+        BookSearchResult(book=BookModel.from_sqlalchemy_orm(book)) for book in books
+    ]
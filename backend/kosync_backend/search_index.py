@@ -0,0 +1,62 @@
+"""
+SQLite FTS5 index over the books' metadata.
+
+`books_fts` is an external-content table: it stores only the index and
+reads the text from `books`, matched on rowid. Triggers keep it in sync
+with every insert, update and delete, whichever code path makes them.
+`VACUUM` may renumber the rowids of `books`, so run `rebuild_search_index`
+after it.
+"""
+
+from sqlalchemy import Column, Connection, Integer, MetaData, Table, Text, text
+
+
+# Not part of `Base.metadata`, so `create_all` leaves it alone
+books_fts = Table(
+    "books_fts",
+    MetaData(),
+    Column("rowid", Integer, primary_key=True),
+    Column("books_fts", Text),
+    Column("title", Text),
+    Column("author", Text),
+    Column("publisher", Text),
+    Column("description", Text),
+)
+
+# The bm25 weights of the columns above, so title matches rank first
+COLUMN_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+
+_COLUMNS = "title, author, publisher, description"
+
+BOOKS_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5("
+    f"{_COLUMNS}, content='books', content_rowid='rowid',"
+    " tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN"
+    f" INSERT INTO books_fts (rowid, {_COLUMNS})"
+    " VALUES (new.rowid, new.title, new.author, new.publisher, new.description);"
+    " END",
+    "CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN"
+    f" INSERT INTO books_fts (books_fts, rowid, {_COLUMNS})"
+    " VALUES ('delete', old.rowid, old.title, old.author, old.publisher,"
+    " old.description);"
+    " END",
+    f"CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE OF {_COLUMNS}"
+    " ON books BEGIN"
+    f" INSERT INTO books_fts (books_fts, rowid, {_COLUMNS})"
+    " VALUES ('delete', old.rowid, old.title, old.author, old.publisher,"
+    " old.description);"
+    f" INSERT INTO books_fts (rowid, {_COLUMNS})"
+    " VALUES (new.rowid, new.title, new.author, new.publisher, new.description);"
+    " END",
+]
+
+
+def create_search_index(connection: Connection) -> None:
+    for statement in BOOKS_FTS_DDL:
+        connection.execute(text(statement))
+
+
+def rebuild_search_index(connection: Connection) -> None:
+    """Re-index every book, e.g. after a `VACUUM`."""
+    connection.execute(text("INSERT INTO books_fts (books_fts) VALUES ('rebuild')"))
@@ -0,0 +1,277 @@
+"""
+Where uploaded book files are kept.
+
+`FileSystemStorage` keeps them in `upload_dir`, which ties the backend to a
+single node. `S3Storage` keeps them in a bucket of any S3-compatible service
+(AWS, MinIO, ...), so several replicas can share a library and devices can
+download from presigned URLs; it needs the `s3` extra. Keys are the
+`Book.file_path` values.
+
+Uploads are still staged in `upload_dir` with either backend, and EPUBs are
+processed from there.
+"""
+
+from abc import ABC, abstractmethod
+from collections.abc import Generator, Iterator
+import contextlib
+import os
+from pathlib import Path
+import shutil
+from tempfile import NamedTemporaryFile
+from typing import Any, Self
+
+from fastapi import Request
+from pydantic import BaseModel
+
+from kosync_backend.config import Settings
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+class StoredObject(BaseModel):
+    key: str
+    size: int
+    # POSIX timestamp
+    modified_at: float
+
+
+class Storage(ABC):
+    """Storage of files by key, with streaming reads and writes."""
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        pass
+
+    @abstractmethod
+    def put(self, key: str, source: Path, content_type: str) -> None:
+        """Store the local file `source` under `key`, consuming the file."""
+
+    @abstractmethod
+    def get_range(self, key: str, start: int, end: int | None) -> Iterator[bytes]:
+        """Stream the bytes from `start` up to, but excluding, `end`."""
+
+    def get(self, key: str) -> Iterator[bytes]:
+        return self.get_range(key, 0, None)
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Delete the file, if it exists."""
+
+    @abstractmethod
+    def stat(self, key: str) -> StoredObject | None:
+        """The file's size and modification time, or None if it doesn't exist."""
+
+    @abstractmethod
+    def list_objects(self) -> Iterator[StoredObject]:
+        """Every stored file, lazily."""
+
+    def presigned_url(self, key: str, expires_in_s: int) -> str | None:
+        """
+        A URL clients can download the file from directly for a while, if the
+        backend can issue one.
+        """
+        return None
+
+    def local_path(self, key: str) -> Path | None:
+        """The file's path, if it is on the local filesystem."""
+        return None
+
+    @contextlib.contextmanager
+    def local_copy(self, key: str, scratch_directory: Path) -> Generator[Path]:
+        """The file on the local filesystem, downloaded for the duration if needed."""
+        if (path := self.local_path(key)) is not None:
+            yield path
+            return
+
+        scratch_directory.mkdir(parents=True, exist_ok=True)
+        with NamedTemporaryFile(
+            dir=scratch_directory, prefix=".download-", suffix=Path(key).suffix
+        ) as file:
+            for chunk in self.get(key):
+                file.write(chunk)
+            file.flush()
+
+            yield Path(file.name)
+
+
+class FileSystemStorage(Storage):
+    root_directory: Path
+
+    def __init__(self, root_directory: str | Path) -> None:
+        self.root_directory = Path(root_directory)
+
+    def _path(self, key: str) -> Path:
+        return self.root_directory / key
+
+    def put(self, key: str, source: Path, content_type: str) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        try:
+            os.replace(source, path)
+        except OSError:
+            # Staged on another filesystem
+            shutil.move(source, path)
+
+    def get_range(self, key: str, start: int, end: int | None) -> Iterator[bytes]:
+        with open(self._path(key), "rb") as file:
+            file.seek(start)
+            remaining = None if end is None else end - start
+
+            while remaining is None or remaining > 0:
+                chunk = file.read(
+                    CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining)
+                )
+                if not chunk:
+                    return
+
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, key: str) -> None:
+        self._path(key).unlink(missing_ok=True)
+
+    def stat(self, key: str) -> StoredObject | None:
+        try:
+            stat_result = os.stat(self._path(key))
+        except FileNotFoundError:
+            return None
+
+        return StoredObject(
+            key=key, size=stat_result.st_size, modified_at=stat_result.st_mtime
+        )
+
+    def list_objects(self) -> Iterator[StoredObject]:
+        try:
+            entries = os.scandir(self.root_directory)
+        except FileNotFoundError:
+            return
+
+        with entries:
+            for entry in entries:
+                # Uploads being staged and downloads for processing are hidden
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+
+                stat_result = entry.stat()
+                yield StoredObject(
+                    key=entry.name,
+                    size=stat_result.st_size,
+                    modified_at=stat_result.st_mtime,
+                )
+
+    def local_path(self, key: str) -> Path | None:
+        return self._path(key)
+
+
+class S3Storage(Storage):
+    """Files in an S3 bucket, under an optional key prefix."""
+
+    bucket: str
+    prefix: str
+
+    def __init__(self, client: Any, bucket: str, prefix: str = "") -> None:
+        self._client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> Self:
+        try:
+            import boto3
+        except ImportError:
+            raise ValueError(
+                "storage_backend 's3' requires boto3, install the 's3' extra"
+            )
+
+        client = boto3.client(
+            "s3",
+            endpoint_url=settings.s3_endpoint_url,
+            region_name=settings.s3_region,
+            aws_access_key_id=settings.s3_access_key_id,
+            aws_secret_access_key=settings.s3_secret_access_key,
+        )
+
+        return cls(client, settings.s3_bucket, settings.s3_prefix)
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        self._client.close()
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def put(self, key: str, source: Path, content_type: str) -> None:
+        # Uploaded in parts for large files
+        self._client.upload_file(
+            str(source),
+            self.bucket,
+            self._key(key),
+            ExtraArgs={"ContentType": content_type},
+        )
+        source.unlink()
+
+    def get_range(self, key: str, start: int, end: int | None) -> Iterator[bytes]:
+        if end is not None and end <= start:
+            return
+
+        params = {"Bucket": self.bucket, "Key": self._key(key)}
+        if start > 0 or end is not None:
+            params["Range"] = f"bytes={start}-{'' if end is None else end - 1}"
+
+        response = self._client.get_object(**params)
+
+        with contextlib.closing(response["Body"]) as body:
+            yield from body.iter_chunks(CHUNK_SIZE)
+
+    def delete(self, key: str) -> None:
+        self._client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def stat(self, key: str) -> StoredObject | None:
+        try:
+            response = self._client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except self._client.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return None
+            raise
+
+        return StoredObject(
+            key=key,
+            size=response["ContentLength"],
+            modified_at=response["LastModified"].timestamp(),
+        )
+
+    def list_objects(self) -> Iterator[StoredObject]:
+        paginator = self._client.get_paginator("list_objects_v2")
+
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                yield StoredObject(
+                    key=item["Key"].removeprefix(self.prefix),
+                    size=item["Size"],
+                    modified_at=item["LastModified"].timestamp(),
+                )
+
+    def presigned_url(self, key: str, expires_in_s: int) -> str:
+        return self._client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._key(key)},
+            ExpiresIn=expires_in_s,
+        )
+
+
+def open_storage(settings: Settings) -> Storage:
+    if settings.storage_backend == "s3":
+        return S3Storage.from_settings(settings)
+
+    return FileSystemStorage(settings.upload_dir)
+
+
+def get_storage(request: Request) -> Storage:
+    if hasattr(request.app.state, "storage"):
+        return request.app.state.storage
+
+    raise ValueError("storage was not found on the app, did the lifecycle event fire?")
@@ -0,0 +1,214 @@
+"""
+Removal of book files no book references anymore.
+
+Deleting a book only removes its row; the file is removed afterwards by
+`StorageCollector.remove`, outside the transaction. Files whose removal was
+lost, e.g. because the process stopped, are found by a periodic sweep that
+compares the stored files against the `books` table in batches, and
+abandoned uploads are swept from the staging directory.
+
+Uploads store their file before the book is committed, so files younger
+than `storage_gc_min_age_s` may be about to be referenced and are never
+removed.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import re
+import time
+from typing import Self
+from uuid import UUID
+
+from fastapi import Request
+from pydantic import BaseModel
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from kosync_backend.config import Settings
+from kosync_backend.database import Book, EngineRegistry, ProcessingState, SessionLocal
+from kosync_backend.storage import S3Storage, Storage
+
+
+logger = logging.getLogger(__name__)
+
+_CONTENT_HASH = re.compile(r"[0-9a-f]{64}")
+
+
+class SweepReport(BaseModel):
+    scanned_files: int = 0
+    removed_files: int = 0
+    reclaimed_bytes: int = 0
+
+
+class StorageCollector:
+    """
+    Removes unreferenced book files, right after a book is deleted and in a
+    sweep every `storage_gc_interval_s` seconds.
+
+    Failed books don't reference their file. Files younger than
+    `storage_gc_min_age_s` are left alone. With S3, only a bucket prefix
+    dedicated to book files is swept.
+    """
+
+    _settings: Settings
+    _engine_registry: EngineRegistry
+    _storage: Storage
+    _task: asyncio.Task | None
+
+    def __init__(
+        self, settings: Settings, engine_registry: EngineRegistry, storage: Storage
+    ) -> None:
+        self._settings = settings
+        self._engine_registry = engine_registry
+        self._storage = storage
+        self._task = None
+
+    async def __aenter__(self) -> Self:
+        if self._settings.storage_gc_interval_s > 0:
+            self._task = asyncio.create_task(self._sweep_periodically())
+
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_traceback) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def _session(self) -> Session:
+        return SessionLocal(bind=self._engine_registry.get_engine())
+
+    def _referenced(self, db: Session, file_paths: list[str]) -> set[str]:
+        # Files are named after their content hash, or the book for books
+        # uploaded before deduplication, which are both indexed
+        content_hashes: list[str] = []
+        book_ids: list[UUID] = []
+        for file_path in file_paths:
+            name = file_path.removesuffix(".epub")
+            if _CONTENT_HASH.fullmatch(name):
+                content_hashes.append(name)
+                continue
+
+            try:
+                book_ids.append(UUID(name))
+            except ValueError:
+                pass
+
+        if not content_hashes and not book_ids:
+            return set()
+
+        return set(
+            db.scalars(
+                select(Book.file_path).where(
+                    or_(Book.content_hash.in_(content_hashes), Book.id.in_(book_ids)),
+                    Book.file_path.in_(file_paths),
+                    Book.processing_state != ProcessingState.FAILED,
+                )
+            )
+        )
+
+    def remove(self, *file_paths: str) -> None:
+        """
+        Remove released files, except those a book uploaded since references
+        again or may be about to, which are left to the sweep.
+        """
+        with self._session() as db:
+            referenced = self._referenced(db, list(file_paths))
+
+        min_modified_at = time.time() - self._settings.storage_gc_min_age_s
+        for file_path in file_paths:
+            if file_path in referenced:
+                continue
+
+            stored = self._storage.stat(file_path)
+            if stored is not None and stored.modified_at < min_modified_at:
+                self._storage.delete(file_path)
+
+    def _sweep_staging_directory(
+        self, report: SweepReport, min_modified_at: float
+    ) -> None:
+        # Uploads abandoned when the process stopped
+        try:
+            entries = os.scandir(self._settings.upload_dir)
+        except FileNotFoundError:
+            return
+
+        with entries:
+            for entry in entries:
+                if not (
+                    entry.name.startswith(".upload-") and entry.name.endswith(".part")
+                ):
+                    continue
+
+                report.scanned_files += 1
+                stat_result = entry.stat()
+                if stat_result.st_mtime >= min_modified_at:
+                    continue
+
+                os.unlink(entry.path)
+                report.removed_files += 1
+                report.reclaimed_bytes += stat_result.st_size
+
+    def sweep(self) -> SweepReport:
+        report = SweepReport()
+        min_modified_at = time.time() - self._settings.storage_gc_min_age_s
+
+        self._sweep_staging_directory(report, min_modified_at)
+
+        if isinstance(self._storage, S3Storage) and not self._storage.prefix:
+            logger.warning(
+                "Not sweeping the S3 bucket, set s3_prefix so it only lists book files"
+            )
+            return report
+
+        for batch in itertools.batched(
+            self._storage.list_objects(), self._settings.storage_gc_batch_size
+        ):
+            report.scanned_files += len(batch)
+            candidates = {
+                stored.key for stored in batch if stored.modified_at < min_modified_at
+            }
+            if not candidates:
+                continue
+
+            with self._session() as db:
+                referenced = self._referenced(db, list(candidates))
+
+            for key in candidates - referenced:
+                # A book uploaded since the listing stores the file again
+                current = self._storage.stat(key)
+                if current is None or current.modified_at >= min_modified_at:
+                    continue
+
+                self._storage.delete(key)
+                report.removed_files += 1
+                report.reclaimed_bytes += current.size
+
+        logger.info(
+            "Storage sweep removed %d of %d files, reclaiming %d bytes",
+            report.removed_files,
+            report.scanned_files,
+            report.reclaimed_bytes,
+        )
+
+        return report
+
+    async def _sweep_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self._settings.storage_gc_interval_s)
+
+            try:
+                await run_in_threadpool(self.sweep)
+            except Exception:
+                logger.exception("Storage sweep failed")
+
+
+def get_storage_collector(request: Request) -> StorageCollector:
+    if hasattr(request.app.state, "storage_collector"):
+        return request.app.state.storage_collector
+
+    raise ValueError(
+        "storage_collector was not found on the app, did the lifecycle event fire?"
+    )
@@ -0,0 +1,261 @@
+import hashlib
+import os
+from collections.abc import Callable
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import IO
+
+from fastapi import Request
+from pydantic import BaseModel
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.concurrency import run_in_threadpool
+
+from kosync_backend.metrics import UPLOAD_SIZE
+
+
+# Allowance for the multipart boundaries and part headers when comparing the
+# request's Content-Length against the maximum file size.
+MULTIPART_OVERHEAD_BYTES = 16 * 1024
+
+EPUB_UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
+
+
+EPUB_BATCH_UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["files"],
+                    "properties": {
+                        "files": {
+                            "type": "array",
+                            "items": {"type": "string", "format": "binary"},
+                        }
+                    },
+                }
+            }
+        },
+    }
+}
+
+
+class UploadError(Exception):
+    """The request body is not an acceptable upload."""
+
+
+class UploadTooLarge(UploadError):
+    """A file in the upload exceeds the maximum allowed size."""
+
+
+class StagedUpload(BaseModel):
+    """An uploaded file that was streamed to a temporary file next to its destination."""
+
+    filename: str
+    path: Path
+    size: int
+    sha256: str
+
+    def commit(self, destination: Path) -> None:
+        """Atomically move the staged file to its final location."""
+        os.replace(self.path, destination)
+
+    def discard(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+
+class _StagingFile:
+    def __init__(self, directory: Path, filename: str) -> None:
+        self.filename = filename
+        self.size = 0
+        self.hash = hashlib.sha256()
+        self.file: IO[bytes] = NamedTemporaryFile(
+            dir=directory, prefix=".upload-", suffix=".part", delete=False
+        )
+
+    def write(self, data: bytes) -> None:
+        self.size += len(data)
+        self.hash.update(data)
+        self.file.write(data)
+
+    def close(self) -> StagedUpload:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        UPLOAD_SIZE.observe(self.size)
+
+        return StagedUpload(
+            filename=self.filename,
+            path=Path(self.file.name),
+            size=self.size,
+            sha256=self.hash.hexdigest(),
+        )
+
+    def discard(self) -> None:
+        self.file.close()
+        Path(self.file.name).unlink(missing_ok=True)
+
+
+async def stage_uploads(
+    request: Request,
+    directory: Path,
+    max_file_size: int,
+    field_name: str = "file",
+    allowed_suffixes: tuple[str, ...] = (".epub",),
+    max_files: int = 1,
+    on_rejected: Callable[[int, str, UploadError], None] | None = None,
+) -> list[StagedUpload]:
+    """
+    Stream the files in a `multipart/form-data` request body to temporary files
+    in `directory`, hashing them on the way.
+
+    Unlike `UploadFile`, nothing is buffered beyond a single chunk, writes
+    happen off the event loop, and the upload is rejected as soon as the
+    `Content-Length` header or the running byte count shows a file is larger
+    than `max_file_size`.
+
+    By default any invalid file fails the whole upload. When `on_rejected` is
+    given, it is called with the position among the uploaded files, the
+    filename and the error of each invalid file instead, and the remaining
+    files are still staged.
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type"))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise UploadError("Expected a multipart/form-data request")
+
+    content_length = request.headers.get("content-length")
+    if (
+        content_length is not None
+        and content_length.isdigit()
+        and int(content_length) > max_files * (max_file_size + MULTIPART_OVERHEAD_BYTES)
+    ):
+        raise UploadTooLarge()
+
+    directory.mkdir(parents=True, exist_ok=True)
+
+    events: list[tuple[str, bytes]] = []
+    header_field = bytearray()
+    header_value = bytearray()
+    part_headers: dict[bytes, bytes] = {}
+
+    def on_header_field(data: bytes, start: int, end: int) -> None:
+        header_field.extend(data[start:end])
+
+    def on_header_value(data: bytes, start: int, end: int) -> None:
+        header_value.extend(data[start:end])
+
+    def on_header_end() -> None:
+        part_headers[bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished() -> None:
+        events.append(("headers", part_headers.get(b"content-disposition", b"")))
+        part_headers.clear()
+
+    def on_part_data(data: bytes, start: int, end: int) -> None:
+        events.append(("data", data[start:end]))
+
+    def on_part_end() -> None:
+        events.append(("end", b""))
+
+    parser = MultipartParser(
+        options[b"boundary"],
+        {
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        },
+    )
+
+    staged: list[StagedUpload] = []
+    current: _StagingFile | None = None
+    files_seen = 0
+
+    def reject(filename: str, error: UploadError) -> None:
+        nonlocal current
+
+        if on_rejected is None:
+            raise error
+
+        if current is not None:
+            current.discard()
+            current = None
+
+        on_rejected(files_seen - 1, filename, error)
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+
+            for event, data in events:
+                if event == "headers":
+                    _, disposition = parse_options_header(data)
+                    name = disposition.get(b"name", b"").decode()
+                    filename = disposition.get(b"filename", b"").decode()
+
+                    if name != field_name or not filename:
+                        continue
+
+                    if (files_seen := files_seen + 1) > max_files:
+                        raise UploadError(f"At most {max_files} files are allowed")
+
+                    if not filename.lower().endswith(allowed_suffixes):
+                        reject(
+                            filename,
+                            UploadError(
+                                f"Only {', '.join(allowed_suffixes)} files are allowed"
+                            ),
+                        )
+                        continue
+
+                    current = _StagingFile(directory, filename)
+                elif event == "data" and current is not None:
+                    if current.size + len(data) > max_file_size:
+                        reject(
+                            current.filename,
+                            UploadTooLarge(
+                                f"{current.filename} exceeds the maximum file size"
+                            ),
+                        )
+                        continue
+
+                    await run_in_threadpool(current.write, data)
+                elif event == "end" and current is not None:
+                    staged.append(await run_in_threadpool(current.close))
+                    current = None
+
+            events.clear()
+
+        parser.finalize()
+
+        if current is not None:
+            raise UploadError("The upload ended before the file was complete")
+    except BaseException:
+        if current is not None:
+            current.discard()
+        for upload in staged:
+            upload.discard()
+        raise
+
+    if files_seen == 0:
+        raise UploadError(f"No file was uploaded in the '{field_name}' field")
+
+    return staged
@@ -1,14 +1,27 @@
+import logging
+import math
 from typing import Annotated
+from uuid import UUID
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from supabase import create_client, Client
+from starlette.concurrency import run_in_threadpool
 from supabase_auth import User as SupabaseUser
-from supabase_auth.errors import AuthApiError
 
+from kosync_backend.auth import InvalidToken, TokenVerifier, get_token_verifier
+from kosync_backend.auth_client import AuthClient, get_auth_client
 from kosync_backend.config import Settings, get_settings
+from kosync_backend.devices import (
+    DEVICE_TOKEN_PREFIX,
+    Device,
+    DeviceAuthenticator,
+    get_device_authenticator,
+)
+from kosync_backend.resilience import CircuitOpen
 
 
+logger = logging.getLogger(__name__)
+
 security = HTTPBearer()
 
 
@@ -18,45 +31,80 @@ def get_bearer_token(
     return credentials.credentials
 
 
-def get_supabase(settings: Annotated[Settings, Depends(get_settings)]) -> Client:
-    return create_client(settings.supabase_url, settings.supabase_key)
+def _auth_provider_unavailable(error: CircuitOpen) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="The authentication provider is unavailable, try again later",
+        headers={"Retry-After": str(max(math.ceil(error.retry_after_s), 1))},
+    )
 
 
 async def get_current_user_from_jwt(
     bearer_token: Annotated[str, Depends(get_bearer_token)],
-    supabase: Annotated[Client, Depends(get_supabase)],
+    auth_client: Annotated[AuthClient, Depends(get_auth_client)],
+    token_verifier: Annotated[TokenVerifier, Depends(get_token_verifier)],
 ) -> SupabaseUser:
     try:
-        response = supabase.auth.get_user(bearer_token)
-    except AuthApiError:
+        return await token_verifier.verify(bearer_token, auth_client)
+    except InvalidToken:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    except CircuitOpen as e:
+        raise _auth_provider_unavailable(e)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=str(e),
         )
 
-    if not response:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials",
-        )
-
-    return response.user
-
 
 async def get_current_user_from_id(
     bearer_token: Annotated[str, Depends(get_bearer_token)],
-    supabase: Annotated[Client, Depends(get_supabase)],
+    auth_client: Annotated[AuthClient, Depends(get_auth_client)],
 ) -> SupabaseUser:
     try:
-        return supabase.auth.admin.get_user_by_id(bearer_token).user
+        return await auth_client.get_user_by_id(bearer_token)
     except ValueError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid User ID format",
         )
+    except CircuitOpen as e:
+        raise _auth_provider_unavailable(e)
+
+
+async def get_current_device(
+    bearer_token: Annotated[str, Depends(get_bearer_token)],
+    auth_client: Annotated[AuthClient, Depends(get_auth_client)],
+    device_authenticator: Annotated[
+        DeviceAuthenticator, Depends(get_device_authenticator)
+    ],
+    settings: Annotated[Settings, Depends(get_settings)],
+) -> Device:
+    device = await run_in_threadpool(device_authenticator.authenticate, bearer_token)
+
+    if device is not None:
+        return device
+
+    if (
+        bearer_token.startswith(DEVICE_TOKEN_PREFIX)
+        or not settings.legacy_user_id_tokens
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or revoked device token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    # Clients generated before device tokens use the user id as their token
+    user = await get_current_user_from_id(bearer_token, auth_client)
+    logger.warning(
+        "A client of user %s authenticated with the deprecated user id token, "
+        "it should be downloaded again",
+        user.id,
+    )
+
+    return device_authenticator.remember_legacy_token(bearer_token, UUID(user.id))
@@ -0,0 +1,241 @@
+import asyncio
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+import multiprocessing
+import threading
+import time
+from typing import Any, Self
+
+from fastapi import Request
+from pydantic import BaseModel
+
+from kosync_backend.config import Settings
+from kosync_backend.metrics import WORKER_JOB_DURATION, WORKER_QUEUE_WAIT
+
+
+class WorkerPoolBusy(Exception):
+    """The pool's queue is full; the job was not submitted."""
+
+
+class WorkerTimeout(Exception):
+    """The job did not finish within the configured timeout."""
+
+
+class WorkerPoolMetrics(BaseModel):
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    rejected: int = 0
+    timed_out: int = 0
+    queue_wait_seconds_total: float = 0.0
+    queue_wait_seconds_max: float = 0.0
+    execution_seconds_total: float = 0.0
+    execution_seconds_max: float = 0.0
+
+    def observe(self, queue_wait: float, execution: float) -> None:
+        self.queue_wait_seconds_total += queue_wait
+        self.queue_wait_seconds_max = max(self.queue_wait_seconds_max, queue_wait)
+        self.execution_seconds_total += execution
+        self.execution_seconds_max = max(self.execution_seconds_max, execution)
+
+
+def _timed_call(function: Callable[..., Any], *args: Any) -> tuple[float, float, Any]:
+    # Wall-clock time, since process workers don't share our monotonic clock
+    started_at = time.time()
+    result = function(*args)
+
+    return started_at, time.time(), result
+
+
+class WorkerPool:
+    """
+    Bounded executor for blocking work (EPUB parsing, file I/O) that must not
+    run on the event loop.
+
+    At most `worker_pool_size` jobs run at once and `worker_queue_depth` more
+    may wait; beyond that `run` raises `WorkerPoolBusy` instead of queueing
+    without bound. Jobs are only handed to the executor once a worker is
+    free, so `worker_job_timeout_s` counts from the start of the job, and a
+    job holds its worker until it has really finished. Waiting for a worker
+    is limited to the same timeout.
+
+    Jobs that exceed the timeout raise `WorkerTimeout`. In process mode the
+    stuck worker processes are killed and replaced, which also fails any job
+    running alongside them. Threads can't be killed, so in thread mode a
+    stuck job keeps its worker, and the pool shrinks, until it returns.
+    """
+
+    metrics: WorkerPoolMetrics
+    _settings: Settings
+    _executor: Executor
+
+    def __init__(self, settings: Settings) -> None:
+        self._settings = settings
+        self._pending = 0
+        # Guards the busy worker count and the waiters, as jobs finish on
+        # other threads and the pool may be used from more than one loop
+        self._lock = threading.Lock()
+        self._busy_workers = 0
+        self._waiters: deque[asyncio.Future[None]] = deque()
+        self.metrics = WorkerPoolMetrics()
+        self._executor = self._create_executor()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _create_executor(self) -> Executor:
+        if self._settings.worker_pool_kind == "process":
+            return ProcessPoolExecutor(
+                max_workers=self._settings.worker_pool_size,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+
+        return ThreadPoolExecutor(
+            max_workers=self._settings.worker_pool_size,
+            thread_name_prefix="kosync-worker",
+        )
+
+    def _replace_processes(self) -> None:
+        executor = self._executor
+        self._executor = self._create_executor()
+
+        # ProcessPoolExecutor offers no way to cancel a running job
+        for process in list((getattr(executor, "_processes", None) or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def pending(self) -> int:
+        """Jobs waiting for a worker or running, including timed out ones."""
+        return self._pending
+
+    async def _acquire_worker(self) -> None:
+        with self._lock:
+            if self._busy_workers < self._settings.worker_pool_size:
+                self._busy_workers += 1
+                return
+
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+
+        try:
+            await waiter
+        except BaseException:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+            # The worker was handed over just as the wait was given up
+            if waiter.done() and not waiter.cancelled():
+                self._release_worker()
+            raise
+
+    def _release_worker(self) -> None:
+        """Hand the worker to the next waiting job. Safe to call from any thread."""
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                try:
+                    waiter.get_loop().call_soon_threadsafe(self._hand_over, waiter)
+                    return
+                except RuntimeError:
+                    # Its loop is closed, so nobody is waiting on it anymore
+                    continue
+
+            self._busy_workers -= 1
+
+    def _hand_over(self, waiter: asyncio.Future[None]) -> None:
+        if waiter.done():
+            self._release_worker()
+        else:
+            waiter.set_result(None)
+
+    def _submit(self, function: Callable[..., Any], *args: Any) -> asyncio.Future:
+        future = self._executor.submit(_timed_call, function, *args)
+
+        def on_done(_future: Future) -> None:
+            # Called from the worker thread, or an executor thread in process mode
+            with self._lock:
+                self._pending -= 1
+            self._release_worker()
+
+        future.add_done_callback(on_done)
+
+        return asyncio.wrap_future(future)
+
+    async def run[T](self, function: Callable[..., T], *args: Any) -> T:
+        """Run `function(*args)` on the pool. For process pools both must be picklable."""
+        if (
+            self._pending
+            >= self._settings.worker_pool_size + self._settings.worker_queue_depth
+        ):
+            self.metrics.rejected += 1
+            raise WorkerPoolBusy()
+
+        with self._lock:
+            self._pending += 1
+        self.metrics.submitted += 1
+        submitted_at = time.time()
+
+        try:
+            # Bounded too, so jobs don't pile up behind stuck workers
+            await asyncio.wait_for(
+                self._acquire_worker(), timeout=self._settings.worker_job_timeout_s
+            )
+        except BaseException as exception:
+            with self._lock:
+                self._pending -= 1
+            if isinstance(exception, TimeoutError):
+                self.metrics.timed_out += 1
+                raise WorkerTimeout() from None
+            raise
+
+        try:
+            future = self._submit(function, *args)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            self._release_worker()
+            raise
+
+        try:
+            started_at, finished_at, result = await asyncio.wait_for(
+                future, timeout=self._settings.worker_job_timeout_s
+            )
+        except TimeoutError:
+            self.metrics.timed_out += 1
+            if self._settings.worker_pool_kind == "process":
+                self._replace_processes()
+            raise WorkerTimeout()
+        except Exception:
+            self.metrics.failed += 1
+            raise
+
+        queue_wait = max(started_at - submitted_at, 0.0)
+        execution = finished_at - started_at
+        self.metrics.completed += 1
+        self.metrics.observe(queue_wait=queue_wait, execution=execution)
+        # Callables such as partials have no name of their own
+        job = getattr(function, "__name__", type(function).__name__)
+        WORKER_QUEUE_WAIT.labels(job).observe(queue_wait)
+        WORKER_JOB_DURATION.labels(job).observe(execution)
+
+        return result
+
+
+def get_worker_pool(request: Request) -> WorkerPool:
+    if hasattr(request.app.state, "worker_pool"):
+        return request.app.state.worker_pool
+
+    raise ValueError(
+        "worker_pool was not found on the app, did the lifecycle event fire?"
+    )
@@ -3,20 +3,24 @@ import contextlib
 from datetime import datetime
 import os
 from pathlib import Path
-from shutil import rmtree
+from shutil import copyfile, rmtree
+from uuid import UUID
 
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
 import httpx
 import pytest
 from supabase_auth import User as SupabaseUser
 
-from kosync_backend.database import get_db, get_engine, SessionLocal
+from kosync_backend.artifacts import NICKELDBUS, NICKELMENU, ArtifactCache
+from kosync_backend.database import SessionLocal
+from kosync_backend.devices import Device
 from kosync_backend.main import get_app
 from kosync_backend.user_middleware import (
+    get_current_device,
     get_current_user_from_jwt,
     get_current_user_from_id,
 )
-from kosync_backend.config import get_settings
 
 
 @contextlib.contextmanager
@@ -68,6 +72,30 @@ def uploads_path(base_path: Path) -> Generator[Path]:
     rmtree(path)
 
 
+@pytest.fixture(scope="session")
+def artifacts_path(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    """An artifact cache seeded with the release archives kept in the test resources."""
+    cache = ArtifactCache(tmp_path_factory.mktemp("artifacts"))
+    cache.directory.mkdir(exist_ok=True)
+
+    for artifact, resource in [
+        (NICKELMENU, "nickelmenu_KoboRoot.tgz"),
+        (NICKELDBUS, "nickeldbus_KoboRoot.tgz"),
+    ]:
+        copyfile(Path(__file__).parent / "resources" / resource, cache.path(artifact))
+
+    return cache.directory
+
+
+@pytest.fixture
+def covers_path(base_path: Path) -> Generator[Path]:
+    path = base_path / "covers"
+
+    yield path
+
+    rmtree(path, ignore_errors=True)
+
+
 @pytest.fixture
 def dummy_user() -> SupabaseUser:
     return SupabaseUser(
@@ -82,16 +110,25 @@ def dummy_user() -> SupabaseUser:
 
 @pytest.fixture
 def app_client(
-    sql_path: Path, uploads_path: Path, dummy_user: SupabaseUser
+    sql_path: Path,
+    uploads_path: Path,
+    covers_path: Path,
+    artifacts_path: Path,
+    dummy_user: SupabaseUser,
 ) -> Generator[TestClient]:
     with updated_environment(
         {
             "DATABASE_URL": f"sqlite:///{sql_path}",
             "UPLOAD_DIR": str(uploads_path),
+            "COVER_DIR": str(covers_path),
             "BASE_URL": "http://kosync.test/",
             "SUPABASE_URL": "https://test.supabase.co",
             "SUPABASE_KEY": "test-key",
             "CLIENT_PATH": str(Path(__file__).parent.parent / "kosync_client"),
+            "ARTIFACT_DIR": str(artifacts_path),
+            # Deleted books' files are removed right away
+            "STORAGE_GC_MIN_AGE_S": "0",
+            "METRICS_ENABLED": "true",
         }
     ):
         app = get_app()
@@ -99,6 +136,9 @@ def app_client(
         # Mock auth dependencies
         app.dependency_overrides[get_current_user_from_jwt] = lambda: dummy_user
         app.dependency_overrides[get_current_user_from_id] = lambda: dummy_user
+        app.dependency_overrides[get_current_device] = lambda: Device(
+            user_id=UUID(dummy_user.id)
+        )
 
         with TestClient(app, raise_server_exceptions=True) as client:
             client.headers.update({"Authorization": "Bearer test-token"})
@@ -106,9 +146,16 @@ def app_client(
 
 
 @pytest.fixture
-def db_session(app_client: TestClient) -> Generator:
-    settings = get_settings()
-    engine = get_engine(settings)
+def app(app_client: TestClient) -> FastAPI:
+    """The app `app_client` sends its requests to."""
+    assert isinstance(app_client.app, FastAPI)
+
+    return app_client.app
+
+
+@pytest.fixture
+def db_session(app: FastAPI) -> Generator:
+    engine = app.state.engine_registry.get_engine()
     session = SessionLocal(bind=engine)
     try:
         yield session
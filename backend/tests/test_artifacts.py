@@ -0,0 +1,86 @@
+from concurrent.futures import ThreadPoolExecutor
+import io
+from pathlib import Path
+from shutil import copyfile
+import tarfile
+
+import pytest
+from pytest_mock import MockerFixture
+
+from kosync_backend.artifacts import (
+    NICKEL_ADDONS,
+    NICKELMENU,
+    ArtifactCache,
+    ArtifactError,
+)
+from kosync_backend.client_generator import ClientGenerator
+from kosync_backend.config import Settings
+
+
+RESOURCES = Path(__file__).parent / "resources"
+
+
+def test_missing_artifacts_fail_startup_without_downloading(
+    tmp_path: Path, mocker: MockerFixture
+) -> None:
+    urlopen = mocker.patch("kosync_backend.artifacts.urlopen")
+
+    with pytest.raises(ArtifactError, match="prefetch"):
+        with ClientGenerator(Settings(artifact_dir=str(tmp_path))):
+            pass
+
+    urlopen.assert_not_called()
+
+
+def test_tampered_artifacts_are_rejected(tmp_path: Path) -> None:
+    cache = ArtifactCache(tmp_path)
+    copyfile(RESOURCES / "nickeldbus_KoboRoot.tgz", cache.path(NICKELMENU))
+
+    with pytest.raises(ArtifactError, match="SHA-256"):
+        cache.get(NICKELMENU)
+
+
+def test_prefetch_downloads_and_verifies_artifacts(
+    tmp_path: Path, mocker: MockerFixture
+) -> None:
+    urlopen = mocker.patch("kosync_backend.artifacts.urlopen")
+    urlopen.return_value.__enter__.return_value = io.BytesIO(
+        (RESOURCES / "nickelmenu_KoboRoot.tgz").read_bytes()
+    )
+    cache = ArtifactCache(tmp_path / "artifacts")
+
+    assert cache.prefetch(NICKELMENU) == cache.get(NICKELMENU)
+
+    # Already cached, so nothing is downloaded again
+    cache.prefetch(NICKELMENU)
+    urlopen.assert_called_once_with(NICKELMENU.url)
+
+
+def test_prefetch_rejects_downloads_with_the_wrong_checksum(
+    tmp_path: Path, mocker: MockerFixture
+) -> None:
+    urlopen = mocker.patch("kosync_backend.artifacts.urlopen")
+    urlopen.return_value.__enter__.return_value = io.BytesIO(b"not the release")
+    cache = ArtifactCache(tmp_path)
+
+    with pytest.raises(ArtifactError, match="SHA-256"):
+        cache.prefetch(NICKELMENU)
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_concurrent_startups_share_one_extracted_tree(
+    artifacts_path: Path, tmp_path: Path, mocker: MockerFixture
+) -> None:
+    cache = ArtifactCache(tmp_path)
+    for artifact in NICKEL_ADDONS:
+        copyfile(ArtifactCache(artifacts_path).get(artifact), cache.path(artifact))
+
+    tarfile_open = mocker.spy(tarfile, "open")
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        trees = list(executor.map(lambda _: cache.extracted(NICKEL_ADDONS), range(4)))
+
+    assert len(set(trees)) == 1
+    assert tarfile_open.call_count == len(NICKEL_ADDONS)
+    assert (trees[0] / "etc/dbus-1/system.d/com-github-shermp-nickeldbus.conf").exists()
@@ -0,0 +1,131 @@
+import asyncio
+import time
+from unittest import mock
+
+import jwt
+import pytest
+from pytest_mock import MockerFixture
+from supabase_auth import User as SupabaseUser
+from supabase_auth.errors import AuthApiError
+
+from kosync_backend.auth import InvalidToken, TokenVerifier
+from kosync_backend.config import Settings
+
+
+SECRET = "super-secret-jwt-token-with-at-least-32-characters"
+USER_ID = "6d50e42f-74c5-48f7-a42e-fe91e9ddcf69"
+
+
+def _token(secret: str = SECRET, expires_in: int = 3600, **claims) -> str:
+    now = int(time.time())
+
+    return jwt.encode(
+        {
+            "sub": USER_ID,
+            "aud": "authenticated",
+            "role": "authenticated",
+            "email": "test@example.com",
+            "iat": now,
+            "exp": now + expires_in,
+            **claims,
+        },
+        secret,
+        algorithm="HS256",
+    )
+
+
+@pytest.fixture
+def auth_client(dummy_user: SupabaseUser) -> mock.Mock:
+    client = mock.Mock()
+    client.get_user = mock.AsyncMock(return_value=dummy_user)
+
+    return client
+
+
+def _verify(verifier: TokenVerifier, token: str, auth_client: mock.Mock):
+    return asyncio.run(verifier.verify(token, auth_client))
+
+
+def test_tokens_are_verified_locally_and_cached(auth_client: mock.Mock) -> None:
+    verifier = TokenVerifier(Settings(supabase_jwt_secret=SECRET))
+    token = _token()
+
+    assert _verify(verifier, token, auth_client).id == USER_ID
+    assert _verify(verifier, token, auth_client).email == "test@example.com"
+
+    auth_client.get_user.assert_not_called()
+    assert verifier.metrics.verified_locally == 1
+    assert verifier.metrics.cache_misses == 1
+    assert verifier.metrics.cache_hits == 1
+    assert verifier.metrics.remote_calls == 0
+
+
+@pytest.mark.parametrize(
+    "token",
+    [
+        _token(expires_in=-60),
+        _token(secret="another-secret-that-is-also-32-characters-long"),
+        _token(aud="someone-else"),
+        "not-a-jwt",
+    ],
+    ids=["expired", "wrong-signature", "wrong-audience", "malformed"],
+)
+def test_invalid_tokens_are_rejected_without_a_remote_call(
+    auth_client: mock.Mock, token: str
+) -> None:
+    verifier = TokenVerifier(Settings(supabase_jwt_secret=SECRET))
+
+    with pytest.raises(InvalidToken):
+        _verify(verifier, token, auth_client)
+
+    auth_client.get_user.assert_not_called()
+    assert verifier.metrics.rejected_locally == 1
+
+
+def test_falls_back_to_supabase_without_a_secret(auth_client: mock.Mock) -> None:
+    verifier = TokenVerifier(Settings(supabase_jwt_secret=""))
+    token = _token()
+
+    assert _verify(verifier, token, auth_client).id == USER_ID
+    assert _verify(verifier, token, auth_client).id == USER_ID
+
+    auth_client.get_user.assert_called_once_with(token)
+    assert verifier.metrics.remote_calls == 1
+    assert verifier.metrics.remote_seconds_total >= 0
+    assert verifier.metrics.cache_hits == 1
+
+
+def test_tokens_rejected_by_supabase_are_invalid(auth_client: mock.Mock) -> None:
+    auth_client.get_user.side_effect = AuthApiError("invalid JWT", 401, None)
+    verifier = TokenVerifier(Settings(supabase_jwt_secret=""))
+
+    with pytest.raises(InvalidToken):
+        _verify(verifier, _token(), auth_client)
+
+    assert verifier.metrics.remote_failures == 1
+
+
+def test_cached_tokens_expire_with_the_token(
+    auth_client: mock.Mock, mocker: MockerFixture
+) -> None:
+    verifier = TokenVerifier(Settings(supabase_jwt_secret=SECRET))
+    token = _token(expires_in=60)
+    _verify(verifier, token, auth_client)
+
+    mocker.patch("kosync_backend.auth.time.time", return_value=time.time() + 120)
+    _verify(verifier, token, auth_client)
+
+    assert verifier.metrics.cache_hits == 0
+    assert verifier.metrics.cache_misses == 2
+
+
+def test_cache_is_bounded(auth_client: mock.Mock) -> None:
+    verifier = TokenVerifier(Settings(supabase_jwt_secret=SECRET, jwt_cache_size=2))
+    tokens = [_token(jti=str(index)) for index in range(3)]
+
+    for token in tokens:
+        _verify(verifier, token, auth_client)
+    _verify(verifier, tokens[0], auth_client)
+
+    assert verifier.metrics.cache_hits == 0
+    assert verifier.metrics.verified_locally == 4
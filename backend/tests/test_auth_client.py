@@ -0,0 +1,168 @@
+import asyncio
+
+import httpx
+from prometheus_client import REGISTRY
+import pytest
+from supabase_auth.errors import AuthApiError, AuthRetryableError
+
+from kosync_backend.auth_client import AuthClient
+from kosync_backend.config import Settings
+from kosync_backend.resilience import CircuitBreaker, CircuitOpen, CircuitState
+
+
+USER = {
+    "id": "6d50e42f-74c5-48f7-a42e-fe91e9ddcf69",
+    "aud": "authenticated",
+    "app_metadata": {},
+    "user_metadata": {},
+    "created_at": "2023-01-01T00:00:00Z",
+}
+
+
+def _settings(**overrides) -> Settings:
+    return Settings(
+        supabase_url="https://test.supabase.co",
+        supabase_key="test-key",
+        supabase_retry_backoff_s=0,
+        **overrides,
+    )
+
+
+def _responder(*status_codes: int) -> tuple[httpx.MockTransport, list[httpx.Request]]:
+    """A transport answering with the given status codes, then with 200s."""
+    requests: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        status_code = (
+            status_codes[len(requests) - 1]
+            if len(requests) <= len(status_codes)
+            else 200
+        )
+
+        if status_code == 200:
+            return httpx.Response(200, json=USER)
+
+        return httpx.Response(status_code, json={"msg": "error", "code": "error"})
+
+    return httpx.MockTransport(handler), requests
+
+
+def test_requests_share_one_http_client() -> None:
+    transport, requests = _responder()
+
+    async def scenario() -> None:
+        async with AuthClient(_settings(), transport=transport) as auth_client:
+            for _ in range(3):
+                user = await auth_client.get_user("token")
+                assert user is not None and user.id == USER["id"]
+
+    asyncio.run(scenario())
+
+    assert len(requests) == 3
+    assert requests[0].url.path == "/auth/v1/user"
+
+
+def test_transient_failures_are_retried() -> None:
+    transport, requests = _responder(503, 502)
+
+    async def scenario() -> None:
+        async with AuthClient(_settings(), transport=transport) as auth_client:
+            assert await auth_client.get_user("token") is not None
+
+    asyncio.run(scenario())
+
+    assert len(requests) == 3
+
+
+def test_rejected_tokens_are_not_retried_and_keep_the_circuit_closed() -> None:
+    transport, requests = _responder(*[401] * 10)
+
+    async def scenario() -> None:
+        async with AuthClient(
+            _settings(supabase_circuit_failure_threshold=2), transport=transport
+        ) as auth_client:
+            for _ in range(3):
+                with pytest.raises(AuthApiError):
+                    await auth_client.get_user("token")
+
+            assert auth_client.circuit_breaker.state == CircuitState.CLOSED
+
+    asyncio.run(scenario())
+
+    assert len(requests) == 3
+
+
+def test_the_circuit_opens_after_repeated_failures() -> None:
+    transport, requests = _responder(*[503] * 10)
+
+    async def scenario() -> None:
+        async with AuthClient(
+            _settings(supabase_max_retries=0, supabase_circuit_failure_threshold=2),
+            transport=transport,
+        ) as auth_client:
+            for _ in range(2):
+                with pytest.raises(AuthRetryableError):
+                    await auth_client.get_user("token")
+
+            with pytest.raises(CircuitOpen):
+                await auth_client.get_user("token")
+
+    asyncio.run(scenario())
+
+    assert len(requests) == 2
+
+
+def test_calls_are_timed_by_outcome() -> None:
+    transport, _ = _responder(401, 503)
+
+    def calls(outcome: str) -> float:
+        return (
+            REGISTRY.get_sample_value(
+                "kosync_auth_provider_call_duration_seconds_count",
+                {"operation": "get_user", "outcome": outcome},
+            )
+            or 0
+        )
+
+    before = {outcome: calls(outcome) for outcome in ["success", "error", "failure"]}
+
+    async def scenario() -> None:
+        async with AuthClient(
+            _settings(supabase_max_retries=0), transport=transport
+        ) as auth_client:
+            with pytest.raises(AuthApiError):
+                await auth_client.get_user("token")
+            with pytest.raises(AuthRetryableError):
+                await auth_client.get_user("token")
+            await auth_client.get_user("token")
+
+    asyncio.run(scenario())
+
+    assert {outcome: calls(outcome) - before[outcome] for outcome in before} == {
+        "success": 1,
+        "error": 1,
+        "failure": 1,
+    }
+
+
+def test_the_circuit_closes_after_a_successful_trial_call() -> None:
+    circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout_s=0)
+
+    async def fail() -> None:
+        raise ConnectionError()
+
+    async def succeed() -> str:
+        return "ok"
+
+    async def scenario() -> None:
+        with pytest.raises(ConnectionError):
+            await circuit_breaker.call(fail)
+        assert circuit_breaker.state == CircuitState.OPEN
+
+        assert await circuit_breaker.call(succeed) == "ok"
+        assert circuit_breaker.state == CircuitState.CLOSED
+
+    asyncio.run(scenario())
+
+    assert circuit_breaker.metrics.opened == 1
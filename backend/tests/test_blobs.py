@@ -0,0 +1,145 @@
+from pathlib import Path
+import time
+from uuid import UUID, uuid4
+
+from fastapi.testclient import TestClient
+from pytest_mock import MockerFixture
+from sqlalchemy.orm import Session
+from supabase_auth import User as SupabaseUser
+
+from kosync_backend.blobs import BlobStore
+from kosync_backend.database import Book, BookBlob
+from tests.conftest import upload_book
+
+
+DUMMY_BOOK = (
+    Path(__file__).parent / "resources" / "Around the World in 28 Languages.epub"
+)
+
+
+def _blob(db_session: Session, book_id: str) -> BookBlob:
+    book = db_session.get_one(Book, UUID(book_id))
+    db_session.expire_all()
+
+    return db_session.get_one(BookBlob, book.content_hash)
+
+
+def test_duplicate_upload_reuses_the_file_and_extraction(
+    app_client: TestClient,
+    uploads_path: Path,
+    db_session: Session,
+    mocker: MockerFixture,
+) -> None:
+    first = upload_book(app_client, DUMMY_BOOK).json()
+    process_epub = mocker.patch(
+        "kosync_backend.routes.books.process_epub", side_effect=ValueError("unused")
+    )
+
+    second = upload_book(app_client, DUMMY_BOOK).json()
+
+    process_epub.assert_not_called()
+    assert second["id"] != first["id"]
+    assert second["title"] == first["title"]
+    assert second["cover_hash"] == first["cover_hash"]
+    assert len(list(uploads_path.iterdir())) == 1
+    assert _blob(db_session, second["id"]).ref_count == 2
+
+
+def test_duplicate_background_upload_is_finished_from_the_cache(
+    app_client: TestClient, mocker: MockerFixture
+) -> None:
+    title = upload_book(app_client, DUMMY_BOOK).json()["title"]
+    mocker.patch(
+        "kosync_backend.ingestion.process_epub", side_effect=ValueError("unused")
+    )
+
+    job_id = app_client.post(
+        "/api/v1/books",
+        params={"background": True},
+        files={"file": ("Copy.epub", DUMMY_BOOK.read_bytes())},
+    ).json()["id"]
+
+    deadline = time.monotonic() + 10
+    job = app_client.get(f"/api/v1/books/jobs/{job_id}").json()
+    while job["state"] in ("pending", "processing") and time.monotonic() < deadline:
+        time.sleep(0.01)
+        job = app_client.get(f"/api/v1/books/jobs/{job_id}").json()
+
+    assert job["state"] == "ready"
+    assert job["book"]["title"] == title
+
+
+def test_shared_file_is_removed_with_its_last_book(
+    app_client: TestClient, uploads_path: Path, db_session: Session
+) -> None:
+    first_id = upload_book(app_client, DUMMY_BOOK).json()["id"]
+    second_id = upload_book(app_client, DUMMY_BOOK).json()["id"]
+    [stored_file] = uploads_path.iterdir()
+
+    assert app_client.delete(f"/api/v1/books/{first_id}").status_code == 204
+
+    assert stored_file.exists()
+    assert _blob(db_session, second_id).ref_count == 1
+    assert app_client.get(f"/api/v1/books/{second_id}/download").is_success
+
+    assert app_client.delete(f"/api/v1/books/{second_id}").status_code == 204
+
+    assert list(uploads_path.iterdir()) == []
+    assert db_session.query(BookBlob).count() == 0
+
+
+def test_deleting_a_book_without_a_blob_removes_its_own_file(
+    app_client: TestClient,
+    uploads_path: Path,
+    db_session: Session,
+    dummy_user: SupabaseUser,
+) -> None:
+    book_id = uuid4()
+    uploads_path.mkdir(parents=True, exist_ok=True)
+    (uploads_path / f"{book_id}.epub").write_bytes(DUMMY_BOOK.read_bytes())
+    db_session.add(
+        Book(
+            id=book_id,
+            user_id=UUID(dummy_user.id),
+            title="Uploaded Before Deduplication",
+            file_path=f"{book_id}.epub",
+        )
+    )
+    db_session.commit()
+
+    assert app_client.delete(f"/api/v1/books/{book_id}").status_code == 204
+
+    assert list(uploads_path.iterdir()) == []
+
+
+def test_upload_is_not_saved_when_storing_the_file_fails(
+    app_client: TestClient,
+    uploads_path: Path,
+    db_session: Session,
+    mocker: MockerFixture,
+) -> None:
+    mocker.patch.object(BlobStore, "put", side_effect=OSError("No space left"))
+
+    assert upload_book(app_client, DUMMY_BOOK).status_code == 500
+    response = app_client.post(
+        "/api/v1/books",
+        params={"background": True},
+        files={"file": ("book.epub", DUMMY_BOOK.read_bytes())},
+    )
+    assert response.status_code == 500
+    response = app_client.post(
+        "/api/v1/books/batch",
+        files=[("files", ("book.epub", DUMMY_BOOK.read_bytes()))],
+    )
+    assert response.json() == [
+        {
+            "filename": "book.epub",
+            "success": False,
+            "error": "Failed to store the EPUB file: No space left",
+            "book": None,
+        }
+    ]
+
+    assert app_client.get("/api/v1/books").json() == []
+    assert db_session.query(BookBlob).count() == 0
+    assert list(uploads_path.iterdir()) == []
@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta, timezone
+from uuid import UUID, uuid4
+
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+from supabase_auth import User as SupabaseUser
+
+from kosync_backend.database import Book
+
+
+def _add_books(db_session: Session, user: SupabaseUser, books: list[dict]) -> list[str]:
+    uploaded_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    rows = [
+        Book(
+            id=uuid4(),
+            user_id=UUID(user.id),
+            file_path=f"{index}.epub",
+            upload_date=uploaded_at + timedelta(minutes=index),
+            **book,
+        )
+        for index, book in enumerate(books)
+    ]
+    db_session.add_all(rows)
+    db_session.commit()
+
+    return [str(row.id) for row in rows]
+
+
+def _all_pages(app_client: TestClient, **params) -> list[list[str]]:
+    pages = []
+    cursor = None
+
+    while True:
+        response = app_client.get(
+            "/api/v1/books", params={**params, **({"cursor": cursor} if cursor else {})}
+        )
+        assert response.is_success
+        pages.append([book["id"] for book in response.json()])
+
+        if (cursor := response.headers.get("X-Next-Cursor")) is None:
+            return pages
+
+
+def test_books_are_paginated_newest_first(
+    app_client: TestClient, db_session: Session, dummy_user: SupabaseUser
+) -> None:
+    book_ids = _add_books(db_session, dummy_user, [{"title": "Book"}] * 5)
+
+    response = app_client.get("/api/v1/books", params={"limit": 2})
+
+    assert response.headers["X-Total-Count"] == "5"
+    assert _all_pages(app_client, limit=2) == [
+        book_ids[4:2:-1],
+        book_ids[2:0:-1],
+        book_ids[:1],
+    ]
+
+
+def test_pagination_breaks_ties_on_the_id(
+    app_client: TestClient, db_session: Session, dummy_user: SupabaseUser
+) -> None:
+    book_ids = _add_books(db_session, dummy_user, [{"title": "Same"}] * 5)
+
+    pages = _all_pages(app_client, sort="title", limit=2)
+
+    assert [book_id for page in pages for book_id in page] == sorted(
+        book_ids, key=lambda book_id: UUID(book_id).hex
+    )
+
+
+def test_books_can_be_sorted_and_filtered(
+    app_client: TestClient, db_session: Session, dummy_user: SupabaseUser
+) -> None:
+    first, second, third = _add_books(
+        db_session,
+        dummy_user,
+        [
+            {"title": "Beta", "author": "Verne", "language": "fr"},
+            {"title": "Alpha", "author": "Verne", "language": "en"},
+            {"title": "Al_pha", "author": "Wells", "language": "en"},
+        ],
+    )
+
+    def listed(**params) -> list[str]:
+        return [
+            book["id"] for book in app_client.get("/api/v1/books", params=params).json()
+        ]
+
+    assert listed(sort="title") == [third, second, first]
+    assert listed(sort="-title") == [first, second, third]
+    assert listed(sort="upload_date") == [first, second, third]
+    assert listed(author="verne") == [second, first]
+    assert listed(language="en", sort="title") == [third, second]
+    # "_" is not a wildcard
+    assert listed(title_prefix="Al_") == [third]
+
+    response = app_client.get("/api/v1/books", params={"author": "Verne"})
+    assert response.headers["X-Total-Count"] == "2"
+
+
+def test_invalid_cursors_are_rejected(
+    app_client: TestClient, db_session: Session, dummy_user: SupabaseUser
+) -> None:
+    _add_books(db_session, dummy_user, [{"title": "Book"}] * 2)
+    cursor = app_client.get("/api/v1/books", params={"limit": 1}).headers[
+        "X-Next-Cursor"
+    ]
+
+    assert (
+        app_client.get("/api/v1/books", params={"cursor": "nonsense"}).status_code
+        == 400
+    )
+    # Cursors only continue the sort they were issued for
+    assert (
+        app_client.get(
+            "/api/v1/books", params={"cursor": cursor, "sort": "title"}
+        ).status_code
+        == 400
+    )
@@ -0,0 +1,142 @@
+from pathlib import Path
+from uuid import UUID, uuid4
+
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+from supabase_auth import User as SupabaseUser
+
+from kosync_backend.database import Book, BookBlob
+from tests.conftest import upload_book
+
+
+DUMMY_BOOK = (
+    Path(__file__).parent / "resources" / "Around the World in 28 Languages.epub"
+)
+
+
+def _add_book(db_session: Session, user_id: UUID, **metadata) -> str:
+    book = Book(id=uuid4(), user_id=user_id, file_path="book.epub", **metadata)
+    db_session.add(book)
+    db_session.commit()
+
+    return str(book.id)
+
+
+def _book_ids(app_client: TestClient) -> set[str]:
+    return {book["id"] for book in app_client.get("/api/v1/books").json()}
+
+
+def test_bulk_delete_reports_every_id(
+    app_client: TestClient, uploads_path: Path, db_session: Session
+) -> None:
+    first = upload_book(app_client, DUMMY_BOOK).json()["id"]
+    second = upload_book(app_client, DUMMY_BOOK).json()["id"]
+    kept = upload_book(app_client, DUMMY_BOOK).json()["id"]
+    cursor = app_client.post("/api/v1/sync/changes", json={}).json()["cursor"]
+    missing = str(uuid4())
+
+    response = app_client.post(
+        "/api/v1/books/bulk-delete", json={"ids": [first, missing, second, first]}
+    )
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {"id": first, "success": True, "error": None},
+        {"id": missing, "success": False, "error": "Book not found"},
+        {"id": second, "success": True, "error": None},
+    ]
+    assert _book_ids(app_client) == {kept}
+
+    # The file is still shared with the remaining book
+    assert len(list(uploads_path.iterdir())) == 1
+    db_session.expire_all()
+    assert db_session.query(BookBlob).one().ref_count == 1
+
+    changes = app_client.post("/api/v1/sync/changes", json={"cursor": cursor}).json()
+    assert {book["id"] for book in changes["removed"]} == {first, second}
+
+
+def test_bulk_delete_removes_unshared_files(
+    app_client: TestClient, uploads_path: Path, db_session: Session
+) -> None:
+    book_ids = [upload_book(app_client, DUMMY_BOOK).json()["id"] for _ in range(2)]
+
+    response = app_client.post("/api/v1/books/bulk-delete", json={"ids": book_ids})
+
+    assert all(result["success"] for result in response.json())
+    assert list(uploads_path.iterdir()) == []
+    assert db_session.query(BookBlob).count() == 0
+
+
+def test_bulk_delete_by_filter(
+    app_client: TestClient, db_session: Session, dummy_user: SupabaseUser
+) -> None:
+    user_id = UUID(dummy_user.id)
+    verne = _add_book(db_session, user_id, title="Around the World", author="Verne")
+    wells = _add_book(db_session, user_id, title="The Time Machine", author="Wells")
+
+    response = app_client.post(
+        "/api/v1/books/bulk-delete", json={"filter": {"author": "verne"}}
+    )
+
+    assert response.json() == [{"id": verne, "success": True, "error": None}]
+    assert _book_ids(app_client) == {wells}
+
+
+def test_bulk_requests_need_a_selection(app_client: TestClient) -> None:
+    for selection in [{}, {"filter": {}}, {"ids": []}, {"ids": [], "filter": {}}]:
+        response = app_client.post("/api/v1/books/bulk-delete", json=selection)
+        assert response.status_code == 422
+
+    response = app_client.post(
+        "/api/v1/books/bulk-update", json={"ids": [str(uuid4())], "changes": {}}
+    )
+    assert response.status_code == 422
+
+
+def test_bulk_update_changes_only_the_given_fields(
+    app_client: TestClient, db_session: Session, dummy_user: SupabaseUser
+) -> None:
+    user_id = UUID(dummy_user.id)
+    first = _add_book(db_session, user_id, title="Draft", author="Someone")
+    second = _add_book(db_session, user_id, title="Other", author="Someone")
+    cursor = app_client.post("/api/v1/sync/changes", json={}).json()["cursor"]
+
+    response = app_client.post(
+        "/api/v1/books/bulk-update",
+        json={"filter": {"author": "Someone"}, "changes": {"author": "Verne"}},
+    )
+
+    assert {result["id"] for result in response.json()} == {first, second}
+    books = {book["id"]: book for book in app_client.get("/api/v1/books").json()}
+    assert books[first]["title"] == "Draft"
+    assert books[first]["author"] == books[second]["author"] == "Verne"
+
+    # The search index follows set-based updates too
+    search = app_client.get("/api/v1/books/search", params={"q": "verne"}).json()
+    assert {result["book"]["id"] for result in search} == {first, second}
+
+    changes = app_client.post("/api/v1/sync/changes", json={"cursor": cursor}).json()
+    assert {book["id"] for book in changes["updated"]} == {first, second}
+
+
+def test_bulk_requests_only_touch_the_users_books(
+    app_client: TestClient, db_session: Session
+) -> None:
+    other_users_book = _add_book(db_session, uuid4(), title="Not Mine")
+
+    updated = app_client.post(
+        "/api/v1/books/bulk-update",
+        json={"ids": [other_users_book], "changes": {"title": "Mine"}},
+    )
+    deleted = app_client.post(
+        "/api/v1/books/bulk-delete", json={"ids": [other_users_book]}
+    )
+
+    assert (
+        updated.json()
+        == deleted.json()
+        == [{"id": other_users_book, "success": False, "error": "Book not found"}]
+    )
+    db_session.expire_all()
+    assert db_session.get_one(Book, UUID(other_users_book)).title == "Not Mine"
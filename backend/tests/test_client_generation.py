@@ -1,43 +1,21 @@
+import io
+import json
 import os
 from pathlib import Path
-import shutil
 import tarfile
 import tempfile
-from unittest import mock
 
-import pytest
-from pytest_mock import MockerFixture
 
 from kosync_backend.client_generator import ClientGenerator
 from kosync_backend.config import Settings
 
 
-@pytest.fixture()
-def mock_nickelmenu_download(mocker: MockerFixture) -> mock.Mock:
-    kobo_root_path = Path(__file__).parent / "resources" / "nickelmenu_KoboRoot.tgz"
-
-    return mocker.patch.object(
-        ClientGenerator, "_download_nickelmenu", return_value=kobo_root_path
-    )
-
-
-@pytest.fixture()
-def mock_nickeldbus_download(mocker: MockerFixture) -> mock.Mock:
-    kobo_root_path = Path(__file__).parent / "resources" / "nickeldbus_KoboRoot.tgz"
-
-    return mocker.patch.object(
-        ClientGenerator, "_download_nickeldbus", return_value=kobo_root_path
-    )
-
-
-def test_client_generation_fetches_all_resources(
-    mock_nickelmenu_download: mock.Mock,
-    mock_nickeldbus_download: mock.Mock,
+def test_client_generation_prepares_all_resources(
+    artifacts_path: Path,
 ) -> None:
-    with ClientGenerator(Settings()) as client_generator:
-        assert mock_nickelmenu_download.called
-        assert mock_nickeldbus_download.called
-
+    with ClientGenerator(
+        Settings(artifact_dir=str(artifacts_path))
+    ) as client_generator:
         root_path = Path(str(client_generator.root_directory))
 
         assert set(os.listdir(root_path)) == {"etc", "usr", "mnt"}
@@ -58,18 +36,14 @@ def test_client_generation_fetches_all_resources(
 
 
 def test_client_generation_generates_a_client_archive(
-    mock_nickelmenu_download: mock.Mock,
-    mock_nickeldbus_download: mock.Mock,
+    artifacts_path: Path,
 ) -> None:
     with tempfile.TemporaryDirectory() as temp_dir:
-        with ClientGenerator(Settings()) as client_generator:
-            assert mock_nickelmenu_download.called
-            assert mock_nickeldbus_download.called
-
-            archive_path = client_generator.generate(token := "foo")
-
-            assert archive_path.exists()
-            shutil.copy(archive_path, client_path := Path(temp_dir) / "KoboRoot.tgz")
+        with ClientGenerator(
+            Settings(artifact_dir=str(artifacts_path))
+        ) as client_generator:
+            client_path = Path(temp_dir) / "KoboRoot.tgz"
+            client_path.write_bytes(b"".join(client_generator.generate(token := "foo")))
 
         assert client_path.exists()
         with tarfile.open(client_path, "r:gz") as client_archive:
@@ -88,3 +62,29 @@ def test_client_generation_generates_a_client_archive(
         assert f'"Token": "{token}"' in (
             (client_path.parent / "mnt" / "onboard" / ".kosyncConfig.json").read_text()
         )
+
+
+def test_client_generation_does_not_share_files_between_downloads(
+    artifacts_path: Path,
+) -> None:
+    with ClientGenerator(
+        Settings(artifact_dir=str(artifacts_path))
+    ) as client_generator:
+        contents_before = sorted(client_generator.root_directory.rglob("*"))
+
+        # Interleave two downloads, as concurrent requests would
+        first = client_generator.generate("first")
+        second = client_generator.generate("second")
+        archives = {
+            "second": b"".join(second),
+            "first": b"".join(first),
+        }
+
+        assert sorted(client_generator.root_directory.rglob("*")) == contents_before
+
+    for token, archive in archives.items():
+        with tarfile.open(fileobj=io.BytesIO(archive), mode="r:gz") as client_archive:
+            config = client_archive.extractfile("mnt/onboard/.kosyncConfig.json")
+            assert config is not None
+            assert json.load(config)["Token"] == token
+            assert "mnt/onboard/kosync_client" in client_archive.getnames()
@@ -0,0 +1,127 @@
+import hashlib
+import io
+from pathlib import Path
+import sqlite3
+
+from fastapi.testclient import TestClient
+from PIL import Image
+from sqlalchemy import inspect
+
+from kosync_backend.config import Settings
+from kosync_backend.covers import CoverStore
+from kosync_backend.database import get_engine, initialise_db
+from tests.conftest import upload_book
+
+
+DUMMY_BOOK = (
+    Path(__file__).parent / "resources" / "Around the World in 28 Languages.epub"
+)
+
+
+def test_book_listing_references_cover_by_hash(app_client: TestClient) -> None:
+    upload_book(app_client, DUMMY_BOOK)
+
+    [book] = app_client.get("/api/v1/books").json()
+
+    assert "cover_image_base64" not in book
+    assert len(book["cover_hash"]) == 64
+
+
+def test_cover_endpoint_serves_original_with_etag(app_client: TestClient) -> None:
+    book = upload_book(app_client, DUMMY_BOOK).json()
+
+    response = app_client.get(f"/api/v1/books/{book['id']}/cover")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.headers["etag"] == f'"{book["cover_hash"]}"'
+    assert response.headers["cache-control"] == "private, no-cache"
+    assert hashlib.sha256(response.content).hexdigest() == book["cover_hash"]
+
+
+def test_cover_endpoint_answers_not_modified(app_client: TestClient) -> None:
+    book = upload_book(app_client, DUMMY_BOOK).json()
+    url = f"/api/v1/books/{book['id']}/cover"
+
+    etag = app_client.get(url).headers["etag"]
+    response = app_client.get(url, headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+def test_versioned_cover_url_is_immutable(app_client: TestClient) -> None:
+    book = upload_book(app_client, DUMMY_BOOK).json()
+
+    response = app_client.get(
+        f"/api/v1/books/{book['id']}/cover", params={"v": book["cover_hash"]}
+    )
+
+    assert "immutable" in response.headers["cache-control"]
+
+
+def test_cover_endpoint_serves_thumbnails(
+    app_client: TestClient, covers_path: Path
+) -> None:
+    book = upload_book(app_client, DUMMY_BOOK).json()
+
+    response = app_client.get(
+        f"/api/v1/books/{book['id']}/cover", params={"width": 160}
+    )
+
+    assert response.status_code == 200
+    assert response.headers["etag"] == f'"{book["cover_hash"]}-160"'
+    assert Image.open(io.BytesIO(response.content)).width == 160
+    assert len(list(covers_path.rglob("*-160.jpg"))) == 1
+
+
+def test_cover_endpoint_rejects_unknown_widths(app_client: TestClient) -> None:
+    book = upload_book(app_client, DUMMY_BOOK).json()
+
+    response = app_client.get(
+        f"/api/v1/books/{book['id']}/cover", params={"width": 123}
+    )
+
+    assert response.status_code == 400
+
+
+def test_cover_store_deduplicates_identical_covers(tmp_path: Path) -> None:
+    cover_store = CoverStore(tmp_path)
+
+    assert cover_store.put(b"cover") == cover_store.put(b"cover")
+    assert len([path for path in tmp_path.rglob("*") if path.is_file()]) == 1
+
+
+def test_migration_moves_cover_blobs_out_of_books_table(tmp_path: Path) -> None:
+    database_path = tmp_path / "kosync.db"
+    with sqlite3.connect(database_path) as connection:
+        connection.execute(
+            "CREATE TABLE books (id CHAR(32) PRIMARY KEY, user_id CHAR(32) NOT NULL,"
+            " title VARCHAR NOT NULL, author VARCHAR, publisher VARCHAR,"
+            " isbn VARCHAR, language VARCHAR, description TEXT, cover_image BLOB,"
+            " file_path VARCHAR NOT NULL, file_size INTEGER, upload_date DATETIME)"
+        )
+        connection.execute(
+            "INSERT INTO books (id, user_id, title, cover_image, file_path)"
+            " VALUES ('a' , 'b', 'Title', ?, 'a.epub')",
+            (b"cover-bytes",),
+        )
+
+    settings = Settings(
+        database_url=f"sqlite:///{database_path}", cover_dir=str(tmp_path / "covers")
+    )
+    engine = get_engine(settings)
+    initialise_db(engine, settings)
+
+    columns = {column["name"] for column in inspect(engine).get_columns("books")}
+    assert "cover_image" not in columns
+
+    with engine.connect() as connection:
+        cover_hash = connection.exec_driver_sql(
+            "SELECT cover_hash FROM books"
+        ).scalar_one()
+
+    assert cover_hash == hashlib.sha256(b"cover-bytes").hexdigest()
+    assert CoverStore(settings.cover_dir).get(cover_hash)[0] == b"cover-bytes"
+
+    engine.dispose()
@@ -0,0 +1,60 @@
+from pathlib import Path
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from kosync_backend.config import Settings
+from kosync_backend.database import EngineRegistry
+
+
+def test_engine_registry_reuses_a_single_engine(tmp_path: Path) -> None:
+    with EngineRegistry(
+        Settings(database_url=f"sqlite:///{tmp_path / 'kosync.db'}")
+    ) as registry:
+        assert registry.get_engine() is registry.get_engine()
+
+
+def test_engine_applies_sqlite_pragmas(tmp_path: Path) -> None:
+    settings = Settings(
+        database_url=f"sqlite:///{tmp_path / 'kosync.db'}",
+        sqlite_busy_timeout_ms=1234,
+        sqlite_mmap_size=4096,
+    )
+
+    with EngineRegistry(settings) as registry:
+        with registry.get_engine().connect() as connection:
+            assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            # NORMAL
+            assert connection.execute(text("PRAGMA synchronous")).scalar() == 1
+            assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 1234
+            assert connection.execute(text("PRAGMA mmap_size")).scalar() == 4096
+
+
+def test_engine_registry_reports_pool_statistics(tmp_path: Path) -> None:
+    settings = Settings(
+        database_url=f"sqlite:///{tmp_path / 'kosync.db'}",
+        database_pool_size=3,
+        database_max_overflow=2,
+    )
+
+    with EngineRegistry(settings) as registry:
+        with registry.get_engine().connect():
+            [statistics] = registry.pool_statistics()
+
+            assert statistics.pool == "QueuePool"
+            assert statistics.size == 3
+            assert statistics.checked_out == 1
+
+
+def test_requests_share_the_lifespan_engine(
+    app_client: TestClient, app: FastAPI
+) -> None:
+    registry: EngineRegistry = app.state.engine_registry
+    engine = registry.get_engine()
+
+    assert app_client.get("/api/v1/books").is_success
+    assert app_client.get("/api/v1/books").is_success
+
+    assert registry.get_engine() is engine
+    assert len(registry.pool_statistics()) == 1
@@ -0,0 +1,168 @@
+from datetime import datetime, timedelta, timezone
+import io
+import json
+import tarfile
+from pathlib import Path
+from uuid import UUID
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import pytest
+from pytest_mock import MockerFixture
+from supabase_auth import User as SupabaseUser
+
+from kosync_backend.auth_client import AuthClient
+from kosync_backend.config import get_settings
+from kosync_backend.database import DeviceCredential
+from kosync_backend.devices import DeviceAuthenticator, hash_device_token
+from kosync_backend.user_middleware import get_current_device
+from tests.conftest import upload_book
+
+
+DUMMY_BOOK = (
+    Path(__file__).parent / "resources" / "Around the World in 28 Languages.epub"
+)
+
+
+@pytest.fixture
+def device_client(app_client: TestClient, app: FastAPI) -> TestClient:
+    """An app client whose sync endpoints use real device authentication."""
+    del app.dependency_overrides[get_current_device]
+
+    return app_client
+
+
+def _device_authenticator(app: FastAPI) -> DeviceAuthenticator:
+    return app.state.device_authenticator
+
+
+def _sync(app_client: TestClient, token: str):
+    return app_client.post(
+        "/api/v1/sync/", json=[], headers={"Authorization": f"Bearer {token}"}
+    )
+
+
+def test_generated_clients_get_their_own_device_token(
+    device_client: TestClient, db_session, dummy_user: SupabaseUser
+) -> None:
+    response = device_client.get("/api/v1/download")
+    assert response.is_success
+
+    with tarfile.open(fileobj=io.BytesIO(response.content), mode="r:gz") as archive:
+        config_file = archive.extractfile("mnt/onboard/.kosyncConfig.json")
+        assert config_file is not None
+        config = json.load(config_file)
+
+    token = config["Token"]
+    assert token != dummy_user.id
+
+    credential = db_session.query(DeviceCredential).one()
+    assert credential.user_id == UUID(dummy_user.id)
+    # Only the hash is stored
+    assert credential.token_hash == hash_device_token(token)
+
+    upload_book(device_client, DUMMY_BOOK)
+    response = _sync(device_client, token)
+    assert response.is_success
+    assert len(response.json()) == 1
+
+
+def test_device_tokens_are_cached(
+    device_client: TestClient,
+    app: FastAPI,
+    dummy_user: SupabaseUser,
+    mocker: MockerFixture,
+) -> None:
+    authenticator = _device_authenticator(app)
+    _, token = authenticator.issue(UUID(dummy_user.id))
+
+    assert _sync(device_client, token).is_success
+
+    session = mocker.spy(authenticator, "_session")
+    assert _sync(device_client, token).is_success
+    session.assert_not_called()
+
+
+def test_revoked_devices_can_no_longer_sync(
+    device_client: TestClient, app: FastAPI, dummy_user: SupabaseUser
+) -> None:
+    authenticator = _device_authenticator(app)
+    credential, token = authenticator.issue(UUID(dummy_user.id))
+    assert _sync(device_client, token).is_success
+
+    devices = device_client.get("/api/v1/devices").json()
+    assert [device["id"] for device in devices] == [str(credential.id)]
+    assert devices[0]["last_used_at"] is not None
+
+    response = device_client.delete(f"/api/v1/devices/{credential.id}")
+    assert response.status_code == 204
+
+    response = _sync(device_client, token)
+    assert response.status_code == 401
+    assert device_client.get("/api/v1/devices").json()[0]["revoked_at"] is not None
+
+
+def test_revoking_an_unknown_device_returns_404(device_client: TestClient) -> None:
+    response = device_client.delete(
+        "/api/v1/devices/00000000-0000-0000-0000-000000000000"
+    )
+
+    assert response.status_code == 404
+
+
+def test_unknown_device_tokens_are_rejected(device_client: TestClient) -> None:
+    assert _sync(device_client, "kosync_unknown").status_code == 401
+
+
+def test_legacy_user_id_tokens_still_work(
+    device_client: TestClient, dummy_user: SupabaseUser, mocker: MockerFixture
+) -> None:
+    get_user_by_id = mocker.patch.object(
+        AuthClient, "get_user_by_id", return_value=dummy_user
+    )
+
+    assert _sync(device_client, dummy_user.id).is_success
+    # Looked up once, then cached like device tokens
+    assert _sync(device_client, dummy_user.id).is_success
+    get_user_by_id.assert_called_once_with(dummy_user.id)
+
+
+def test_legacy_user_id_tokens_can_be_disabled(
+    device_client: TestClient,
+    app: FastAPI,
+    dummy_user: SupabaseUser,
+    mocker: MockerFixture,
+) -> None:
+    app.dependency_overrides[get_settings] = lambda: get_settings().model_copy(
+        update={"legacy_user_id_tokens": False}
+    )
+    get_user_by_id = mocker.patch.object(
+        AuthClient, "get_user_by_id", return_value=dummy_user
+    )
+
+    assert _sync(device_client, dummy_user.id).status_code == 401
+    get_user_by_id.assert_not_called()
+
+
+def test_unused_device_tokens_expire(
+    device_client: TestClient, app: FastAPI, db_session, dummy_user: SupabaseUser
+) -> None:
+    authenticator = _device_authenticator(app)
+    used, used_token = authenticator.issue(UUID(dummy_user.id))
+    unused, unused_token = authenticator.issue(UUID(dummy_user.id))
+    assert _sync(device_client, used_token).is_success
+
+    week_ago = datetime.now(timezone.utc) - timedelta(days=7, seconds=1)
+    db_session.query(DeviceCredential).update({"created_at": week_ago})
+    db_session.commit()
+
+    assert _sync(device_client, unused_token).status_code == 401
+    assert [device["id"] for device in device_client.get("/api/v1/devices").json()] == [
+        str(used.id)
+    ]
+
+    # Issuing another one deletes it
+    authenticator.issue(UUID(dummy_user.id))
+    db_session.expire_all()
+    assert db_session.get(DeviceCredential, unused.id) is None
+    assert _sync(device_client, used_token).is_success
@@ -0,0 +1,198 @@
+import asyncio
+from email.utils import formatdate
+import hashlib
+from pathlib import Path
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import pytest
+from starlette.types import Message
+
+from kosync_backend.config import get_settings
+from kosync_backend.delivery import BookFileResponse
+from tests.conftest import upload_book
+
+
+DUMMY_BOOK = (
+    Path(__file__).parent / "resources" / "Around the World in 28 Languages.epub"
+)
+
+DOWNLOAD_URLS = [
+    "/api/v1/books/{book_id}/download",
+    "/api/v1/sync/books/{book_id}/download",
+]
+
+
+@pytest.fixture
+def uploaded_book(app_client: TestClient) -> dict:
+    return upload_book(app_client, DUMMY_BOOK).json()
+
+
+@pytest.mark.parametrize("url", DOWNLOAD_URLS)
+def test_download_has_a_strong_etag_from_the_content_hash(
+    app_client: TestClient, uploaded_book: dict, url: str
+) -> None:
+    response = app_client.get(url.format(book_id=uploaded_book["id"]))
+
+    assert response.content == DUMMY_BOOK.read_bytes()
+    assert response.headers["ETag"] == (
+        f'"{hashlib.sha256(DUMMY_BOOK.read_bytes()).hexdigest()}"'
+    )
+    assert response.headers["Accept-Ranges"] == "bytes"
+
+
+@pytest.mark.parametrize("url", DOWNLOAD_URLS)
+def test_download_is_revalidated_without_a_body(
+    app_client: TestClient, uploaded_book: dict, url: str
+) -> None:
+    url = url.format(book_id=uploaded_book["id"])
+    etag = app_client.get(url).headers["ETag"]
+
+    assert app_client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    assert app_client.get(url, headers={"If-None-Match": '"other"'}).status_code == 200
+
+    in_the_future = formatdate(time.time() + 60, usegmt=True)
+    response = app_client.get(url, headers={"If-Modified-Since": in_the_future})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+
+
+@pytest.mark.parametrize("url", DOWNLOAD_URLS)
+def test_interrupted_download_resumes_byte_exactly(
+    app_client: TestClient, uploaded_book: dict, url: str
+) -> None:
+    url = url.format(book_id=uploaded_book["id"])
+    content = DUMMY_BOOK.read_bytes()
+    received = bytearray()
+
+    # The connection drops after the first chunk
+    with app_client.stream("GET", url) as response:
+        etag = response.headers["ETag"]
+        received += next(response.iter_bytes(chunk_size=1000))
+
+    response = app_client.get(
+        url, headers={"Range": f"bytes={len(received)}-", "If-Range": etag}
+    )
+
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == (
+        f"bytes {len(received)}-{len(content) - 1}/{len(content)}"
+    )
+    assert bytes(received + response.content) == content
+
+
+def test_stale_if_range_sends_the_whole_file(
+    app_client: TestClient, uploaded_book: dict
+) -> None:
+    response = app_client.get(
+        f"/api/v1/books/{uploaded_book['id']}/download",
+        headers={"Range": "bytes=100-", "If-Range": '"stale"'},
+    )
+
+    assert response.status_code == 200
+    assert response.content == DUMMY_BOOK.read_bytes()
+
+
+def test_multiple_ranges_are_sent_as_multipart(
+    app_client: TestClient, uploaded_book: dict
+) -> None:
+    content = DUMMY_BOOK.read_bytes()
+
+    response = app_client.get(
+        f"/api/v1/books/{uploaded_book['id']}/download",
+        headers={"Range": "bytes=0-9,100-109"},
+    )
+
+    assert response.status_code == 206
+    content_type = response.headers["Content-Type"]
+    assert content_type.startswith("multipart/byteranges; boundary=")
+    assert int(response.headers["Content-Length"]) == len(response.content)
+
+    boundary = content_type.split("boundary=")[1]
+    parts = response.content.split(f"--{boundary}".encode())
+    assert parts[0] == b"" and parts[-1] == b"--\r\n"
+    assert [part.split(b"\r\n\r\n", 1)[1] for part in parts[1:-1]] == [
+        content[0:10] + b"\r\n",
+        content[100:110] + b"\r\n",
+    ]
+    assert b"Content-Range: bytes 100-109/" in parts[2]
+
+
+def test_download_of_a_missing_file_is_not_found(
+    app_client: TestClient, uploaded_book: dict, uploads_path: Path
+) -> None:
+    for path in uploads_path.iterdir():
+        path.unlink()
+
+    response = app_client.get(f"/api/v1/books/{uploaded_book['id']}/download")
+
+    assert response.status_code == 404
+
+
+def _with_delivery(app: FastAPI, book_delivery: str) -> None:
+    app.dependency_overrides[get_settings] = lambda: get_settings().model_copy(
+        update={"book_delivery": book_delivery}
+    )
+
+
+@pytest.mark.parametrize("url", DOWNLOAD_URLS)
+def test_download_is_offloaded_to_nginx(
+    app_client: TestClient,
+    app: FastAPI,
+    uploaded_book: dict,
+    uploads_path: Path,
+    url: str,
+) -> None:
+    _with_delivery(app, "x-accel-redirect")
+    url = url.format(book_id=uploaded_book["id"])
+    [stored_file] = uploads_path.iterdir()
+
+    response = app_client.get(url)
+
+    assert response.status_code == 200
+    assert response.content == b""
+    assert response.headers["X-Accel-Redirect"] == (
+        f"/internal/uploads/{stored_file.name}"
+    )
+    assert response.headers["Content-Type"] == "application/epub+zip"
+
+    etag = response.headers["ETag"]
+    assert app_client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_download_is_offloaded_with_x_sendfile(
+    app_client: TestClient, app: FastAPI, uploaded_book: dict, uploads_path: Path
+) -> None:
+    _with_delivery(app, "x-sendfile")
+    [stored_file] = uploads_path.iterdir()
+
+    response = app_client.get(f"/api/v1/books/{uploaded_book['id']}/download")
+
+    assert response.headers["X-Sendfile"] == str(stored_file.resolve())
+
+
+def test_servers_supporting_path_send_are_handed_the_file() -> None:
+    messages: list[Message] = []
+
+    async def receive() -> Message:
+        return {"type": "http.request", "body": b""}
+
+    async def send(message: Message) -> None:
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "headers": [],
+        "extensions": {"http.response.pathsend": {}},
+    }
+
+    asyncio.run(BookFileResponse(DUMMY_BOOK)(scope, receive, send))
+
+    assert [message["type"] for message in messages] == [
+        "http.response.start",
+        "http.response.pathsend",
+    ]
+    assert messages[1]["path"] == str(DUMMY_BOOK)
@@ -0,0 +1,110 @@
+from pathlib import Path
+import zipfile
+
+from ebooklib import epub
+import pytest
+
+from kosync_backend import epub as kosync_epub
+from kosync_backend.epub import extract_epub
+
+
+DUMMY_BOOK = (
+    Path(__file__).parent / "resources" / "Around the World in 28 Languages.epub"
+)
+
+
+def _write_epub(path: Path, manifest: str, metadata: str = "") -> Path:
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("mimetype", "application/epub+zip")
+        archive.writestr(
+            "META-INF/container.xml",
+            '<container xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+            '<rootfiles><rootfile full-path="OEBPS/content.opf"/></rootfiles>'
+            "</container>",
+        )
+        archive.writestr(
+            "OEBPS/content.opf",
+            '<package xmlns="http://www.idpf.org/2007/opf" version="3.0">'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+            f"<dc:title>Test</dc:title>{metadata}</metadata>"
+            f"<manifest>{manifest}</manifest></package>",
+        )
+        archive.writestr("OEBPS/images/first.png", b"first")
+        archive.writestr("OEBPS/images/my cover.jpg", b"cover")
+
+    return path
+
+
+def test_extract_epub_matches_ebooklib() -> None:
+    book = epub.read_epub(DUMMY_BOOK)
+
+    extracted = extract_epub(DUMMY_BOOK)
+
+    assert extracted.metadata.title == book.get_metadata("DC", "title")[0][0]
+    assert extracted.metadata.author == book.get_metadata("DC", "creator")[0][0]
+    assert extracted.metadata.publisher == book.get_metadata("DC", "publisher")[0][0]
+    assert extracted.metadata.isbn == book.get_metadata("DC", "identifier")[0][0]
+    assert extracted.metadata.language == book.get_metadata("DC", "language")[0][0]
+    assert (
+        extracted.metadata.description == book.get_metadata("DC", "description")[0][0]
+    )
+    assert extracted.cover == book.get_item_with_id("cover").get_content()
+
+
+def test_extract_epub_finds_epub3_cover_image(tmp_path: Path) -> None:
+    path = _write_epub(
+        tmp_path / "book.epub",
+        '<item id="a" href="images/first.png" media-type="image/png"/>'
+        '<item id="b" href="images/my%20cover.jpg" media-type="image/jpeg"'
+        ' properties="cover-image"/>',
+    )
+
+    assert extract_epub(path).cover == b"cover"
+
+
+def test_extract_epub_finds_epub2_cover_meta(tmp_path: Path) -> None:
+    path = _write_epub(
+        tmp_path / "book.epub",
+        '<item id="a" href="images/first.png" media-type="image/png"/>'
+        '<item id="b" href="images/my%20cover.jpg" media-type="image/jpeg"/>',
+        metadata='<meta name="cover" content="b"/>',
+    )
+
+    extracted = extract_epub(path)
+
+    assert extracted.cover == b"cover"
+    assert extracted.metadata.author == "Unknown Author"
+
+
+def test_extract_epub_falls_back_to_first_image(tmp_path: Path) -> None:
+    path = _write_epub(
+        tmp_path / "book.epub",
+        '<item id="a" href="images/first.png" media-type="image/png"/>',
+    )
+
+    assert extract_epub(path).cover == b"first"
+
+
+def test_extract_epub_skips_oversized_covers(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(kosync_epub, "MAX_COVER_SIZE", 2)
+    path = _write_epub(
+        tmp_path / "book.epub",
+        '<item id="a" href="images/first.png" media-type="image/png"/>',
+    )
+
+    extracted = extract_epub(path)
+
+    assert extracted.metadata.title == "Test"
+    assert extracted.cover is None
+
+
+def test_extract_epub_falls_back_to_filename(tmp_path: Path) -> None:
+    path = tmp_path / "Not a zip.epub"
+    path.write_bytes(b"garbage")
+
+    extracted = extract_epub(path)
+
+    assert extracted.metadata.title == "Not a zip"
+    assert extracted.cover is None
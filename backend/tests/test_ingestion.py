@@ -0,0 +1,136 @@
+from pathlib import Path
+import time
+from uuid import UUID
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import httpx
+from pytest_mock import MockerFixture
+from sqlalchemy.orm import Session
+
+from kosync_backend.database import Book, ProcessingState
+
+
+DUMMY_BOOK = (
+    Path(__file__).parent / "resources" / "Around the World in 28 Languages.epub"
+)
+
+
+def _upload_in_background(app_client: TestClient) -> httpx.Response:
+    return app_client.post(
+        "/api/v1/books",
+        params={"background": True},
+        files={"file": ("Some Book.epub", DUMMY_BOOK.read_bytes())},
+    )
+
+
+def _wait_for_job(app_client: TestClient, job_id: str) -> dict:
+    deadline = time.monotonic() + 10
+
+    while time.monotonic() < deadline:
+        job = app_client.get(f"/api/v1/books/jobs/{job_id}").json()
+        if job["state"] not in ("pending", "processing"):
+            return job
+        time.sleep(0.01)
+
+    raise TimeoutError(f"Job {job_id} did not finish")
+
+
+def test_background_upload_returns_a_pending_job(app_client: TestClient) -> None:
+    response = _upload_in_background(app_client)
+
+    assert response.status_code == 202
+    assert response.json()["state"] in ("pending", "processing", "ready")
+
+    job = _wait_for_job(app_client, response.json()["id"])
+
+    assert job["state"] == "ready"
+    assert job["error"] is None
+    assert job["book"]["title"] == "Around the World in 28 Languages"
+    assert job["book"]["cover_hash"] is not None
+
+
+def test_jobs_can_be_queried_in_batches(app_client: TestClient) -> None:
+    job_ids = [_upload_in_background(app_client).json()["id"] for _ in range(2)]
+    for job_id in job_ids:
+        _wait_for_job(app_client, job_id)
+
+    response = app_client.get(
+        "/api/v1/books/jobs", params={"id": [*job_ids, str(UUID(int=0))]}
+    )
+
+    assert response.is_success
+    assert sorted(job["id"] for job in response.json()) == sorted(job_ids)
+
+
+def test_unknown_job_is_not_found(app_client: TestClient) -> None:
+    assert app_client.get(f"/api/v1/books/jobs/{UUID(int=0)}").status_code == 404
+
+
+def test_failed_ingestion_is_reported_and_cleaned_up(
+    app_client: TestClient, app: FastAPI, uploads_path: Path, mocker: MockerFixture
+) -> None:
+    mocker.patch(
+        "kosync_backend.ingestion.process_epub", side_effect=ValueError("broken")
+    )
+
+    job_id = _upload_in_background(app_client).json()["id"]
+    job = _wait_for_job(app_client, job_id)
+
+    assert job["state"] == "failed"
+    assert "broken" in job["error"]
+    assert job["book"] is None
+    # The file is removed after the failure is recorded
+    assert app_client.portal is not None
+    app_client.portal.call(app.state.ingestion_queue.join)
+    assert list(uploads_path.iterdir()) == []
+
+
+def test_unfinished_books_are_not_synchronised(
+    app_client: TestClient, db_session: Session, dummy_user
+) -> None:
+    db_session.add(
+        Book(
+            id=UUID(int=1),
+            user_id=UUID(dummy_user.id),
+            title="Failed",
+            file_path="failed.epub",
+            processing_state=ProcessingState.FAILED,
+        )
+    )
+    db_session.commit()
+
+    assert app_client.post("/api/v1/sync", json=[]).json() == []
+
+
+def test_failed_books_are_only_reported_as_jobs(
+    app_client: TestClient, mocker: MockerFixture
+) -> None:
+    mocker.patch(
+        "kosync_backend.ingestion.process_epub", side_effect=ValueError("broken")
+    )
+    job_ids = [_upload_in_background(app_client).json()["id"] for _ in range(5)]
+    for job_id in job_ids:
+        assert _wait_for_job(app_client, job_id)["state"] == "failed"
+
+    response = app_client.get("/api/v1/books")
+    assert response.json() == []
+    assert response.headers["X-Total-Count"] == "0"
+    assert app_client.get("/api/v1/books/search", params={"q": "some"}).json() == []
+
+    # They don't count towards the quota either
+    mocker.stopall()
+    assert _upload_in_background(app_client).status_code == 202
+
+
+def test_unreadable_books_are_titled_after_the_uploaded_file(
+    app_client: TestClient,
+) -> None:
+    response = app_client.post(
+        "/api/v1/books",
+        params={"background": True},
+        files={"file": ("My Book.epub", b"no metadata")},
+    )
+
+    job = _wait_for_job(app_client, response.json()["id"])
+    assert job["book"]["title"] == "My Book"
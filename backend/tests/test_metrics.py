@@ -0,0 +1,102 @@
+from pathlib import Path
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from prometheus_client.parser import text_string_to_metric_families
+
+from kosync_backend.config import get_settings
+from tests.conftest import upload_book
+
+
+DUMMY_BOOK = (
+    Path(__file__).parent / "resources" / "Around the World in 28 Languages.epub"
+)
+
+
+def _sample(name: str, **labels: str) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def _scrape(app_client: TestClient) -> dict[str, float]:
+    response = app_client.get("/metrics")
+    assert response.status_code == 200
+
+    return {
+        sample.name: sample.value
+        for family in text_string_to_metric_families(response.text)
+        for sample in family.samples
+        if not sample.labels
+    }
+
+
+def test_requests_are_timed_by_route_template(app_client: TestClient) -> None:
+    route = {"method": "GET", "route": "/api/v1/books/{book_id}", "status": "404"}
+    requests_before = _sample("kosync_http_request_duration_seconds_count", **route)
+    selects_before = _sample(
+        "kosync_db_query_duration_seconds_count", statement="SELECT"
+    )
+
+    for book_id in [
+        "6d50e42f-74c5-48f7-a42e-fe91e9ddcf69",
+        "0b3c7a0e-8a39-4a6c-9a52-8b2f7f1f5c11",
+    ]:
+        assert app_client.get(f"/api/v1/books/{book_id}").status_code == 404
+
+    assert (
+        _sample("kosync_http_request_duration_seconds_count", **route)
+        == requests_before + 2
+    )
+    assert (
+        _sample("kosync_db_query_duration_seconds_count", statement="SELECT")
+        >= selects_before + 2
+    )
+
+
+def test_uploads_are_measured(app_client: TestClient) -> None:
+    uploads_before = _sample("kosync_upload_size_bytes_count")
+    upload_bytes_before = _sample("kosync_upload_size_bytes_sum")
+    parses_before = _sample(
+        "kosync_worker_job_duration_seconds_count", job="process_epub"
+    )
+
+    assert upload_book(app_client, DUMMY_BOOK).is_success
+
+    assert _sample("kosync_upload_size_bytes_count") == uploads_before + 1
+    assert (
+        _sample("kosync_upload_size_bytes_sum")
+        == upload_bytes_before + DUMMY_BOOK.stat().st_size
+    )
+    assert (
+        _sample("kosync_worker_job_duration_seconds_count", job="process_epub")
+        == parses_before + 1
+    )
+
+    metrics = _scrape(app_client)
+    assert metrics["kosync_worker_pool_jobs_completed_total"] == 1
+    assert metrics["kosync_worker_pool_pending_jobs"] == 0
+
+
+def test_sync_diff_sizes_are_measured(app_client: TestClient) -> None:
+    upload_book(app_client, DUMMY_BOOK)
+    added_before = _sample("kosync_sync_changes_sum", kind="added")
+
+    assert app_client.post("/api/v1/sync/changes", json={}).is_success
+
+    assert _sample("kosync_sync_changes_sum", kind="added") == added_before + 1
+
+
+def test_metrics_can_require_a_token(app_client: TestClient, app: FastAPI) -> None:
+    app.dependency_overrides[get_settings] = lambda: get_settings().model_copy(
+        update={"metrics_token": "scraper-token"}
+    )
+
+    # The client's default header is a user's token
+    response = app_client.get("/metrics")
+    assert response.status_code == 401
+    assert app_client.get("/metrics", headers={"Authorization": ""}).status_code == 401
+
+    response = app_client.get(
+        "/metrics", headers={"Authorization": "Bearer scraper-token"}
+    )
+    assert response.status_code == 200
@@ -0,0 +1,163 @@
+from collections.abc import Generator
+from pathlib import Path
+import sqlite3
+from uuid import uuid4
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import pytest
+from sqlalchemy import Engine, event, inspect
+
+from kosync_backend.config import Settings
+from kosync_backend.database import get_engine, initialise_db
+from tests.conftest import upload_book
+
+
+DUMMY_BOOK = (
+    Path(__file__).parent / "resources" / "Around the World in 28 Languages.epub"
+)
+
+INDEXED_TABLES = ("books", "synchronisations", "book_changes")
+
+
+def _query_plan(
+    engine: Engine, statement: str, parameters: tuple | dict = ()
+) -> list[str]:
+    with engine.connect() as connection:
+        return [
+            row[-1]
+            for row in connection.exec_driver_sql(
+                f"EXPLAIN QUERY PLAN {statement}", parameters
+            )
+        ]
+
+
+def _full_scans(plan: list[str]) -> list[str]:
+    # Indexed lookups read "SEARCH books USING INDEX ..."
+    return [
+        detail
+        for detail in plan
+        if detail.split()[:2] in (["SCAN", table] for table in INDEXED_TABLES)
+    ]
+
+
+@pytest.fixture
+def captured_selects(app: FastAPI) -> Generator[list[tuple[str, tuple]]]:
+    """The SELECT statements the app runs, with their parameters."""
+    engine = app.state.engine_registry.get_engine()
+    selects: list[tuple[str, tuple]] = []
+
+    def capture(connection, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and any(
+            table in statement for table in INDEXED_TABLES
+        ):
+            selects.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    yield selects
+    event.remove(engine, "before_cursor_execute", capture)
+
+
+@pytest.mark.parametrize(
+    ("method", "path"),
+    [
+        ("GET", "/api/v1/books"),
+        ("GET", "/api/v1/books/search?q=around"),
+        ("GET", "/api/v1/books/{book_id}"),
+        ("PATCH", "/api/v1/books/{book_id}"),
+        ("GET", "/api/v1/books/{book_id}/download"),
+        ("GET", "/api/v1/books/{book_id}/cover"),
+        ("GET", "/api/v1/books/jobs/{book_id}"),
+        ("GET", "/api/v1/books/jobs?id={book_id}"),
+        ("DELETE", "/api/v1/books/{book_id}"),
+        ("POST", "/api/v1/sync/"),
+        ("POST", "/api/v1/sync/changes"),
+        ("GET", "/api/v1/sync/books/{book_id}/download"),
+    ],
+)
+def test_route_queries_use_indexes(
+    app_client: TestClient,
+    app: FastAPI,
+    captured_selects: list[tuple[str, tuple]],
+    method: str,
+    path: str,
+) -> None:
+    book_id = upload_book(app_client, DUMMY_BOOK).json()["id"]
+    cursor = app_client.post("/api/v1/sync/changes", json={}).json()["cursor"]
+    upload_book(app_client, DUMMY_BOOK)
+    captured_selects.clear()
+
+    response = app_client.request(
+        method,
+        path.format(book_id=book_id),
+        json={
+            "/api/v1/sync/": [],
+            "/api/v1/sync/changes": {"cursor": cursor},
+        }.get(path, {"title": "Title", "author": "Author", "description": ""}),
+    )
+
+    assert response.is_success
+    assert captured_selects
+
+    engine = app.state.engine_registry.get_engine()
+    for statement, parameters in captured_selects:
+        assert _full_scans(_query_plan(engine, statement, parameters)) == [], statement
+
+
+def test_freeing_a_deleted_books_file_uses_indexes(
+    app_client: TestClient,
+    app: FastAPI,
+    captured_selects: list[tuple[str, tuple]],
+    uploads_path: Path,
+) -> None:
+    book_id = upload_book(app_client, DUMMY_BOOK).json()["id"]
+    captured_selects.clear()
+
+    assert app_client.delete(f"/api/v1/books/{book_id}").is_success
+
+    # Nothing references the file anymore, so it was removed
+    assert list(uploads_path.iterdir()) == []
+    engine = app.state.engine_registry.get_engine()
+    for statement, parameters in captured_selects:
+        plan = _query_plan(engine, statement, parameters)
+        assert _full_scans(plan) == [], statement
+        assert not any("TEMP B-TREE" in detail for detail in plan), statement
+
+
+def test_synchronisations_are_looked_up_by_user(app: FastAPI) -> None:
+    plan = _query_plan(
+        app.state.engine_registry.get_engine(),
+        "SELECT * FROM synchronisations WHERE user_id = ? ORDER BY created_at DESC",
+        (uuid4().hex,),
+    )
+
+    assert any("ix_synchronisations_user_id_created_at" in row for row in plan)
+    assert not any("TEMP B-TREE" in row for row in plan)
+
+
+def test_migration_replaces_single_column_indexes(tmp_path: Path) -> None:
+    database_path = tmp_path / "kosync.db"
+    with sqlite3.connect(database_path) as connection:
+        connection.execute(
+            "CREATE TABLE books (id CHAR(32) PRIMARY KEY, user_id CHAR(32) NOT NULL,"
+            " title VARCHAR NOT NULL, author VARCHAR, publisher VARCHAR,"
+            " isbn VARCHAR, language VARCHAR, description TEXT,"
+            " file_path VARCHAR NOT NULL, file_size INTEGER, upload_date DATETIME)"
+        )
+        connection.execute("CREATE INDEX ix_books_id ON books (id)")
+        connection.execute("CREATE INDEX ix_books_user_id ON books (user_id)")
+
+    settings = Settings(
+        database_url=f"sqlite:///{database_path}", cover_dir=str(tmp_path / "covers")
+    )
+    engine = get_engine(settings)
+    initialise_db(engine, settings)
+
+    indexes = {index["name"] for index in inspect(engine).get_indexes("books")}
+    assert indexes == {
+        "ix_books_user_id_upload_date",
+        "ix_books_user_id_id",
+        "ix_books_content_hash",
+    }
+
+    engine.dispose()
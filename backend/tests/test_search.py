@@ -0,0 +1,149 @@
+from pathlib import Path
+import sqlite3
+from uuid import UUID, uuid4
+
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+from supabase_auth import User as SupabaseUser
+
+from kosync_backend.config import Settings
+from kosync_backend.database import Book, SessionLocal, get_engine, initialise_db
+from kosync_backend.search import search_books, search_books_like
+
+
+def _add_book(db_session: Session, user_id: UUID, **metadata) -> str:
+    book = Book(id=uuid4(), user_id=user_id, file_path="book.epub", **metadata)
+    db_session.add(book)
+    db_session.commit()
+
+    return str(book.id)
+
+
+def _search(app_client: TestClient, q: str) -> list[dict]:
+    response = app_client.get("/api/v1/books/search", params={"q": q})
+    assert response.is_success
+
+    return response.json()
+
+
+def test_search_ranks_title_matches_first(
+    app_client: TestClient, db_session: Session, dummy_user: SupabaseUser
+) -> None:
+    user_id = UUID(dummy_user.id)
+    described = _add_book(
+        db_session,
+        user_id,
+        title="Twenty Thousand Leagues",
+        description="<p>A voyage under the sea with Captain Nemo.</p>",
+    )
+    titled = _add_book(db_session, user_id, title="Voyage to the Moon")
+    _add_book(db_session, user_id, title="The Time Machine")
+
+    results = _search(app_client, "voyage")
+
+    assert [result["book"]["id"] for result in results] == [titled, described]
+    assert results[0]["rank"] > results[1]["rank"]
+    assert "<mark>voyage</mark>" in results[1]["snippet"]
+
+
+def test_snippets_only_mark_up_the_matches(
+    app_client: TestClient, db_session: Session, dummy_user: SupabaseUser
+) -> None:
+    _add_book(
+        db_session,
+        UUID(dummy_user.id),
+        title="Untitled",
+        description=(
+            '<p>Tom &amp; Jerry <img src="x" onerror="alert(1)"> on a voyage'
+            " &lt;script&gt;</p>"
+        ),
+    )
+
+    [result] = _search(app_client, "voyage")
+
+    assert result["snippet"] == (
+        "Tom &amp; Jerry on a <mark>voyage</mark> &lt;script&gt;…"
+    )
+
+
+def test_search_matches_prefixes_of_every_word(
+    app_client: TestClient, db_session: Session, dummy_user: SupabaseUser
+) -> None:
+    user_id = UUID(dummy_user.id)
+    book_id = _add_book(db_session, user_id, title="Around the World", author="Verne")
+    _add_book(db_session, user_id, title="Around the Moon", author="Wells")
+
+    assert [r["book"]["id"] for r in _search(app_client, "wor ver")] == [book_id]
+    # FTS5 syntax in the query is searched for literally
+    assert _search(app_client, 'wor" OR "moon') == []
+    assert _search(app_client, "!!!") == []
+
+
+def test_search_index_follows_updates_and_deletes(
+    app_client: TestClient, db_session: Session, dummy_user: SupabaseUser
+) -> None:
+    book_id = _add_book(db_session, UUID(dummy_user.id), title="Draft")
+
+    app_client.patch(
+        f"/api/v1/books/{book_id}",
+        json={"title": "Final", "author": "Author", "description": ""},
+    )
+
+    assert _search(app_client, "draft") == []
+    assert [r["book"]["id"] for r in _search(app_client, "final")] == [book_id]
+
+    app_client.delete(f"/api/v1/books/{book_id}")
+
+    assert _search(app_client, "final") == []
+
+
+def test_search_is_scoped_to_the_user(
+    app_client: TestClient, db_session: Session
+) -> None:
+    _add_book(db_session, uuid4(), title="Someone Else's Book")
+
+    assert _search(app_client, "someone") == []
+
+
+def test_like_search_finds_the_same_books(
+    db_session: Session, dummy_user: SupabaseUser
+) -> None:
+    user_id = UUID(dummy_user.id)
+    _add_book(db_session, user_id, title="Around the World", author="Verne")
+    _add_book(db_session, user_id, title="Around the Moon", author="Wells")
+
+    assert [
+        r.book.id for r in search_books(db_session, user_id, "world verne", 10)
+    ] == [
+        r.book.id
+        for r in search_books_like(db_session, user_id, ["world", "verne"], 10)
+    ]
+
+
+def test_migration_indexes_existing_books(tmp_path: Path) -> None:
+    database_path = tmp_path / "kosync.db"
+    with sqlite3.connect(database_path) as connection:
+        connection.execute(
+            "CREATE TABLE books (id CHAR(32) PRIMARY KEY, user_id CHAR(32) NOT NULL,"
+            " title VARCHAR NOT NULL, author VARCHAR, publisher VARCHAR,"
+            " isbn VARCHAR, language VARCHAR, description TEXT,"
+            " file_path VARCHAR NOT NULL, file_size INTEGER, upload_date DATETIME)"
+        )
+        connection.execute(
+            "INSERT INTO books (id, user_id, title, file_path, upload_date)"
+            " VALUES (?, ?, 'Existing Book', 'a.epub', CURRENT_TIMESTAMP)",
+            (uuid4().hex, (user_id := uuid4()).hex),
+        )
+
+    settings = Settings(
+        database_url=f"sqlite:///{database_path}", cover_dir=str(tmp_path / "covers")
+    )
+    engine = get_engine(settings)
+    initialise_db(engine, settings)
+
+    with SessionLocal(bind=engine) as db:
+        [result] = search_books(db, user_id, "existing", 10)
+
+    assert result.book.title == "Existing Book"
+
+    engine.dispose()
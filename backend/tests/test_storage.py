@@ -0,0 +1,160 @@
+from collections.abc import Generator
+import hashlib
+from pathlib import Path
+
+import boto3
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from moto import mock_aws
+import pytest
+
+from kosync_backend.config import get_settings
+from kosync_backend.storage import FileSystemStorage, S3Storage, Storage
+from kosync_backend.storage_gc import StorageCollector
+from tests.conftest import upload_book
+
+
+DUMMY_BOOK = (
+    Path(__file__).parent / "resources" / "Around the World in 28 Languages.epub"
+)
+
+BUCKET = "kosync-books"
+
+
+@pytest.fixture
+def s3_storage() -> Generator[S3Storage]:
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+
+        with S3Storage(client, BUCKET, prefix="books/") as storage:
+            yield storage
+
+
+@pytest.fixture(params=["filesystem", "s3"])
+def storage(request: pytest.FixtureRequest, tmp_path: Path) -> Generator[Storage]:
+    if request.param == "s3":
+        yield request.getfixturevalue("s3_storage")
+    else:
+        yield FileSystemStorage(tmp_path / "storage")
+
+
+def _staged(tmp_path: Path, content: bytes) -> Path:
+    path = tmp_path / "staged.part"
+    path.write_bytes(content)
+
+    return path
+
+
+def test_files_are_streamed_in_and_out(storage: Storage, tmp_path: Path) -> None:
+    content = DUMMY_BOOK.read_bytes()
+    source = _staged(tmp_path, content)
+
+    storage.put("book.epub", source, "application/epub+zip")
+
+    assert not source.exists()
+    assert b"".join(storage.get("book.epub")) == content
+    assert b"".join(storage.get_range("book.epub", 100, 1100)) == content[100:1100]
+    assert b"".join(storage.get_range("book.epub", 1000, None)) == content[1000:]
+
+    stored = storage.stat("book.epub")
+    assert stored is not None
+    assert stored.key == "book.epub"
+    assert stored.size == len(content)
+
+
+def test_deleted_files_are_gone(storage: Storage, tmp_path: Path) -> None:
+    storage.put("book.epub", _staged(tmp_path, b"content"), "application/epub+zip")
+
+    storage.delete("book.epub")
+    storage.delete("book.epub")
+
+    assert storage.stat("book.epub") is None
+
+
+def test_local_copy_is_removed_afterwards(storage: Storage, tmp_path: Path) -> None:
+    storage.put("book.epub", _staged(tmp_path, b"content"), "application/epub+zip")
+
+    with storage.local_copy("book.epub", tmp_path / "scratch") as path:
+        assert path.read_bytes() == b"content"
+
+    if storage.local_path("book.epub") is None:
+        assert not path.exists()
+
+
+def test_s3_storage_presigns_downloads(s3_storage: S3Storage) -> None:
+    url = s3_storage.presigned_url("book.epub", 60)
+
+    assert url.startswith(f"https://{BUCKET}.s3.amazonaws.com/books/book.epub?")
+
+
+@pytest.fixture
+def s3_app_client(
+    app_client: TestClient, app: FastAPI, s3_storage: S3Storage
+) -> TestClient:
+    state = app.state
+    state.storage = s3_storage
+    state.storage_collector = StorageCollector(
+        get_settings(), state.engine_registry, s3_storage
+    )
+
+    return app_client
+
+
+def test_books_are_stored_and_served_from_s3(
+    s3_app_client: TestClient, s3_storage: S3Storage, uploads_path: Path
+) -> None:
+    content = DUMMY_BOOK.read_bytes()
+    book_id = upload_book(s3_app_client, DUMMY_BOOK).json()["id"]
+    file_path = f"{hashlib.sha256(content).hexdigest()}.epub"
+
+    assert list(uploads_path.iterdir()) == []
+    stored = s3_storage.stat(file_path)
+    assert stored is not None and stored.size == len(content)
+
+    url = f"/api/v1/books/{book_id}/download"
+    response = s3_app_client.get(url)
+    assert response.content == content
+    assert response.headers["Content-Type"] == "application/epub+zip"
+
+    response = s3_app_client.get(
+        url, headers={"Range": "bytes=-100", "If-Range": response.headers["ETag"]}
+    )
+    assert response.status_code == 206
+    assert response.content == content[-100:]
+    assert response.headers["Content-Range"] == (
+        f"bytes {len(content) - 100}-{len(content) - 1}/{len(content)}"
+    )
+
+    response = s3_app_client.get(url, headers={"Range": f"bytes={len(content)}-"})
+    assert response.status_code == 416
+
+    assert s3_app_client.delete(f"/api/v1/books/{book_id}").status_code == 204
+    assert s3_storage.stat(file_path) is None
+
+
+def test_downloads_are_redirected_to_presigned_urls(
+    s3_app_client: TestClient, app: FastAPI
+) -> None:
+    app.dependency_overrides[get_settings] = lambda: get_settings().model_copy(
+        update={"book_delivery": "presigned-url"}
+    )
+    book_id = upload_book(s3_app_client, DUMMY_BOOK).json()["id"]
+
+    response = s3_app_client.get(
+        f"/api/v1/books/{book_id}/download", follow_redirects=False
+    )
+
+    assert response.status_code == 307
+    assert response.headers["Location"].startswith(f"https://{BUCKET}.s3.")
+    assert response.headers["ETag"]
+
+
+def test_stored_files_are_listed(storage: Storage, tmp_path: Path) -> None:
+    for key in ["a.epub", "b.epub"]:
+        storage.put(key, _staged(tmp_path, key.encode()), "application/epub+zip")
+
+    assert sorted((stored.key, stored.size) for stored in storage.list_objects()) == [
+        ("a.epub", 6),
+        ("b.epub", 6),
+    ]
@@ -0,0 +1,92 @@
+import os
+from pathlib import Path
+import time
+
+import boto3
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from moto import mock_aws
+
+from kosync_backend.config import get_settings
+from kosync_backend.storage import FileSystemStorage, S3Storage
+from kosync_backend.storage_gc import StorageCollector
+from tests.conftest import upload_book
+
+
+DUMMY_BOOK = (
+    Path(__file__).parent / "resources" / "Around the World in 28 Languages.epub"
+)
+
+
+def _collector(app: FastAPI, uploads_path: Path) -> StorageCollector:
+    settings = get_settings().model_copy(
+        update={"storage_gc_batch_size": 2, "storage_gc_min_age_s": 60}
+    )
+
+    return StorageCollector(
+        settings,
+        app.state.engine_registry,
+        FileSystemStorage(uploads_path),
+    )
+
+
+def _write(path: Path, size: int, age_s: float) -> None:
+    path.write_bytes(b"x" * size)
+    modified_at = time.time() - age_s
+    os.utime(path, (modified_at, modified_at))
+
+
+def test_sweep_removes_old_unreferenced_files(
+    app_client: TestClient, app: FastAPI, uploads_path: Path
+) -> None:
+    upload_book(app_client, DUMMY_BOOK)
+    [book_file] = uploads_path.iterdir()
+    os.utime(book_file, (time.time() - 3600, time.time() - 3600))
+    _write(uploads_path / "orphan-1.epub", 100, age_s=3600)
+    _write(uploads_path / "orphan-2.epub", 20, age_s=3600)
+    _write(uploads_path / "just-stored.epub", 10, age_s=0)
+    _write(uploads_path / ".upload-abandoned.part", 5, age_s=3600)
+    _write(uploads_path / ".upload-receiving.part", 10, age_s=0)
+
+    report = _collector(app, uploads_path).sweep()
+
+    assert report.scanned_files == 6
+    assert report.removed_files == 3
+    assert report.reclaimed_bytes == 125
+    assert sorted(path.name for path in uploads_path.iterdir()) == sorted(
+        [book_file.name, "just-stored.epub", ".upload-receiving.part"]
+    )
+
+
+def test_sweep_skips_s3_buckets_without_a_prefix(app: FastAPI) -> None:
+    settings = get_settings().model_copy(update={"storage_gc_min_age_s": 0})
+
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="shared")
+        client.put_object(Bucket="shared", Key="other-app/data.bin", Body=b"x")
+
+        with S3Storage(client, "shared") as storage:
+            collector = StorageCollector(settings, app.state.engine_registry, storage)
+            report = collector.sweep()
+
+            assert report.removed_files == 0
+            assert storage.stat("other-app/data.bin") is not None
+
+
+def test_removal_keeps_files_referenced_again(
+    app_client: TestClient, app: FastAPI, uploads_path: Path
+) -> None:
+    upload_book(app_client, DUMMY_BOOK)
+    [book_file] = uploads_path.iterdir()
+    _write(uploads_path / "released.epub", 10, age_s=3600)
+    _write(uploads_path / "just-stored.epub", 10, age_s=0)
+    collector = _collector(app, uploads_path)
+
+    collector.remove(book_file.name)
+    # May belong to an upload about to be committed
+    collector.remove("released.epub", "just-stored.epub")
+
+    assert sorted(path.name for path in uploads_path.iterdir()) == sorted(
+        [book_file.name, "just-stored.epub"]
+    )
@@ -1,9 +1,12 @@
 from pathlib import Path
 from uuid import UUID
 
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
+import httpx
 from sqlalchemy.orm import Session
 
+from kosync_backend.config import get_settings
 from kosync_backend.database import Synchronisation
 from tests.conftest import upload_book
 
@@ -89,3 +92,149 @@ def test_sync_records_correct_user_id(
     syncs = db_session.query(Synchronisation).all()
     assert len(syncs) == 1
     assert syncs[0].user_id == UUID(dummy_user.id)
+
+
+DUMMY_BOOK = (
+    Path(__file__).parent / "resources" / "Around the World in 28 Languages.epub"
+)
+
+
+def _sync_changes(app_client: TestClient, cursor: str | None = None) -> httpx.Response:
+    return app_client.post("/api/v1/sync/changes", json={"cursor": cursor})
+
+
+def test_legacy_sync_returns_missing_books(app_client: TestClient) -> None:
+    first = upload_book(app_client, DUMMY_BOOK).json()["id"]
+    second = upload_book(app_client, DUMMY_BOOK).json()["id"]
+
+    response = app_client.post("/api/v1/sync/", json=[first])
+
+    assert response.is_success
+    assert [book["id"] for book in response.json()] == [second]
+    assert response.json()[0]["url"].endswith(f"/sync/books/{second}/download")
+
+
+def test_first_changes_sync_returns_the_whole_library(app_client: TestClient) -> None:
+    book_ids = {upload_book(app_client, DUMMY_BOOK).json()["id"] for _ in range(2)}
+
+    response = _sync_changes(app_client)
+
+    assert response.is_success
+    assert {book["id"] for book in response.json()["added"]} == book_ids
+    assert response.json()["cursor"]
+
+
+def test_changes_sync_returns_only_changes_since_the_cursor(
+    app_client: TestClient,
+) -> None:
+    kept = upload_book(app_client, DUMMY_BOOK).json()["id"]
+    edited = upload_book(app_client, DUMMY_BOOK).json()["id"]
+    removed = upload_book(app_client, DUMMY_BOOK).json()["id"]
+    cursor = _sync_changes(app_client).json()["cursor"]
+
+    response = _sync_changes(app_client, cursor).json()
+    assert (response["added"], response["updated"], response["removed"]) == (
+        [],
+        [],
+        [],
+    )
+    assert response["cursor"] == cursor
+
+    added = upload_book(app_client, DUMMY_BOOK).json()["id"]
+    app_client.patch(
+        f"/api/v1/books/{edited}",
+        json={"title": "Foo", "author": "Bar", "description": "Baz"},
+    )
+    app_client.delete(f"/api/v1/books/{removed}")
+
+    response = _sync_changes(app_client, cursor).json()
+
+    assert [book["id"] for book in response["added"]] == [added]
+    assert [book["id"] for book in response["updated"]] == [edited]
+    assert [book["id"] for book in response["removed"]] == [removed]
+    assert kept not in [book["id"] for book in response["updated"]]
+    assert not response["has_more"]
+
+
+def test_books_added_and_removed_between_syncs_are_not_reported(
+    app_client: TestClient,
+) -> None:
+    cursor = _sync_changes(app_client).json()["cursor"]
+
+    book_id = upload_book(app_client, DUMMY_BOOK).json()["id"]
+    app_client.patch(
+        f"/api/v1/books/{book_id}",
+        json={"title": "Foo", "author": "Bar", "description": "Baz"},
+    )
+    app_client.delete(f"/api/v1/books/{book_id}")
+
+    response = _sync_changes(app_client, cursor).json()
+
+    assert (response["added"], response["updated"], response["removed"]) == (
+        [],
+        [],
+        [],
+    )
+    assert response["cursor"] != cursor
+
+
+def test_changes_sync_pages_through_long_change_logs(
+    app_client: TestClient, app: FastAPI
+) -> None:
+    app.dependency_overrides[get_settings] = lambda: get_settings().model_copy(
+        update={"sync_max_changes": 2}
+    )
+    cursor = _sync_changes(app_client).json()["cursor"]
+    book_ids = [upload_book(app_client, DUMMY_BOOK).json()["id"] for _ in range(3)]
+
+    first_page = _sync_changes(app_client, cursor).json()
+    second_page = _sync_changes(app_client, first_page["cursor"]).json()
+
+    assert first_page["has_more"]
+    assert not second_page["has_more"]
+    assert [
+        book["id"] for book in first_page["added"] + second_page["added"]
+    ] == book_ids
+
+
+def test_changes_sync_rejects_invalid_cursors(app_client: TestClient) -> None:
+    assert _sync_changes(app_client, "not-a-cursor").status_code == 400
+
+
+def test_changes_sync_carries_metadata_and_tombstones(app_client: TestClient) -> None:
+    edited = upload_book(app_client, DUMMY_BOOK).json()["id"]
+    removed = upload_book(app_client, DUMMY_BOOK).json()["id"]
+    cursor = _sync_changes(app_client).json()["cursor"]
+
+    app_client.patch(
+        f"/api/v1/books/{edited}",
+        json={"title": "New title", "author": "New author", "description": "New"},
+    )
+    app_client.delete(f"/api/v1/books/{removed}")
+
+    response = _sync_changes(app_client, cursor).json()
+
+    [updated_book] = response["updated"]
+    assert updated_book["title"] == "New title"
+    assert updated_book["author"] == "New author"
+    assert updated_book["description"] == "New"
+
+    [tombstone] = response["removed"]
+    assert tombstone["id"] == removed
+    assert tombstone["removed_at"]
+
+
+def test_deleted_books_are_not_reported_as_updated(app_client: TestClient) -> None:
+    book_id = upload_book(app_client, DUMMY_BOOK).json()["id"]
+    cursor = _sync_changes(app_client).json()["cursor"]
+
+    app_client.patch(
+        f"/api/v1/books/{book_id}",
+        json={"title": "Foo", "author": "Bar", "description": "Baz"},
+    )
+    app_client.delete(f"/api/v1/books/{book_id}")
+
+    response = _sync_changes(app_client, cursor).json()
+
+    assert response["updated"] == []
+    assert [book["id"] for book in response["removed"]] == [book_id]
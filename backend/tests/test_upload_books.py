@@ -1,12 +1,18 @@
+from collections.abc import Iterator
+import hashlib
 from pathlib import Path
 from uuid import UUID
 
 from fastapi.testclient import TestClient
+import httpx
 from sqlalchemy import create_engine
 from sqlalchemy.orm import Session
+from pytest_mock import MockerFixture
 from supabase_auth import User as SupabaseUser
 
-from kosync_backend.database import UserUploadLimit
+from kosync_backend.database import Book, UserUploadLimit
+from kosync_backend.ingestion import ProcessedEpub
+from kosync_backend.routes import books as books_routes
 from tests.conftest import upload_book
 
 
@@ -69,7 +75,9 @@ def test_custom_limit_allows_more_uploads(
     app_client: TestClient, sql_path: Path, dummy_user: SupabaseUser
 ) -> None:
     """A UserUploadLimit record with allowed_uploads=8 overrides the default limit."""
-    _insert_upload_limit(sql_path, dummy_user.id, allowed_uploads=8, max_file_size_mb=None)
+    _insert_upload_limit(
+        sql_path, dummy_user.id, allowed_uploads=8, max_file_size_mb=None
+    )
 
     # All 8 uploads should succeed (beyond the default of 5)
     for i in range(8):
@@ -125,3 +133,185 @@ def test_null_max_file_size_mb_falls_back_to_default(
 
     response = upload_book(app_client, DUMMY_BOOK)
     assert response.is_success
+
+
+def test_upload_rejects_non_epub_files(
+    app_client: TestClient, uploads_path: Path
+) -> None:
+    response = app_client.post(
+        "/api/v1/books", files={"file": ("book.pdf", DUMMY_BOOK.read_bytes())}
+    )
+
+    assert response.status_code == 400
+    assert list(uploads_path.iterdir()) == []
+
+
+def test_unreadable_books_are_titled_after_the_uploaded_file(
+    app_client: TestClient,
+) -> None:
+    response = app_client.post(
+        "/api/v1/books", files={"file": ("My Book.epub", b"no metadata")}
+    )
+
+    assert response.json()["title"] == "My Book"
+
+
+def test_upload_stores_content_hash(
+    app_client: TestClient, uploads_path: Path, db_session: Session
+) -> None:
+    book_id = upload_book(app_client, DUMMY_BOOK).json()["id"]
+
+    book = db_session.get_one(Book, UUID(book_id))
+
+    assert book.file_size == DUMMY_BOOK.stat().st_size
+    assert book.content_hash == hashlib.sha256(DUMMY_BOOK.read_bytes()).hexdigest()
+    assert [path.name for path in uploads_path.iterdir()] == [
+        f"{book.content_hash}.epub"
+    ]
+
+
+def test_streamed_upload_is_rejected_once_it_exceeds_the_limit(
+    app_client: TestClient,
+    sql_path: Path,
+    uploads_path: Path,
+    dummy_user: SupabaseUser,
+) -> None:
+    """Without a Content-Length header, the running byte count enforces the limit."""
+    _insert_upload_limit(sql_path, dummy_user.id, max_file_size_mb=1)
+
+    def body() -> Iterator[bytes]:
+        yield (
+            b"--boundary\r\n"
+            b'Content-Disposition: form-data; name="file"; filename="big.epub"\r\n'
+            b"Content-Type: application/epub+zip\r\n\r\n"
+        )
+        for _ in range(64):
+            yield b"\0" * 64 * 1024
+        yield b"\r\n--boundary--\r\n"
+
+    response = app_client.post(
+        "/api/v1/books",
+        content=body(),
+        headers={"Content-Type": "multipart/form-data; boundary=boundary"},
+    )
+
+    assert response.status_code == 400
+    assert "File size exceeds maximum limit of 1MB" in response.json()["detail"]
+    assert list(uploads_path.iterdir()) == []
+
+
+def _upload_batch(app_client: TestClient, *files: tuple[str, bytes]) -> httpx.Response:
+    return app_client.post(
+        "/api/v1/books/batch",
+        files=[("files", (filename, content)) for filename, content in files],
+    )
+
+
+def test_batch_upload_creates_all_books(
+    app_client: TestClient, uploads_path: Path
+) -> None:
+    response = _upload_batch(
+        app_client,
+        ("one.epub", DUMMY_BOOK.read_bytes()),
+        ("two.epub", DUMMY_BOOK.read_bytes()),
+        ("three.epub", DUMMY_BOOK.read_bytes()),
+    )
+
+    assert response.is_success
+    results = response.json()
+    assert [result["filename"] for result in results] == [
+        "one.epub",
+        "two.epub",
+        "three.epub",
+    ]
+    assert all(result["success"] for result in results)
+    # The three books share one file
+    assert len(list(uploads_path.iterdir())) == 1
+    assert len(app_client.get("/api/v1/books").json()) == 3
+
+
+def test_batch_upload_reports_per_file_failures(
+    app_client: TestClient, uploads_path: Path
+) -> None:
+    response = _upload_batch(
+        app_client,
+        ("book.epub", DUMMY_BOOK.read_bytes()),
+        ("book.pdf", DUMMY_BOOK.read_bytes()),
+    )
+
+    assert response.is_success
+    results = {result["filename"]: result for result in response.json()}
+    assert results["book.epub"]["success"]
+    assert results["book.epub"]["book"]["title"]
+    assert not results["book.pdf"]["success"]
+    assert "Only .epub files are allowed" in results["book.pdf"]["error"]
+    assert len(list(uploads_path.iterdir())) == 1
+
+
+def test_batch_upload_checks_the_quota_once_for_the_batch(
+    app_client: TestClient, uploads_path: Path
+) -> None:
+    for _ in range(3):
+        assert upload_book(app_client, DUMMY_BOOK).is_success
+
+    response = _upload_batch(
+        app_client,
+        *((f"{index}.epub", DUMMY_BOOK.read_bytes()) for index in range(4)),
+    )
+
+    assert response.is_success
+    results = response.json()
+    assert [result["success"] for result in results] == [True, True, False, False]
+    assert "Maximum number of books (5) reached" in results[-1]["error"]
+    assert len(list(uploads_path.iterdir())) == 1
+
+    response = _upload_batch(app_client, ("book.epub", DUMMY_BOOK.read_bytes()))
+    assert response.status_code == 400
+
+
+def test_batch_upload_inserts_books_in_one_transaction(
+    app_client: TestClient, mocker: MockerFixture
+) -> None:
+    save_books = mocker.spy(books_routes, "_save_books")
+
+    response = _upload_batch(
+        app_client,
+        ("one.epub", DUMMY_BOOK.read_bytes()),
+        ("two.epub", DUMMY_BOOK.read_bytes()),
+    )
+
+    assert response.is_success
+    save_books.assert_called_once()
+    assert len(save_books.call_args.args[1]) == 2
+
+
+def test_batch_upload_results_are_in_upload_order(
+    app_client: TestClient, mocker: MockerFixture
+) -> None:
+    process_epub = books_routes.process_epub
+
+    def process_or_fail(
+        path: Path, cover_dir: str, fallback_title: str | None = None
+    ) -> ProcessedEpub:
+        if path.read_bytes() != DUMMY_BOOK.read_bytes():
+            raise ValueError("Not an EPUB")
+
+        return process_epub(path, cover_dir, fallback_title)
+
+    mocker.patch.object(books_routes, "process_epub", process_or_fail)
+
+    response = _upload_batch(
+        app_client,
+        ("broken.epub", b"broken"),
+        ("one.epub", DUMMY_BOOK.read_bytes()),
+        ("book.pdf", DUMMY_BOOK.read_bytes()),
+        ("two.epub", DUMMY_BOOK.read_bytes()),
+    )
+
+    # Failed while processing, stored, rejected while receiving, stored
+    assert [(result["filename"], result["success"]) for result in response.json()] == [
+        ("broken.epub", False),
+        ("one.epub", True),
+        ("book.pdf", False),
+        ("two.epub", True),
+    ]
@@ -0,0 +1,150 @@
+import asyncio
+from pathlib import Path
+import threading
+import time
+
+from fastapi.testclient import TestClient
+import pytest
+from pytest_mock import MockerFixture
+
+from kosync_backend.config import Settings
+from kosync_backend.workers import WorkerPool, WorkerPoolBusy, WorkerTimeout
+from tests.conftest import upload_book
+
+
+DUMMY_BOOK = (
+    Path(__file__).parent / "resources" / "Around the World in 28 Languages.epub"
+)
+
+
+def test_worker_pool_runs_jobs_and_records_metrics() -> None:
+    with WorkerPool(Settings()) as worker_pool:
+        assert asyncio.run(worker_pool.run(sum, [1, 2, 3])) == 6
+
+    assert worker_pool.metrics.submitted == 1
+    assert worker_pool.metrics.completed == 1
+    assert worker_pool.metrics.execution_seconds_total >= 0
+    assert worker_pool.pending == 0
+
+
+def test_worker_pool_rejects_jobs_beyond_its_queue_depth() -> None:
+    release = threading.Event()
+
+    async def scenario(worker_pool: WorkerPool) -> None:
+        blocked = asyncio.ensure_future(worker_pool.run(release.wait))
+        await asyncio.sleep(0)
+
+        with pytest.raises(WorkerPoolBusy):
+            await worker_pool.run(sum, [])
+
+        release.set()
+        await blocked
+
+    settings = Settings(worker_pool_size=1, worker_queue_depth=0)
+    with WorkerPool(settings) as worker_pool:
+        asyncio.run(scenario(worker_pool))
+
+    assert worker_pool.metrics.rejected == 1
+    assert worker_pool.metrics.completed == 1
+
+
+def test_worker_pool_times_out_jobs() -> None:
+    settings = Settings(
+        worker_pool_size=1, worker_queue_depth=0, worker_job_timeout_s=0.05
+    )
+    release = threading.Event()
+
+    with WorkerPool(settings) as worker_pool:
+        with pytest.raises(WorkerTimeout):
+            asyncio.run(worker_pool.run(release.wait))
+
+        # The stuck thread keeps its worker until it returns
+        assert worker_pool.pending == 1
+        with pytest.raises(WorkerPoolBusy):
+            asyncio.run(worker_pool.run(sum, []))
+
+        release.set()
+        deadline = time.monotonic() + 5
+        while worker_pool.pending and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        assert asyncio.run(worker_pool.run(sum, [1])) == 1
+
+    assert worker_pool.metrics.timed_out == 1
+    assert worker_pool.pending == 0
+
+
+def test_worker_pool_times_jobs_from_their_start() -> None:
+    settings = Settings(
+        worker_pool_size=1, worker_queue_depth=1, worker_job_timeout_s=0.5
+    )
+
+    async def scenario(worker_pool: WorkerPool) -> None:
+        # The second job waits for the first, longer than the timeout in total
+        await asyncio.gather(
+            worker_pool.run(time.sleep, 0.3), worker_pool.run(time.sleep, 0.3)
+        )
+
+    with WorkerPool(settings) as worker_pool:
+        asyncio.run(scenario(worker_pool))
+
+    assert worker_pool.metrics.completed == 2
+    assert worker_pool.metrics.timed_out == 0
+
+
+def test_worker_pool_bounds_the_wait_for_a_worker() -> None:
+    settings = Settings(
+        worker_pool_size=1, worker_queue_depth=1, worker_job_timeout_s=0.05
+    )
+    release = threading.Event()
+
+    async def scenario(worker_pool: WorkerPool) -> None:
+        stuck, waiting = await asyncio.gather(
+            worker_pool.run(release.wait),
+            worker_pool.run(sum, []),
+            return_exceptions=True,
+        )
+        assert isinstance(stuck, WorkerTimeout)
+        assert isinstance(waiting, WorkerTimeout)
+
+    with WorkerPool(settings) as worker_pool:
+        asyncio.run(scenario(worker_pool))
+        assert worker_pool.pending == 1
+
+        release.set()
+        deadline = time.monotonic() + 5
+        while worker_pool.pending and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        assert asyncio.run(worker_pool.run(sum, [1])) == 1
+
+    assert worker_pool.metrics.timed_out == 2
+
+
+def test_process_worker_pool_replaces_stuck_workers() -> None:
+    settings = Settings(
+        worker_pool_kind="process", worker_pool_size=1, worker_job_timeout_s=30
+    )
+
+    with WorkerPool(settings) as worker_pool:
+        # Spawning the process may take a while, so warm it up first
+        assert asyncio.run(worker_pool.run(sum, [1, 2])) == 3
+
+        settings.worker_job_timeout_s = 0.5
+        with pytest.raises(WorkerTimeout):
+            asyncio.run(worker_pool.run(time.sleep, 30))
+
+        settings.worker_job_timeout_s = 30
+        assert asyncio.run(worker_pool.run(sum, [4, 5])) == 9
+
+
+def test_upload_is_rejected_when_the_worker_pool_is_busy(
+    app_client: TestClient, uploads_path: Path, mocker: MockerFixture
+) -> None:
+    mocker.patch.object(WorkerPool, "run", side_effect=WorkerPoolBusy())
+
+    response = upload_book(app_client, DUMMY_BOOK)
+
+    assert response.status_code == 503
+    assert "retry-after" in response.headers
+    assert list(uploads_path.iterdir()) == []
@@ -6,6 +6,7 @@ import { toast } from "sonner";
 import type { Book } from "../types/books";
 import { Button } from "./ui/button";
 import { useAuth } from "../contexts/AuthContext";
+import { useCoverImage } from "../hooks/useCoverImage";
 import { API_BASE_URL } from "../lib/config";
 import {
   Dialog,
@@ -64,9 +65,7 @@ export function BookDetailsDialog({ book, children, onDelete }: BookDetailsDialo
     }
   };
 
-  const coverSrc = book.cover_image_base64
-    ? `data:image/jpeg;base64,${book.cover_image_base64}`
-    : null;
+  const coverSrc = useCoverImage(book, 320);
 
   return (
     <Dialog open={isOpen} onOpenChange={setIsOpen}>
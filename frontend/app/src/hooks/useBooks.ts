@@ -4,16 +4,55 @@ import { useAuth } from "../contexts/AuthContext";
 import { API_BASE_URL } from "../lib/config";
 import type { Book } from "../types/books";
 
+const PAGE_SIZE = 48;
+
 interface UseBooksResult {
   books: Book[];
+  total: number;
+  hasMore: boolean;
   loading: boolean;
   error: string | null;
   refresh: () => void;
+  loadMore: () => void;
+}
+
+interface BooksPage {
+  books: Book[];
+  total: number;
+  nextCursor: string | null;
+}
+
+async function fetchBooksPage(
+  accessToken: string,
+  cursor: string | null
+): Promise<BooksPage> {
+  const params = new URLSearchParams({
+    sort: "-upload_date",
+    limit: String(PAGE_SIZE),
+  });
+  if (cursor) params.set("cursor", cursor);
+
+  const response = await fetch(`${API_BASE_URL}/books?${params}`, {
+    headers: {
+      Authorization: `Bearer ${accessToken}`,
+    },
+  });
+  if (!response.ok) {
+    throw new Error(`Failed to load books (${response.status})`);
+  }
+
+  return {
+    books: (await response.json()) as Book[],
+    total: Number(response.headers.get("X-Total-Count") ?? 0),
+    nextCursor: response.headers.get("X-Next-Cursor"),
+  };
 }
 
 export function useBooks(): UseBooksResult {
   const { session } = useAuth();
   const [books, setBooks] = useState<Book[]>([]);
+  const [total, setTotal] = useState(0);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const [reloadToken, setReloadToken] = useState(0);
@@ -22,22 +61,18 @@ export function useBooks(): UseBooksResult {
     setReloadToken((token) => token + 1);
   }, []);
 
-  useEffect(() => {
-    const fetchBooks = async () => {
+  const loadPage = useCallback(
+    async (cursor: string | null) => {
       if (!session?.access_token) return;
       setLoading(true);
       setError(null);
       try {
-        const response = await fetch(`${API_BASE_URL}/books`, {
-          headers: {
-            Authorization: `Bearer ${session.access_token}`,
-          },
-        });
-        if (!response.ok) {
-          throw new Error(`Failed to load books (${response.status})`);
-        }
-        const data = (await response.json()) as Book[];
-        setBooks(data);
+        const page = await fetchBooksPage(session.access_token, cursor);
+        setBooks((current) =>
+          cursor ? [...current, ...page.books] : page.books
+        );
+        setTotal(page.total);
+        setNextCursor(page.nextCursor);
       } catch (err) {
         const message =
           err instanceof Error ? err.message : "Unexpected error loading books";
@@ -45,12 +80,25 @@ export function useBooks(): UseBooksResult {
       } finally {
         setLoading(false);
       }
-    };
-
-    void fetchBooks();
-  }, [session?.access_token, reloadToken]);
+    },
+    [session?.access_token]
+  );
 
-  return { books, loading, error, refresh };
-}
+  const loadMore = useCallback(() => {
+    if (nextCursor && !loading) void loadPage(nextCursor);
+  }, [loadPage, loading, nextCursor]);
 
+  useEffect(() => {
+    void loadPage(null);
+  }, [loadPage, reloadToken]);
 
+  return {
+    books,
+    total,
+    hasMore: nextCursor !== null,
+    loading,
+    error,
+    refresh,
+    loadMore,
+  };
+}
@@ -0,0 +1,66 @@
+import { useEffect, useState } from "react";
+
+import { useAuth } from "../contexts/AuthContext";
+import { API_BASE_URL } from "../lib/config";
+import type { Book } from "../types/books";
+
+export type CoverWidth = 160 | 320 | 640;
+
+/**
+ * Loads a book cover through the authenticated cover endpoint and returns an
+ * object URL for it. The `cover_hash` is passed along so the browser may cache
+ * the response for as long as the cover doesn't change.
+ */
+export function useCoverImage(book: Book, width?: CoverWidth): string | null {
+  const { session } = useAuth();
+  const [coverSrc, setCoverSrc] = useState<string | null>(null);
+
+  useEffect(() => {
+    if (!book.cover_hash || !session?.access_token) {
+      setCoverSrc(null);
+      return;
+    }
+
+    let objectUrl: string | null = null;
+    let cancelled = false;
+
+    const params = new URLSearchParams({ v: book.cover_hash });
+    if (width) {
+      params.set("width", String(width));
+    }
+
+    const fetchCover = async () => {
+      try {
+        const response = await fetch(
+          `${API_BASE_URL}/books/${book.id}/cover?${params.toString()}`,
+          {
+            headers: {
+              Authorization: `Bearer ${session.access_token}`,
+            },
+          }
+        );
+        if (!response.ok || cancelled) return;
+
+        objectUrl = URL.createObjectURL(await response.blob());
+        if (cancelled) {
+          URL.revokeObjectURL(objectUrl);
+          return;
+        }
+        setCoverSrc(objectUrl);
+      } catch (err) {
+        console.error("Error loading cover:", err);
+      }
+    };
+
+    void fetchCover();
+
+    return () => {
+      cancelled = true;
+      if (objectUrl) {
+        URL.revokeObjectURL(objectUrl);
+      }
+    };
+  }, [book.id, book.cover_hash, width, session?.access_token]);
+
+  return coverSrc;
+}
@@ -1,25 +1,33 @@
-import { useMemo } from "react";
 import { BookMarked, Loader2 } from "lucide-react";
 
 import { AppLayout } from "../layout/AppLayout";
 import { useBooks } from "../hooks/useBooks";
+import { useCoverImage } from "../hooks/useCoverImage";
+import type { Book } from "../types/books";
 import { BookUploadForm } from "../components/BookUploadForm";
 import { BookDetailsDialog } from "../components/BookDetailsDialog";
 import { Badge } from "../components/ui/badge";
+import { Button } from "../components/ui/button";
 import { Skeleton } from "../components/ui/skeleton";
 
-export function BooksPage() {
-  const { books, loading, error, refresh } = useBooks();
+function BookCover({ book }: { book: Book }) {
+  const coverSrc = useCoverImage(book, 320);
 
-  const sortedBooks = useMemo(
-    () =>
-      [...books].sort((a, b) => {
-        const aDate = a.updated_at ?? a.created_at ?? "";
-        const bDate = b.updated_at ?? b.created_at ?? "";
-        return bDate.localeCompare(aDate);
-      }),
-    [books]
+  return coverSrc ? (
+    <img
+      src={coverSrc}
+      alt={book.title || "Book cover"}
+      className="h-full w-auto object-contain"
+    />
+  ) : (
+    <BookMarked className="h-10 w-10 text-muted-foreground/60" />
   );
+}
+
+export function BooksPage() {
+  // Pages arrive newest first
+  const { books, total, hasMore, loading, error, refresh, loadMore } =
+    useBooks();
 
   return (
     <AppLayout>
@@ -42,10 +50,8 @@ export function BooksPage() {
             <div>
               <h2 className="text-lg font-semibold">Library</h2>
               <p className="text-sm text-muted-foreground">
-                {sortedBooks.length > 0
-                  ? `${sortedBooks.length} ${
-                      sortedBooks.length === 1 ? "book" : "books"
-                    } in your library.`
+                {total > 0
+                  ? `${total} ${total === 1 ? "book" : "books"} in your library.`
                   : "No books yet. Upload your first EPUB to get started."}
               </p>
             </div>
@@ -63,13 +69,13 @@ export function BooksPage() {
             </div>
           )}
 
-          {loading && sortedBooks.length === 0 ? (
+          {loading && books.length === 0 ? (
             <div className="space-y-3">
               <Skeleton className="h-12 w-full" />
               <Skeleton className="h-12 w-full" />
               <Skeleton className="h-12 w-3/4" />
             </div>
-          ) : sortedBooks.length === 0 ? (
+          ) : books.length === 0 ? (
             <div className="flex flex-col items-center gap-3 rounded-lg border border-dashed py-12 text-center">
               <BookMarked className="h-12 w-12 text-muted-foreground/50" />
               <div>
@@ -81,26 +87,14 @@ export function BooksPage() {
             </div>
           ) : (
             <div className="grid grid-cols-1 gap-4 sm:grid-cols-2 md:grid-cols-3 lg:grid-cols-4">
-              {sortedBooks.map((book) => {
-                const coverSrc = book.cover_image_base64
-                  ? `data:image/jpeg;base64,${book.cover_image_base64}`
-                  : null;
-
+              {books.map((book) => {
                 return (
                   <BookDetailsDialog key={book.id} book={book} onDelete={refresh}>
                     <div
                       className="flex flex-col overflow-hidden rounded-lg border bg-card text-card-foreground shadow-sm h-full text-left"
                     >
                       <div className="flex h-96 w-full items-center justify-center bg-muted overflow-hidden">
-                        {coverSrc ? (
-                          <img
-                            src={coverSrc}
-                            alt={book.title || "Book cover"}
-                            className="h-full w-auto object-contain"
-                          />
-                        ) : (
-                          <BookMarked className="h-10 w-10 text-muted-foreground/60" />
-                        )}
+                        <BookCover book={book} />
                       </div>
                       <div className="flex flex-1 flex-col gap-2 p-3">
                         <div className="space-y-1">
@@ -126,6 +120,15 @@ export function BooksPage() {
               })}
             </div>
           )}
+
+          {hasMore && (
+            <div className="flex justify-center">
+              <Button variant="outline" onClick={loadMore} disabled={loading}>
+                {loading && <Loader2 className="h-4 w-4 animate-spin" />}
+                Load more
+              </Button>
+            </div>
+          )}
         </div>
       </div>
     </AppLayout>
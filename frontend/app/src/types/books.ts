@@ -5,7 +5,7 @@ export interface Book {
   description?: string | null;
   created_at?: string;
   updated_at?: string;
-  cover_image_base64?: string;
+  cover_hash?: string | null;
 }
 
 